@@ -8,19 +8,33 @@ import numpy as np
 import os
 import re
 
-import nxsdk.api.n2a as nx
-from nxsdk.graph.monitor.probes import *
-from nxsdk.graph.processes.phase_enums import Phase
+import graph
+try:
+    import nxsdk.api.n2a as nx
+    from nxsdk.graph.monitor.probes import *
+    from nxsdk.graph.processes.phase_enums import Phase
+except ImportError:
+    #without nxsdk, agents can still be built as the backend-agnostic graph IR
+    import graph as nx
+    from graph import Phase
 from primitives import connect_one_to_one, dense_along_axis, connect_full, OrNode
 
+#header of the setup record sent to the management SNIPs (see FullAgent.get_config and setup() in each management.c)
+CONFIG_MAGIC = 0x524c4346
+CONFIG_VERSION = 1
+CONFIG_FIELDS = ('magic', 'version', 'size', 'l_epoch', 'seed', 'n_epochs', 'n_actions', 'n_states', 'n_memories', 'n_params')
+#location of a stub axon or compartment on the board, and the kinds of location the SNIPs address, in table order
+LOCATION_DTYPE = np.dtype([('board', np.int32), ('chip', np.int32), ('core', np.int32), ('index', np.int32)])
+LOCATION_KINDS = ('reward', 'punishment', 'draw', 'action', 'state', 'value', 'estimate')
+
 """
 Abstract class which defines the necessary parameters for the agent framework.
 """
 class Agent(ABC):
-    def __init__(self, n_actions, n_states):
+    def __init__(self, n_actions, n_states, network=None):
         super().__init__()
-        #initialize network
-        self.network = nx.NxNet()
+        #initialize network (pass a graph.GraphNet to build the agent as an IR without nxsdk)
+        self.network = nx.NxNet() if network is None else network
         self.started = False
 
         #get problem parameters
@@ -41,7 +55,7 @@ Used to construct an agent which is being tested/used on CPU before being ported
 """
 class ManualAgent(Agent):
     def __init__(self, n_actions, n_states, **kwargs):
-        super().__init__(n_actions, n_states)
+        super().__init__(n_actions, n_states, kwargs.get("network", None))
 
         #get estimation parameters
         self.l_epoch = kwargs.get("l_epoch", 128)
@@ -102,7 +116,7 @@ Agent class which extends the framework and defines additional functions/variabl
 """
 class FullAgent(Agent):
     def __init__(self, n_actions, n_states, **kwargs):
-        super().__init__(n_actions, n_states)
+        super().__init__(n_actions, n_states, kwargs.get("network", None))
 
         #get estimation parameters
         #the number of periods which the agent will use to estimate value and decide what action to take
@@ -123,6 +137,14 @@ class FullAgent(Agent):
 
         self.recordWeights = kwargs.get('recordWeights', False)
         self.recordSpikes = kwargs.get('recordSpikes', False)
+        #plan the logical cores of all blocks before compiling (only for agents built as a graph IR)
+        self.autoPlace = kwargs.get('autoPlace', False)
+        #run on the CPU simulator with emulated SNIPs and channels instead of a board (only for agents built as a graph IR)
+        self.emulate = kwargs.get('emulate', False)
+        #number of epochs run and read back at a time (see run_stream), which sets the size of the readback channels
+        self.chunk_epochs = kwargs.get('chunk_epochs', None)
+        #read back each chunk while the board runs the next one asynchronously (see run_stream)
+        self.async_readback = kwargs.get('async_readback', False)
 
         self.connections = {}
         self.stubs = {}
@@ -213,12 +235,29 @@ class FullAgent(Agent):
         self.connections['draw_stub_HC'] = connect_full(self.stubs['draw'], hc_reset, self.feedback_proto)
 
     """
-    Compile the network to a board. Called once before starting.
+    Compile the network to a board. Called once before starting. Agents built as a graph IR are first materialized
+    onto an nxsdk network, or with emulate=True compiled onto the CPU simulator (see emulation.py). The locations the
+    SNIPs address are then looked up once and cached (see _build_locations).
     """
     def _compile(self):
-        self.compiler = nx.N2Compiler()
-        self.board = self.compiler.compile(self.network)
-        self.board.sync = True
+        if self.emulate:
+            import emulation
+            emulation.compile(self)
+        else:
+            if isinstance(self.network, graph.GraphNet):
+                if self.autoPlace:
+                    import placement
+                    self.placement = placement.plan_placement(self)
+                    placement.apply_placement(self, self.placement)
+
+                self.graph = self.network
+                self.network = self.graph.materialize()
+
+            self.compiler = nx.N2Compiler()
+            self.board = self.compiler.compile(self.network)
+            self.board.sync = True
+
+        self._build_locations()
 
     """
     Create the channels between board and host required for communicating and tracking results.
@@ -237,12 +276,58 @@ class FullAgent(Agent):
         pass
 
     """
-    Define what information to send to the board at startup. Usually this is at very least parameters like l_epoch and n_epochs.
-    This is implemented via the child class (e.g. blackjack) as requirements are different for each application.
+    Task-specific parameters sent to the SNIP after the header of the setup record (e.g. the bandit's probabilities).
+    Overridden by the child class where the task needs them.
+    """
+    def _config_params(self):
+        return np.zeros(0, dtype=np.int32)
+
+    """
+    Starting voltages of the estimate compartments, in the order of get_estimate_locations.
+    """
+    def get_start_values(self):
+        return self.start_values.ravel(order='c')
+
+    """
+    Number of int32 values in the setup record. Used to size the setup channel so the record fits in it whole.
+    """
+    def get_config_size(self):
+        return (len(CONFIG_FIELDS) + len(self._config_params())
+                + 4 * (3 + 2 * self.n_actions + self.n_states) + 5 * self.n_memories)
+
+    """
+    Pack everything the management SNIP reads at setup into one contiguous int32 buffer. The record starts with a
+    versioned header (CONFIG_FIELDS) so the SNIP can check it matches the sizes it was compiled with, followed by the
+    task parameters, the locations of the reward/punishment/draw, action and state stubs, of the counters and of the
+    estimates (4 values each), and the starting values of the estimates.
+    """
+    def get_config(self):
+        params = np.asarray(self._config_params(), dtype=np.int32).ravel()
+        start_values = np.asarray(self.get_start_values()).ravel()
+        assert len(start_values) == self.n_memories, "Need one starting value for each of the " + str(self.n_memories) + " estimates."
+
+        size = self.get_config_size()
+        header = [CONFIG_MAGIC, CONFIG_VERSION, size, self.l_epoch, self.seed, self.n_epochs,
+                    self.n_actions, self.n_states, self.n_memories, len(params)]
+        #the location table is stored in the order of the record
+        blocks = [header, params, self.locations.view(np.int32), start_values]
+
+        config = np.concatenate([np.asarray(block, dtype=np.int64).ravel() for block in blocks])
+        assert len(config) == size, "Setup record has " + str(len(config)) + " values, expected " + str(size)
+        assert np.all(np.abs(config) < 2**31), "Setup record values must fit in int32."
+        return config.astype(np.int32)
+
+    """
+    Send the setup record to the board, in as few writes as the setup channel (the first out channel) can hold.
     """
-    @abstractmethod
     def _send_config(self):
-        pass
+        config = self.get_config()
+        setupChannel = self.outChannels[0]
+        capacity = getattr(setupChannel, 'numElements', len(config))
+
+        for start in range(0, len(config), capacity):
+            chunk = config[start:start + capacity]
+            setupChannel.write(len(chunk), chunk)
 
     """
     Reserve and start hardware.
@@ -251,85 +336,182 @@ class FullAgent(Agent):
         assert hasattr(self, 'board') and hasattr(self, 'snip'), "Must have compiled board and snips before starting."
         self.board.startDriver()
 
+    """
+    From the compiled board, find the location of the input axon of each synapse of a connection to a stub.
+    """
+    def _find_axon_locations(self, connection, n):
+        axonIds = [connection[x].inputAxon.nodeId for x in range(n)]
+        return [self.network.resourceMap.inputAxon(axonId)[0] for axonId in axonIds]
+
+    """
+    From the compiled board, find the location of each compartment of a group.
+    """
+    def _find_compartment_locations(self, compartments, n):
+        compartmentMap = self.network.resourceMap.compartmentMap
+        return [compartmentMap[compartments[i].nodeId] for i in range(n)]
+
+    """
+    Look up every stub axon and compartment the SNIPs address once the network is compiled, and cache them in a single
+    structured array (self.locations, with the block of each kind in self.location_slices). The blocks are in the
+    order of LOCATION_KINDS, which is also their order in the setup record, so later lookups are array slices.
+    """
+    def _build_locations(self):
+        estimates = self.cortex.blocks['estimates'].compartments['memory']
+        blocks = [self._find_axon_locations(self.connections['rwd_stub_HC'], 1),
+                    self._find_axon_locations(self.connections['pun_stub_HC'], 1),
+                    self._find_axon_locations(self.connections['draw_stub_HC'], 1),
+                    self._find_axon_locations(self.connections['action_stub_ACT'], self.n_actions),
+                    self._find_axon_locations(self.connections['state_stub_DEC'], self.n_states),
+                    self._find_compartment_locations(self.encoder.get_outputs(), self.n_actions),
+                    self._find_compartment_locations(estimates, estimates.numNodes)]
+
+        self.locations = np.zeros(sum([len(block) for block in blocks]), dtype=LOCATION_DTYPE)
+        self.location_slices = {}
+        start = 0
+        for (kind, block) in zip(LOCATION_KINDS, blocks):
+            self.location_slices[kind] = slice(start, start + len(block))
+            self.locations[start:start + len(block)] = [tuple(loc[:4]) for loc in block]
+            start += len(block)
+
+    """
+    Return the cached locations of one kind of stub or compartment (see LOCATION_KINDS) as rows of
+    (board, chip, core, compartment/axon).
+    """
+    def get_locations(self, kind):
+        assert hasattr(self, 'locations'), "Must compile net to board before looking up locations."
+        return self.locations[self.location_slices[kind]].view(np.int32).reshape(-1, 4)
+
     """
     From the compiled board, return the location of axons which allow an external program (SNIP) to indicate to the agent
     which action was taken. 
     """
     def get_action_locations(self):
-        get_axonid = lambda x: self.connections['action_stub_ACT'][x].inputAxon.nodeId
-        get_axon = lambda x: self.network.resourceMap.inputAxon(x)[0]
-
-        axonIds = [get_axonid(x) for x in range(self.n_actions)]
-        axons = list(map(get_axon, axonIds))
-
-        return axons 
+        return self.get_locations('action')
 
     """
     From the compiled board, return the location of all compartments which represent values. For a tabular solution,
     this is a large list of compartments. 
     """
     def get_estimate_locations(self):
-        locs = []
-
-        compartments = self.cortex.blocks['estimates'].compartments['memory']
-
-        for i in range(compartments.numNodes):
-            compartmentId = compartments[i].nodeId
-            compartmentLoc = self.network.resourceMap.compartmentMap[compartmentId]
-
-            locs.append(compartmentLoc)
-
-        return locs
+        return self.get_locations('estimate')
 
     """
     From the compiled board, return the location of axons which allow an external program to indicate the current state
     the agent has entered. 
     """
     def get_state_locations(self):
-        get_axonid = lambda x: self.connections['state_stub_DEC'][x].inputAxon.nodeId
-        get_axon = lambda x: self.network.resourceMap.inputAxon(x)[0]
-
-        axonIds = [get_axonid(x) for x in range(self.n_states)]
-        axons = list(map(get_axon, axonIds))
-
-        return axons 
+        return self.get_locations('state')
 
     """
     From the compiled board, return the location of compartments which represent the rewards currently being used to make
     a decision. This is usually the number of actions available in each state. 
     """
     def get_value_locations(self):
-        locs = []
-        compartments = self.encoder.get_outputs()
-
-        for i in range(self.n_actions):
-            compartmentId = compartments[i].nodeId
-            compartmentLoc = self.network.resourceMap.compartmentMap[compartmentId]
-
-            locs.append(compartmentLoc)
-
-        return locs
+        return self.get_locations('value')
 
     """
     From the compiled board, return the location of axons which allow an external program to indicate a reward or punishment
     signal to the agent. 
     """
     def get_RP_locations(self):
-        get_axonid = lambda x: self.connections[x][0].inputAxon.nodeId
-        get_axon = lambda x: self.network.resourceMap.inputAxon(x)[0]
+        return (self.get_locations('reward')[0], self.get_locations('punishment')[0], self.get_locations('draw')[0])
+
+    """
+    Number of epochs run and read back at a time by run_stream: chunk_epochs, or the whole run.
+    """
+    def get_chunk_epochs(self):
+        if self.chunk_epochs is None:
+            return self.n_epochs
+        return min(self.chunk_epochs, self.n_epochs)
+
+    """
+    Number of epochs the readback channels hold: one chunk (see run_stream), or two with async_readback as the board
+    writes the next chunk while the last is being read, plus one epoch of slack for the state the SNIP sends ahead of
+    the next action.
+    """
+    def get_channel_epochs(self):
+        buffers = 2 if self.async_readback else 1
+        return buffers * self.get_chunk_epochs() + 1
+
+    """
+    Fields of the data channel in the record of one epoch (e.g. the state and the action taken in it), in the order the
+    SNIP writes them. This is implemented via the child class as the data sent is different for each application.
+    """
+    @abstractmethod
+    def _record_fields(self):
+        pass
 
-        reward = get_axon(get_axonid('rwd_stub_HC'))
-        punishment = get_axon(get_axonid('pun_stub_HC'))
-        draw = get_axon(get_axonid('draw_stub_HC'))
+    """
+    Dtype of the record of one epoch read back from the board: the fields of the data channel followed by the reward
+    and the counter of each action, each in the smallest type which holds it.
+    """
+    def get_record_dtype(self):
+        return np.dtype(list(self._record_fields()) + [('reward', np.int8), ('values', np.int32, (self.n_actions,))])
+
+    """
+    Read values from a channel straight into an array of any shape and integer type. The emulated board's channels
+    copy from their buffer (read_into); nxsdk channels return a list, which is converted once.
+    """
+    def read_channel(self, channel, out):
+        if hasattr(channel, 'read_into'):
+            channel.read_into(out)
+        else:
+            out[...] = np.reshape(channel.read(out.size), out.shape)
+        return out
+
+    """
+    Read the status the management SNIP writes to the data channel once it has read the setup record: 0 if it
+    accepted the record, -1 if the header did not match the sizes it was built with (parameters.h), in which case it
+    sends nothing else.
+    """
+    def read_setup_status(self):
+        status = int(self.read_channel(self.inChannels[0], np.empty(1, dtype=np.int32))[0])
+        assert status == 0, "The management SNIP rejected the setup record (status " + str(status) + "): its parameters.h does not match the agent's sizes."
+        self.setup_checked = True
+
+    """
+    Read the data, reward and spike channels (the first three in channels) for n_epochs into one structured array of
+    records (see get_record_dtype). The rewards and counters land directly in their fields; the data channel is read
+    through a reused int32 buffer and split into its fields. The first read after setup checks the SNIP's setup status.
+    """
+    def read_records(self, n_epochs, out=None):
+        records = np.empty(n_epochs, dtype=self.get_record_dtype()) if out is None else out[:n_epochs]
+        dataChannel, rewardChannel, spikeChannel = self.inChannels[:3]
+        if not self.setup_checked:
+            self.read_setup_status()
+
+        if getattr(self, '_data_buffer', None) is None or len(self._data_buffer) < n_epochs:
+            self._data_buffer = np.empty((n_epochs, self.data_points), dtype=np.int32)
+        data = self.read_channel(dataChannel, self._data_buffer[:n_epochs])
+
+        column = 0
+        for field in self._record_fields():
+            width = int(np.prod(field[2])) if len(field) > 2 else 1
+            records[field[0]] = data[:, column:column + width].reshape(records[field[0]].shape)
+            column += width
+        assert column == self.data_points, "Record fields do not cover the " + str(self.data_points) + " values sent each epoch."
+
+        self.read_channel(rewardChannel, records['reward'])
+        self.read_channel(spikeChannel, records['values'])
+        return records
 
-        return (reward, punishment, draw)
+    """
+    Split records into the (data, rewards, values) arrays returned by run: the data channel's values of each epoch as
+    columns, the rewards and the counters.
+    """
+    def split_records(self, records):
+        fields = [field[0] for field in self._record_fields()]
+        data = np.concatenate([records[name].reshape(len(records), -1) for name in fields], axis=1)
+        return (data, records['reward'], records['values'])
 
     """
-    Define what data should be expected from the board each epoch and collect it. 
+    Define what data should be expected from the board each epoch and collect it, into the records given as out if
+    any (see read_records). Data which is only sent at the end of a run (e.g. the final estimates) is read when final
+    is set.
     This is implemented via the child class (e.g. blackjack) as requirements are different for each application.
     """
     @abstractmethod
-    def get_data(self, n_epochs):
+    def get_data(self, n_epochs, final=True, out=None):
         pass        
 
     """
@@ -340,21 +522,93 @@ class FullAgent(Agent):
         self._create_SNIPs()
         self._create_channels()
         
-        self.set_params_file()
+        #emulated SNIPs take their parameters from the agent rather than a header file
+        if not self.emulate:
+            self.set_params_file()
         self._start()
         self._send_config()
+        #the SNIP reports whether it accepted the record once the board runs (see read_setup_status)
+        self.setup_checked = False
 
     """
+    Run the agent for n_epochs in chunks of chunk_epochs (by default the agent's, or the whole run), reading back and
+    yielding the records of each chunk (see get_record_dtype) as it completes. The readback channels only hold one
+    chunk, so long runs use constant memory on the board and the host as long as the chunks are not kept.
 
+    With async_readback, each chunk is read back while the board runs the next one asynchronously (see
+    _read_async). The records then alternate between two preallocated buffers, so a chunk is only valid until the
+    next one is requested and must be copied to be kept. Each chunk is yielded while the next one runs, and that run is
+    only waited for once the consumer asks for the next chunk: a consumer slower than the board delays the next
+    board.run, leaving the board idle for the difference.
     """
-    def run(self):
+    def run_stream(self, chunk_epochs=None):
         #only reserve hardware once we actually need to run the network
         if not self.started:
             self.init()
             self.started = True
 
-        self.board.run(self.l_epoch * self.n_epochs)
-        self.get_data(self.n_epochs)
+        if chunk_epochs is None:
+            chunk_epochs = self.get_chunk_epochs()
+        buffers = 2 if self.async_readback else 1
+        assert 0 < chunk_epochs * buffers < self.get_channel_epochs(), "Readback channels hold at most " + str(self.get_chunk_epochs()) + " epochs per chunk; set chunk_epochs when creating the agent."
+
+        chunks = []
+        done = 0
+        while done < self.n_epochs:
+            n_epochs = min(chunk_epochs, self.n_epochs - done)
+            done += n_epochs
+            chunks.append((n_epochs, done == self.n_epochs))
+
+        if self.async_readback:
+            yield from self._read_async(chunks, chunk_epochs)
+            return
+
+        for (n_epochs, final) in chunks:
+            self.board.run(self.l_epoch * n_epochs)
+            self.get_data(n_epochs, final=final)
+
+            yield self.records
+
+    """
+    Double-buffered readback for run_stream: each chunk is started as an asynchronous run (board.run with aSync=True,
+    as nxsdk boards and the emulated board support), and while it runs the host reads the previous chunk's channels
+    into one of two preallocated record buffers, so the host's reads and conversion are hidden behind the board's time.
+    All reads happen on the calling thread, between starting a run and waiting for it with finishRun, so at most two
+    chunks are in flight, which is what the readback channels hold.
+    """
+    def _read_async(self, chunks, chunk_epochs):
+        assert hasattr(self.board, 'finishRun'), "async_readback needs a board which supports asynchronous runs (run(..., aSync=True) and finishRun)."
+        buffers = [np.empty(chunk_epochs, dtype=self.get_record_dtype()) for i in range(2)]
+
+        def read(n_epochs, final, out):
+            self.get_data(n_epochs, final=final, out=out)
+            return out[:n_epochs]
+
+        running = False
+        try:
+            pending = None
+            for (i, (n_epochs, final)) in enumerate(chunks):
+                self.board.run(self.l_epoch * n_epochs, aSync=True)
+                running = True
+                #read the previous chunk while this one runs
+                if pending is not None:
+                    yield read(*pending)
+                self.board.finishRun()
+                running = False
+                pending = (n_epochs, final, buffers[i % 2])
+
+            yield read(*pending)
+        finally:
+            if running:
+                self.board.finishRun()
+
+    """
+    Run the agent for n_epochs and return the (data, rewards, values) of the whole run (see split_records); the
+    records themselves are kept in self.records.
+    """
+    def run(self):
+        self.records = np.concatenate([records.copy() for records in self.run_stream()])
+        self.data, self.rewards, self.values = self.split_records(self.records)
 
         #return (self.data, self.rewards)
         return (self.data, self.rewards, self.values)
@@ -57,84 +57,54 @@ class Bandit(FullAgent):
                 self.inChannels.append(channel)
                 channel.connect(self.snip, None)
 
-        #need to send: 
-        # keep the setupchannel for later use
-        n_outData = (10 + 9 * self.n_actions + 4 * self.n_states + 5 * self.n_memories)
+        #the setup channel holds the whole setup record, so it is sent in one write (see FullAgent.get_config)
+        n_outData = self.get_config_size()
         setupChannel = self.board.createChannel(b'setupChannel', "int", n_outData)
         connect(True, setupChannel)
 
         #create the data channels to return location & action at each epoch
-        dataChannel = self.board.createChannel(b'dataChannel', "int", self.data_points * self.n_epochs)
+        n_epochs = self.get_channel_epochs()
+        dataChannel = self.board.createChannel(b'dataChannel', "int", self.data_points * n_epochs)
         connect(False, dataChannel)
 
         #return reward at each step
-        rewardChannel = self.board.createChannel(b'rewardChannel', "int", self.n_epochs)
+        rewardChannel = self.board.createChannel(b'rewardChannel', "int", n_epochs)
         connect(False, rewardChannel)
 
         #return the action values at each location
-        spikeChannel = self.board.createChannel(b'spikeChannel', "int", self.n_epochs * self.n_actions)
+        spikeChannel = self.board.createChannel(b'spikeChannel', "int", n_epochs * self.n_actions)
         connect(False, spikeChannel)
 
-    def get_data(self, n_epochs):
-        dataChannel = self.inChannels[0]
-        rewardChannel = self.inChannels[1]
-        spikeChannel = self.inChannels[2]
-
-        #get the state/action data
-        self.data = np.array(dataChannel.read(n_epochs*self.data_points)).reshape(n_epochs, self.data_points)
-        #get the rewards data
-        self.rewards = np.array(rewardChannel.read(n_epochs))
+    """
+    Each epoch the SNIP sends the action it chose.
+    """
+    def _record_fields(self):
+        return [('action', np.int8)]
+
+    def get_data(self, n_epochs, final=True, out=None):
+        #get the action, reward and action value data of each epoch
+        self.records = self.read_records(n_epochs, out)
+        self.data, self.rewards, self.values = self.split_records(self.records)
+
+    """
+    The counters are returned in units of the value of an arm.
+    """
+    def split_records(self, records):
+        data, rewards, values = super().split_records(records)
         singlewgt = self.action_buffer.prototypes['s_prototypes']['single'].weight
-        #get the action value data
-        self.values = np.array(spikeChannel.read(n_epochs*self.n_actions), dtype='int').reshape(n_epochs, self.n_actions)/(singlewgt*2**6)
-
-
-    def _send_config(self):
-        #get the locations of axons where we need to send updates to/from the SNIP
-        stateLocations = self.get_state_locations()
-        actionLocations = self.get_action_locations()
-        valueLocations = self.get_value_locations()
-        RPLocations = self.get_RP_locations()
-
-        #get the setup channel
-        setupChannel = self.outChannels[0]
-        #send the epoch length
-        setupChannel.write(1, [self.l_epoch])
-
-        #send the random seed
-        setupChannel.write(1, [self.seed])
-
-        #send the probability distributions
-        for i in range(self.n_actions):
-            setupChannel.write(1, [self.probabilities[i]])
-
-        #send the reward stub
-        setupChannel.write(4, RPLocations[0])
-        #send the punishment stub
-        setupChannel.write(4, RPLocations[1])
-        #send the draw stub
-        setupChannel.write(4, RPLocations[2])
-
-        #send the action stubs
-        for i in range(self.n_actions):
-            setupChannel.write(4, actionLocations[i][:4])
-
-        #send the state stubs
-        for i in range(self.n_states):
-            setupChannel.write(4, stateLocations[i][:4])
-
-        #send the value locations
-        for i in range(self.n_actions):
-            setupChannel.write(4, valueLocations[i][:4])
-
-        estimateLocations = self.get_estimate_locations()
-        #send the estimate locations
-        for i in range(self.n_memories):
-            setupChannel.write(4, estimateLocations[i][:4])
-        
-        #send the initial values that will be used to form the policy
-        for i in range(self.n_replicates):
-            setupChannel.write(self.n_estimates, self.start_values.ravel(order='c'))
+        return (data, rewards, values/(singlewgt*2**6))
+
+    """
+    Send the probability (in percent) of each arm paying out.
+    """
+    def _config_params(self):
+        return np.asarray(self.probabilities, dtype=np.int32)
+
+    """
+    Every replicate of an arm's estimate starts from the same value.
+    """
+    def get_start_values(self):
+        return np.tile(self.start_values.ravel(order='c'), self.n_replicates)
 
     def set_params_file(self):
         filename = os.getcwd()+'/parameters.h'
@@ -155,6 +125,11 @@ class Bandit(FullAgent):
             if m is not None:
                 line = '#define EPSILON ' + str(self.epsilon) + '\n'
 
+            #update n_replicates
+            m = re.match(r'^#define\s+N_REPLICATES', line)
+            if m is not None:
+                line = '#define N_REPLICATES ' + str(int(self.n_replicates)) + '\n'
+
             f.write(line)
 
         f.close()
\ No newline at end of file
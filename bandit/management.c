@@ -19,7 +19,7 @@ int drawCompartment[4];
 int actionCompartments[N_ACTIONS][4];
 int stateCompartments[N_STATES][4];
 int qCompartment[N_ACTIONS][4];
-int eCompartment[N_ESTIMATES][4];
+int eCompartment[N_MEMORIES][4];
 int counterVoltages[4];
 
 //state variables
@@ -28,6 +28,8 @@ int action;
 
 //run variables
 int voting_epoch = 128;
+//set when the setup record was rejected, after which the SNIP stays idle
+int setup_failed = 0;
 int cseed = 12340;
 
 //--- LOIHI FUNCTIONS ---
@@ -36,6 +38,10 @@ int check(runState *s) {
     setup(s);
   }
 
+  if (setup_failed) {
+    return 0;
+  }
+
   if (s->time_step % voting_epoch == 0) {
     return 1;
   } else {
@@ -143,11 +149,38 @@ void run_cycle(runState *s) {
   return;
 }
 
-void setup(runState *s) {
+//check the header of the setup record against the sizes this SNIP was compiled with
+int check_header(int *header, int n_params, int n_memories) {
+  return header[CFG_MAGIC] == CONFIG_MAGIC
+    && header[CFG_VERSION] == CONFIG_VERSION
+    && header[CFG_N_ACTIONS] == N_ACTIONS
+    && header[CFG_N_STATES] == N_STATES
+    && header[CFG_N_MEMORIES] == n_memories
+    && header[CFG_N_PARAMS] == n_params;
+}
+
+//read the starting voltages of the estimate compartments in chunks and store them
+void read_voltages(int compartments[][4], int n) {
   CoreId core;
-  int cxId = 0;
   NeuronCore *nc;
-  int voltage = 0;
+  int voltages[VALUE_CHUNK];
+  int m = 0;
+
+  for (int i = 0; i < n; i += VALUE_CHUNK) {
+    m = (n - i < VALUE_CHUNK) ? n - i : VALUE_CHUNK;
+    readChannel(readChannelID, voltages, m);
+
+    for (int j = 0; j < m; j++) {
+      //get the core the compartment is on and set its voltage
+      core = nx_nth_coreid(compartments[i + j][2]);
+      nc = NEURON_PTR(core);
+      nc->cx_state[compartments[i + j][3]].V = voltages[j];
+    }
+  }
+}
+
+void setup(runState *s) {
+  int header[CONFIG_HEADER];
 
   //check things are defined
   if (N_ACTIONS == 0 || N_STATES == 0) {
@@ -164,13 +197,26 @@ void setup(runState *s) {
   spikeChannelID = getChannelID("spikeChannel");
   estimateChannelID = getChannelID("estimateChannel");
 
-  //read out the length of the voting epoch
-  readChannel(readChannelID, &voting_epoch, 1);
+  //read the header of the setup record and check it was written for this build of the SNIP
+  readChannel(readChannelID, header, CONFIG_HEADER);
+  if (!check_header(header, N_ACTIONS, N_MEMORIES)) {
+    int error = -1;
+    printf("Setup record does not match parameters.h\n");
+    writeChannel(writeChannelID, &error, 1);
+    setup_failed = 1;
+    return;
+  }
+
+  //report the accepted record to the host ahead of any data (see FullAgent.read_setup_status)
+  int status = 0;
+  writeChannel(writeChannelID, &status, 1);
 
-  //read the random seed
-  readChannel(readChannelID, &cseed, 1);
+  //the length of the voting epoch, the random seed and the number of epochs
+  voting_epoch = header[CFG_L_EPOCH];
+  cseed = header[CFG_SEED];
   srand(cseed);
 
+  //read the probability of each arm paying out
   readChannel(readChannelID, &probabilities, N_ACTIONS);
 
   printf("Got variables\n");
@@ -179,42 +225,18 @@ void setup(runState *s) {
   readChannel(readChannelID, &punishCompartment[0], 4);
   readChannel(readChannelID, &drawCompartment[0], 4);
 
-  //read the location of the action stubs
-  for (int i = 0; i < N_ACTIONS; i++) {
-    readChannel(readChannelID, &actionCompartments[i][0], 4);
-  }
-
-  //read the location of the state stubs
-  for (int i = 0; i < N_STATES; i++) {
-    readChannel(readChannelID, &stateCompartments[i][0], 4);
-    //printf("DEBUG: %d %d %d %d\n", stateCompartments[i][0], stateCompartments[i][1], stateCompartments[i][2], stateCompartments[i][3]);
-    //printf("DEBUG Coreid: %d\n", nx_nth_coreid(stateCompartments[i][2]).id);
-  }
+  //read the locations of the action and state stubs, each table in one read
+  readChannel(readChannelID, &actionCompartments[0][0], 4 * N_ACTIONS);
+  readChannel(readChannelID, &stateCompartments[0][0], 4 * N_STATES);
   printf("Got R/P/State/Condition compartments\n");
-  
 
   //read the location of the encoder's counter neurons
-  for (int i = 0; i < N_ACTIONS; i++) {
-    readChannel(readChannelID, &qCompartment[i][0], 4);
-  }
+  readChannel(readChannelID, &qCompartment[0][0], 4 * N_ACTIONS);
   printf("Got Counter compartments\n");
 
-  //read the location of the estimate compartments
-  for (int i = 0; i < N_ESTIMATES; i++) {
-    readChannel(readChannelID, &eCompartment[i][0], 4);
-  }
-
-  //then read the initial values into the voltage of those registers
-  for (int i = 0; i < N_ESTIMATES; i++) {
-    //get the core the counter is on
-    core = nx_nth_coreid(eCompartment[i][2]);
-    nc = NEURON_PTR(core);
-    //get the compartment the voltage is in
-    cxId = eCompartment[i][3];
-    //set it to the incoming value
-    readChannel(readChannelID, &voltage, 1);
-    nc->cx_state[cxId].V = voltage;
-  }
+  //read the location of the estimate compartments, then the initial values into their voltages
+  readChannel(readChannelID, &eCompartment[0][0], 4 * N_MEMORIES);
+  read_voltages(eCompartment, N_MEMORIES);
 
   printf("Got estimate locs & values, done.\n");
     
@@ -10,5 +10,13 @@ int send_action(runState *s);
 void send_reward(runState *s, int action);
 void send_state(runState *s);
 
+//Setup record sent by the host (see FullAgent.get_config in agent.py)
+#define CONFIG_MAGIC 0x524c4346
+#define CONFIG_VERSION 1
+#define VALUE_CHUNK 64
+enum configFields {CFG_MAGIC, CFG_VERSION, CFG_SIZE, CFG_L_EPOCH, CFG_SEED, CFG_N_EPOCHS, CFG_N_ACTIONS, CFG_N_STATES, CFG_N_MEMORIES, CFG_N_PARAMS, CONFIG_HEADER};
+int check_header(int *header, int n_params, int n_memories);
+void read_voltages(int compartments[][4], int n);
+
 //Game functions
 int advance_state(int action);
\ No newline at end of file
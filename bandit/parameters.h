@@ -1,6 +1,8 @@
 #define N_STATES 1
 #define N_ACTIONS 5
+#define N_REPLICATES 1
 #define N_ESTIMATES (N_ACTIONS*N_STATES)
+#define N_MEMORIES (N_ESTIMATES*N_REPLICATES)
 #define N_POINTS 4
 #define EPSILON 10
 #define DEBUG 0
\ No newline at end of file
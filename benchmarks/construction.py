@@ -0,0 +1,332 @@
+"""
+Benchmarks for building agents' spiking networks without a board.
+
+Every agent is built on the in-process nxsdk stub (see nxstub.py), or optionally on the graph IR, so the timings only
+cover the Python side of network construction: the ProcessNode classes, prototypes, and the connectors' masks. Each
+configuration is timed as a whole, per block (ProcessNode class, inclusive and exclusive of the blocks it creates) and
+per connector, and is then rebuilt once under tracemalloc to profile its memory. Results are written as JSON so runs
+can be compared against a baseline to catch regressions in primitives or the node classes.
+
+Usage (from the repository root or this directory):
+    python benchmarks/construction.py --output results.json
+    python benchmarks/construction.py --n_states 10 100 --n_replicates 1 4 --baseline old.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from functools import wraps
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+for path in [ROOT, os.path.join(ROOT, "bandit"), os.path.join(ROOT, "blackjack"), os.path.join(ROOT, "maze")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+#the stub has to replace nxsdk before any of the repository's modules are imported
+import nxstub
+nxstub.install()
+
+import numpy as np
+import graph
+import prototypes
+import primitives
+import decoder
+import encoder
+import hippocampus
+import cortex
+import agent
+from resources import EstimateAgent
+from banditAgent import Bandit
+from blackjackAgent import BlackjackAgent
+from gridAgent import GridAgent
+
+CONNECTORS = ['connect_one_to_one', 'dense_along_axis', 'project_along_axis', 'expand_along_axis', 'connect_full']
+PHASES = ['_create_blocks', '_connect_blocks']
+#modules which hold their own references to the connectors (through from primitives import ...)
+MODULES = [primitives, decoder, encoder, hippocampus, cortex, agent]
+
+"""
+Return every ProcessNode class defined by the repository.
+"""
+def get_node_classes():
+    classes = []
+    stack = list(primitives.ProcessNode.__subclasses__())
+    while stack:
+        cls = stack.pop()
+        classes.append(cls)
+        stack.extend(cls.__subclasses__())
+    return classes
+
+"""
+Records the time (and, under tracemalloc, the memory) spent in each block, connector and agent construction phase.
+While active, the node classes' constructors, the connectors and the agent phases are wrapped with timers; the
+originals are restored on exit.
+"""
+class Profiler:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.blocks = {}
+        self.connectors = {}
+        self.phases = {}
+        self.stack = []
+        self.patches = []
+
+    def _measure(self):
+        if self.memory:
+            return tracemalloc.get_traced_memory()[0]
+        return time.perf_counter()
+
+    def _enter(self, obj):
+        self.stack.append([obj, self._measure(), 0.0])
+
+    #Close the current frame and return its inclusive and exclusive cost
+    def _exit(self):
+        obj, start, children = self.stack.pop()
+        inclusive = self._measure() - start
+        if self.stack:
+            self.stack[-1][2] += inclusive
+        return inclusive, inclusive - children
+
+    def _wrap_node(self, cls):
+        original = cls.__dict__['__init__']
+        profiler = self
+
+        @wraps(original)
+        def __init__(node, *args, **kwargs):
+            #a constructor chaining to another wrapped constructor is part of the same block
+            if profiler.stack and profiler.stack[-1][0] is node:
+                return original(node, *args, **kwargs)
+
+            profiler._enter(node)
+            try:
+                original(node, *args, **kwargs)
+            finally:
+                inclusive, exclusive = profiler._exit()
+                entry = profiler.blocks.setdefault(type(node).__name__, {'calls': 0, 'inclusive': 0.0, 'exclusive': 0.0})
+                entry['calls'] += 1
+                entry['inclusive'] += inclusive
+                entry['exclusive'] += exclusive
+
+        self.patches.append((cls, '__init__', original))
+        cls.__init__ = __init__
+
+    def _wrap_connector(self, name, original):
+        profiler = self
+
+        @wraps(original)
+        def connector(*args, **kwargs):
+            profiler._enter(connector)
+            try:
+                connection = original(*args, **kwargs)
+            finally:
+                inclusive, exclusive = profiler._exit()
+            entry = profiler.connectors.setdefault(name, {'calls': 0, 'cost': 0.0, 'synapses': 0})
+            entry['calls'] += 1
+            entry['cost'] += inclusive
+            entry['synapses'] += int(connection.numSynapses)
+            return connection
+
+        return connector
+
+    def _wrap_phase(self, name):
+        original = agent.FullAgent.__dict__[name]
+        profiler = self
+
+        @wraps(original)
+        def phase(obj, *args, **kwargs):
+            profiler._enter(obj)
+            try:
+                return original(obj, *args, **kwargs)
+            finally:
+                inclusive, exclusive = profiler._exit()
+                profiler.phases[name.strip('_')] = profiler.phases.get(name.strip('_'), 0.0) + inclusive
+
+        self.patches.append((agent.FullAgent, name, original))
+        setattr(agent.FullAgent, name, phase)
+
+    def __enter__(self):
+        for cls in get_node_classes():
+            if '__init__' in cls.__dict__:
+                self._wrap_node(cls)
+
+        for name in CONNECTORS:
+            original = getattr(primitives, name)
+            wrapped = self._wrap_connector(name, original)
+            for module in MODULES:
+                if getattr(module, name, None) is original:
+                    self.patches.append((module, name, original))
+                    setattr(module, name, wrapped)
+
+        for name in PHASES:
+            self._wrap_phase(name)
+
+        return self
+
+    def __exit__(self, *exc):
+        for (obj, name, original) in reversed(self.patches):
+            setattr(obj, name, original)
+        self.patches = []
+        return False
+
+"""
+Return the constructor for each benchmarked agent, taking the grid parameters. The task agents fix the number of
+states and actions they were designed for; only the bandit takes its number of arms from n_actions.
+"""
+def get_builders():
+    return {'full': lambda p, **kw: EstimateAgent(p['n_actions'], p['n_states'], **kw),
+            'blackjack': lambda p, **kw: BlackjackAgent(2, 200, **kw),
+            'grid': lambda p, **kw: GridAgent(**kw),
+            'bandit': lambda p, **kw: Bandit(np.linspace(0.1, 0.9, p['n_actions']), **kw)}
+
+"""
+Return the grid parameters which change the network built for an agent.
+"""
+def get_grid_keys(name):
+    if name == 'full':
+        return ['n_states', 'n_actions', 'n_replicates', 'dynrange']
+    elif name == 'bandit':
+        return ['n_actions', 'n_replicates', 'dynrange']
+    return ['n_replicates', 'dynrange']
+
+#Reset the module-level caches so the first build of a configuration is a cold start
+def clear_caches():
+    primitives.clear_mask_cache()
+    prototypes.clear_prototype_cache()
+
+def build(builder, params, backend):
+    kwargs = {'n_replicates': params['n_replicates'], 'dynrange': params['dynrange']}
+    if backend == 'graph':
+        kwargs['network'] = graph.GraphNet()
+    return builder(params, **kwargs)
+
+"""
+Benchmark the construction of a single agent configuration. The first build after clearing the caches is reported as
+the cold time, the remaining repeats as the warm times; block and connector costs are averaged over all builds.
+"""
+def benchmark(builder, params, backend='stub', repeats=5):
+    clear_caches()
+    times = []
+    with Profiler() as profiler:
+        for i in range(repeats):
+            start = time.perf_counter()
+            net_agent = build(builder, params, backend)
+            times.append(time.perf_counter() - start)
+
+    network = net_agent.network
+    result = {'compartments': int(network.numCompartments),
+                'synapses': int(network.numSynapses),
+                'time': {'cold': times[0],
+                        'best': min(times),
+                        'median': float(np.median(times[1:] if repeats > 1 else times))},
+                'phases': {k: v / repeats for (k, v) in profiler.phases.items()},
+                'blocks': {k: dict(v, inclusive=v['inclusive'] / repeats, exclusive=v['exclusive'] / repeats, calls=v['calls'] // repeats)
+                            for (k, v) in profiler.blocks.items()},
+                'connectors': {k: {'calls': v['calls'] // repeats, 'time': v['cost'] / repeats, 'synapses': v['synapses'] // repeats}
+                                for (k, v) in profiler.connectors.items()}}
+    del net_agent, network
+
+    #profile the memory of a cold build separately, as tracemalloc slows down construction
+    clear_caches()
+    tracemalloc.start()
+    with Profiler(memory=True) as profiler:
+        net_agent = build(builder, params, backend)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result['memory'] = {'peak': peak,
+                        'retained': retained,
+                        'blocks': {k: int(v['inclusive']) for (k, v) in profiler.blocks.items()},
+                        'connectors': {k: int(v['cost']) for (k, v) in profiler.connectors.items()}}
+    return result
+
+"""
+Benchmark every agent over the grid of parameters which change its network. Returns the results as a JSON-serializable
+dictionary.
+"""
+def run(agents, grid, backend='stub', repeats=5, verbose=True):
+    builders = get_builders()
+    results = []
+
+    for name in agents:
+        keys = get_grid_keys(name)
+        fixed = {k: v[0] for (k, v) in grid.items() if k not in keys}
+        for values in itertools.product(*[grid[k] for k in keys]):
+            params = dict(fixed, **dict(zip(keys, values)))
+            result = benchmark(builders[name], params, backend, repeats)
+            result['agent'] = name
+            result['params'] = {k: params[k] for k in keys}
+            results.append(result)
+
+            if verbose:
+                print("{:<10}{:<60}{:>10.2f} ms{:>10.1f} MB{:>10} cx{:>10} syn".format(
+                    name, str(result['params']), 1e3 * result['time']['median'], result['memory']['peak'] / 2**20,
+                    result['compartments'], result['synapses']))
+
+    meta = {'backend': backend,
+            'repeats': repeats,
+            'grid': grid,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    return {'meta': meta, 'results': results}
+
+#Identify a result by its agent and parameters
+def result_key(result):
+    return (result['agent'],) + tuple(sorted(result['params'].items()))
+
+"""
+Compare results against a baseline run. Returns (key, baseline time, new time, ratio) for every configuration in both
+runs whose median construction time grew by more than the tolerance (e.g. 0.25 for 25%).
+"""
+def compare(results, baseline, tolerance=0.25):
+    old = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        key = result_key(result)
+        if key not in old:
+            continue
+        before = old[key]['time']['median']
+        after = result['time']['median']
+        if before > 0 and after / before > 1.0 + tolerance:
+            regressions.append((key, before, after, after / before))
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the construction of agents' spiking networks.")
+    parser.add_argument("--agents", nargs="+", default=['full', 'blackjack', 'grid', 'bandit'], choices=sorted(get_builders()))
+    parser.add_argument("--n_states", nargs="+", type=int, default=[10, 100, 200])
+    parser.add_argument("--n_actions", nargs="+", type=int, default=[2, 4])
+    parser.add_argument("--n_replicates", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--dynrange", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--backend", default='stub', choices=['stub', 'graph'])
+    parser.add_argument("--output", default="construction.json")
+    parser.add_argument("--baseline", default=None, help="Previous results to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    grid = {'n_states': args.n_states, 'n_actions': args.n_actions, 'n_replicates': args.n_replicates, 'dynrange': args.dynrange}
+    results = run(args.agents, grid, args.backend, args.repeats)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for (key, before, after, ratio) in regressions:
+            print("Regression in {}: {:.2f} ms -> {:.2f} ms ({:.2f}x)".format(key, 1e3 * before, 1e3 * after, ratio))
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
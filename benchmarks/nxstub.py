@@ -0,0 +1,91 @@
+"""
+In-process stand-in for nxsdk.api.n2a used by the benchmarks. Groups and connect calls only record their sizes (and
+the synapse count of the mask they were given), so building an agent on it measures the cost of the Python graph
+construction itself: node classes, prototypes and the connectors' mask generation up to the backend boundary.
+
+install() must be called before importing any of the repo's modules, so that they pick up the stub instead of nxsdk.
+"""
+import sys
+import types
+import numpy as np
+from scipy import sparse
+
+import graph
+from graph import CompartmentPrototype, NeuronPrototype, ConnectionPrototype, COMPARTMENT_JOIN_OPERATION, Phase
+
+class StubConnectionGroup:
+    def __init__(self, source, target, prototype, connectionMask):
+        self.source = source
+        self.target = target
+        self.prototype = prototype
+        if connectionMask is None:
+            self.numSynapses = source.size * target.numNodes
+        elif sparse.issparse(connectionMask):
+            self.numSynapses = int(connectionMask.count_nonzero())
+        else:
+            self.numSynapses = int(np.count_nonzero(connectionMask))
+
+class StubGroup:
+    def __init__(self, net, size):
+        self.net = net
+        self.size = int(size)
+
+    def connect(self, target, prototype, connectionMask=None):
+        connection = StubConnectionGroup(self, target, prototype, connectionMask)
+        self.net.connections.append(connection)
+        return connection
+
+class StubCompartmentGroup(StubGroup):
+    def __init__(self, net, size, prototype):
+        super().__init__(net, size)
+        self.numNodes = self.size
+        self.dendrites = [StubCompartmentGroup(net, size, dendrite) for (dendrite, joinOp) in prototype.dendrites]
+        net.numCompartments += self.size
+
+class StubNeuronGroup:
+    def __init__(self, net, size, prototype):
+        self.soma = StubCompartmentGroup(net, size, prototype.soma)
+        self.dendrites = self.soma.dendrites
+
+class StubInputStubGroup(StubGroup):
+    def __init__(self, net, size):
+        super().__init__(net, size)
+        self.numPorts = self.size
+
+class NxNet:
+    def __init__(self):
+        self.numCompartments = 0
+        self.connections = []
+
+    #groups split across cores pass one prototype per core and a prototypeMap; they share the same structure
+    def createCompartmentGroup(self, size, prototype, prototypeMap=None):
+        return StubCompartmentGroup(self, size, prototype[0] if isinstance(prototype, list) else prototype)
+
+    def createNeuronGroup(self, size, prototype, prototypeMap=None):
+        return StubNeuronGroup(self, size, prototype[0] if isinstance(prototype, list) else prototype)
+
+    def createInputStubGroup(self, size):
+        return StubInputStubGroup(self, size)
+
+    @property
+    def numSynapses(self):
+        return sum([c.numSynapses for c in self.connections])
+
+"""
+Register the stub under the nxsdk module names the repo imports.
+"""
+def install():
+    stub = sys.modules[__name__]
+    modules = {'nxsdk': types.ModuleType('nxsdk'),
+                'nxsdk.api': types.ModuleType('nxsdk.api'),
+                'nxsdk.api.n2a': stub,
+                'nxsdk.graph': types.ModuleType('nxsdk.graph'),
+                'nxsdk.graph.monitor': types.ModuleType('nxsdk.graph.monitor'),
+                'nxsdk.graph.monitor.probes': types.ModuleType('nxsdk.graph.monitor.probes'),
+                'nxsdk.graph.processes': types.ModuleType('nxsdk.graph.processes'),
+                'nxsdk.graph.processes.phase_enums': types.ModuleType('nxsdk.graph.processes.phase_enums')}
+
+    modules['nxsdk'].api = modules['nxsdk.api']
+    modules['nxsdk.api'].n2a = stub
+    modules['nxsdk.graph.processes.phase_enums'].Phase = Phase
+    sys.modules.update(modules)
@@ -1,10 +1,13 @@
 import os
 import prototypes
 from primitives import *
-import nxsdk.api.n2a as nx
 import numpy as np
 import re
-from nxsdk.graph.monitor.probes import *
+try:
+    from nxsdk.graph.monitor.probes import *
+except ImportError:
+    #probes are only available when building directly on nxsdk
+    pass
 
 """
 A node which outputs a constant spike train representing the current state
@@ -23,7 +26,7 @@ class Decoder(ProcessNode):
         self.blocks = {}
 
         self._create_prototypes()
-        self.prototypes['s_prototypes']['activation_conn'] = nx.ConnectionPrototype(weight=self.prototypes['vth'],
+        self.prototypes['s_prototypes']['activation_conn'] = self.nx.ConnectionPrototype(weight=self.prototypes['vth'],
                                                                     delay=5)
 
         self._create_blocks()
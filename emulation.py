@@ -0,0 +1,638 @@
+"""
+Host-side emulation of the board and management SNIPs used by FullAgents, running on the CPU simulator.
+
+An agent built as a graph IR with emulate=True is compiled onto a SimBoard instead of Loihi. The board exposes the
+parts of the nxsdk board interface the agents use (createSnip, createChannel, startDriver, run), and the network a
+synthetic resource map, so the agents' location lookups, _send_config, run and get_data work unchanged. Each timestep
+runs the spiking phase in the simulator, followed by the management phase: a Python port of the task's management.c
+(bandit, maze or blackjack) guarded by the same check(), which reads the setup record (see FullAgent.get_config) in
+the same order, reads and resets the counter voltages, chooses actions with get_highest, steps the environment (see
+environments.py), sends action/reward/state spikes to the stubs and writes the same values to the same channels.
+
+In the synthetic resource map every compartment and input axon is located at [0, 0, 0, index], where index is its
+position in the simulator (stub ports following the compartments), so a location read back from the setup channel
+identifies the compartment or stub port directly. Random numbers replace the SNIP's rand() with a single
+environments.InstanceRNG stream seeded with the seed sent at setup, so runs are reproducible but do not reproduce the
+exact draws of the board.
+"""
+import os
+import time
+import threading
+import numpy as np
+import graph
+import simulator
+import environments
+from agent import CONFIG_FIELDS, CONFIG_MAGIC, CONFIG_VERSION
+
+#--- RESOURCE MAP ---
+
+class Node:
+    def __init__(self, nodeId):
+        self.nodeId = nodeId
+
+class Synapse:
+    def __init__(self, inputAxon):
+        self.inputAxon = inputAxon
+
+"""
+Backend stand-in for a compartment, neuron or stub group: indexing returns the node with the simulator index of
+each compartment (or stub port) as its nodeId.
+"""
+class EmulatedGroup:
+    def __init__(self, indices):
+        self.indices = indices
+
+    def __getitem__(self, i):
+        return Node(int(self.indices[i]))
+
+"""
+Backend stand-in for a connection: indexing returns a synapse whose input axon is the simulator index of the
+synapse's source.
+"""
+class EmulatedConnection:
+    def __init__(self, sources):
+        self.sources = sources
+
+    def __getitem__(self, i):
+        return Synapse(Node(int(self.sources[i])))
+
+class CompartmentMap:
+    def __getitem__(self, nodeId):
+        return [0, 0, 0, int(nodeId)]
+
+class ResourceMap:
+    def __init__(self):
+        self.compartmentMap = CompartmentMap()
+
+    def inputAxon(self, nodeId):
+        return [[0, 0, 0, int(nodeId)]]
+
+"""
+The network of an emulated agent, taking the place of the compiled nxsdk network.
+"""
+class EmulatedNet:
+    def __init__(self, sim):
+        self.simulator = sim
+        self.resourceMap = ResourceMap()
+
+"""
+Attach backend stand-ins to every record of the graph IR, so the nodes' groups and connections can be indexed as if
+the graph had been materialized and compiled.
+"""
+def attach(sim):
+    network = sim.graph
+    for group in network.compartmentGroups + network.stubGroups:
+        group.backend = EmulatedGroup(sim.get_indices(group))
+    for neuron in network.neuronGroups:
+        neuron.backend = neuron.soma.backend
+
+    for connection in network.connectionGroups:
+        rows, cols = connection.mask.indices()
+        connection.backend = EmulatedConnection(sim.get_indices(connection.source)[cols])
+
+#--- CHANNELS & BOARD ---
+
+#element type of each channel message type
+MESSAGE_TYPES = {'int': np.int32}
+
+"""
+Host-side transfer statistics of one direction of a channel: the number of calls, elements and bytes moved, and the
+time spent in the calls.
+"""
+class TransferStats:
+    def __init__(self):
+        self.calls = 0
+        self.elements = 0
+        self.bytes = 0
+        self.time = 0.0
+        self.max_latency = 0.0
+
+    def record(self, n, itemsize, latency):
+        self.calls += 1
+        self.elements += n
+        self.bytes += n * itemsize
+        self.time += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        return {'calls': self.calls,
+                'elements': self.elements,
+                'bytes': self.bytes,
+                'time': self.time,
+                'mean_latency': self.time / self.calls if self.calls else 0.0,
+                'max_latency': self.max_latency}
+
+"""
+Channel between the host and an emulated SNIP, held in a ring buffer of numElements typed elements.
+
+As on the board, a write which does not fit blocks the writer until the other side reads, and a read blocks until
+enough elements have been written; a write which has to wait is counted as a stall. The two sides can only wait for
+each other while the board runs asynchronously (SimBoard.run with aSync=True), the SNIPs on the board's thread and
+the host on its own. Otherwise, or once the host waits for the run to finish, the other side cannot move, and a read
+or write which would have to wait fails as it would block forever. The host uses write and read (or read_into), the
+emulated SNIPs snip_write and snip_read; host calls are recorded in the channel's transfer statistics.
+"""
+class Channel:
+    def __init__(self, name, messageType, numElements, board=None):
+        assert messageType in MESSAGE_TYPES, "Unsupported channel message type " + str(messageType)
+        self.name = name.decode() if isinstance(name, bytes) else name
+        self.messageType = messageType
+        self.dtype = np.dtype(MESSAGE_TYPES[messageType])
+        self.numElements = int(numElements)
+        assert self.numElements > 0, "Channel " + self.name + " must hold at least one element."
+
+        self.buffer = np.zeros(self.numElements, dtype=self.dtype)
+        self.head = 0
+        self.count = 0
+        #the board whose runs the host and the SNIPs wait for each other in
+        self.board = board
+        self.stalls = 0
+        self.peak = 0
+
+        self.src = None
+        self.dst = None
+        self.stats = {'write': TransferStats(), 'read': TransferStats()}
+        #the host may read while the board runs on another thread (see SimBoard.run); either side waits on changed
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+
+    def connect(self, src, dst):
+        self.src = src
+        self.dst = dst
+
+    @property
+    def size(self):
+        return self.count
+
+    @property
+    def probe(self):
+        return self.count > 0
+
+    def _push(self, values):
+        n = min(len(values), self.numElements - self.count)
+        tail = (self.head + self.count) % self.numElements
+        first = min(n, self.numElements - tail)
+        self.buffer[tail:tail + first] = values[:first]
+        self.buffer[:n - first] = values[first:n]
+        self.count += n
+        self.peak = max(self.peak, self.count)
+        return n
+
+    def _pop(self, n):
+        first = min(n, self.numElements - self.head)
+        values = np.concatenate((self.buffer[self.head:self.head + first], self.buffer[:n - first]))
+        self.head = (self.head + n) % self.numElements
+        self.count -= n
+        return values
+
+    """
+    Wait (holding the lock) for the other side to read or write, which it can only do during an asynchronous run and
+    while it is not itself blocked on another channel; ready tells whether this side could go on.
+    """
+    def _wait(self, message, ready):
+        board = self.board
+        assert board is not None and board.concurrent, message + " would block forever."
+        with board.lock:
+            blocked = [channel.name for (channel, other) in board.waiters.values() if not other()]
+            assert not blocked, message + " would block forever, as the other side waits on channel " + ", ".join(blocked) + "."
+            board.waiters[threading.get_ident()] = (self, ready)
+        try:
+            self.changed.wait()
+        finally:
+            with board.lock:
+                del board.waiters[threading.get_ident()]
+
+    def snip_write(self, n, data):
+        values = np.asarray(data).ravel()[:n].astype(self.dtype)
+        assert len(values) == n, "Fewer than " + str(n) + " values given to write to channel " + self.name
+        with self.lock:
+            written = self._push(values)
+            if written < n:
+                self.stalls += 1
+            while written < n:
+                self.changed.notify_all()
+                self._wait("Write of " + str(n - written) + " more values to the full channel " + self.name,
+                            lambda: self.count < self.numElements)
+                written += self._push(values[written:])
+            self.changed.notify_all()
+
+    def snip_read(self, n):
+        values = []
+        with self.lock:
+            while n > 0:
+                if self.count == 0:
+                    self._wait("Read of " + str(n) + " more values from channel " + self.name, lambda: self.count > 0)
+                    continue
+                m = min(n, self.count)
+                values.append(self._pop(m))
+                self.changed.notify_all()
+                n -= m
+        return np.concatenate(values) if values else np.zeros(0, dtype=self.dtype)
+
+    def write(self, n, data):
+        start = time.perf_counter()
+        self.snip_write(n, data)
+        self.stats['write'].record(n, self.dtype.itemsize, time.perf_counter() - start)
+
+    def read(self, n):
+        start = time.perf_counter()
+        values = self.snip_read(n).tolist()
+        self.stats['read'].record(n, self.dtype.itemsize, time.perf_counter() - start)
+        return values
+
+    #Read values straight into an array of any shape and integer type, in place of read
+    def read_into(self, out):
+        start = time.perf_counter()
+        out[...] = self.snip_read(out.size).reshape(out.shape)
+        self.stats['read'].record(out.size, self.dtype.itemsize, time.perf_counter() - start)
+        return out
+
+    def get_stats(self):
+        return {'messageType': self.messageType,
+                'numElements': self.numElements,
+                'bytes': self.numElements * self.dtype.itemsize,
+                'peak': self.peak,
+                'stalls': self.stalls,
+                'unread': self.size,
+                'write': self.stats['write'].as_dict(),
+                'read': self.stats['read'].as_dict()}
+
+"""
+Mock of a compiled board: holds the channels and the management SNIP of an agent and runs the simulator. Besides the
+channels' transfer statistics, it records the time spent compiling and running, so get_stats() splits the host's time
+between configuration (writes to the board), running and readback (reads from the board).
+"""
+class SimBoard:
+    def __init__(self, agent, sim):
+        self.agent = agent
+        self.simulator = sim
+        self.channels = {}
+        self.snips = []
+        self.time_step = 0
+        self.started = False
+        self.sync = True
+        #the background thread of an asynchronous run, and the error it ended with
+        self.thread = None
+        self.error = None
+        #whether an asynchronous run goes on, whether the host waits for it to finish, and the channel each side waits on
+        self.running = False
+        self.finishing = False
+        self.waiters = {}
+        self.lock = threading.Lock()
+        self.compile_time = 0.0
+        self.run_stats = {'calls': 0, 'steps': 0, 'time': 0.0}
+
+    def createSnip(self, phase, includeDir=None, cFilePath=None, funcName=None, guardName=None):
+        snip = get_snip_class(self.agent, cFilePath)(self, self.agent)
+        snip.phase = phase
+        self.snips.append(snip)
+        return snip
+
+    def createChannel(self, name, messageType, numElements):
+        channel = Channel(name, messageType, numElements, self)
+        self.channels[channel.name] = channel
+        return channel
+
+    def startDriver(self):
+        self.started = True
+
+    def disconnect(self):
+        self.finishRun()
+        self.started = False
+
+    """
+    Run the network for a number of timesteps, each followed by the management phase of every SNIP. The simulator
+    runs the whole stretch up to the next timestep at which a SNIP acts at once, so it can macro step through it
+    (when compiled with macro_step=True).
+    As on nxsdk boards, aSync=True returns as soon as the run has started (here on a background thread) and the host
+    may read the channels while it runs; finishRun waits for it to end.
+    """
+    def run(self, numSteps, aSync=False):
+        assert self.started, "Must start the driver before running the board."
+        assert self.thread is None, "Must finish the asynchronous run before running the board again."
+        if aSync:
+            self.error = None
+            self.running = True
+            self.finishing = False
+            self.thread = threading.Thread(target=self._run_async, args=(numSteps,), name='board', daemon=True)
+            self.thread.start()
+        else:
+            self._run(numSteps)
+
+    def _run_async(self, numSteps):
+        try:
+            self._run(numSteps)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.running = False
+            self._notify()
+
+    #Whether the host and the SNIPs can wait for each other on a channel: while an asynchronous run goes on and the
+    #host is not waiting for it to finish
+    @property
+    def concurrent(self):
+        return self.running and not self.finishing
+
+    #Wake up every side waiting on a channel, to check whether it still can wait
+    def _notify(self):
+        for channel in self.channels.values():
+            with channel.changed:
+                channel.changed.notify_all()
+
+    #Wait for an asynchronous run to end, raising any error it ended with
+    def finishRun(self):
+        if self.thread is None:
+            return
+        self.finishing = True
+        self._notify()
+        self.thread.join()
+        self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self, numSteps):
+        start = time.perf_counter()
+        end = self.time_step + numSteps
+        while self.time_step < end:
+            steps = min([snip.steps_to_check(self.time_step) for snip in self.snips] + [end - self.time_step])
+            self.simulator.run(steps)
+            self.time_step += steps
+            for snip in self.snips:
+                if snip.check(self.time_step):
+                    snip.run_cycle(self.time_step)
+
+        self.run_stats['calls'] += 1
+        self.run_stats['steps'] += numSteps
+        self.run_stats['time'] += time.perf_counter() - start
+
+    """
+    Return the transfer statistics of every channel, along with the totals of the host's writes (configuration) and
+    reads (readback) and the time spent compiling and running.
+    """
+    def get_stats(self):
+        channels = {name: channel.get_stats() for (name, channel) in self.channels.items()}
+        def total(direction):
+            keys = ['calls', 'elements', 'bytes', 'time']
+            return {k: sum([c[direction][k] for c in channels.values()]) for k in keys}
+
+        return {'compile': self.compile_time,
+                'config': total('write'),
+                'run': dict(self.run_stats),
+                'readback': total('read'),
+                'channels': channels}
+
+#--- SNIPS ---
+
+"""
+Python port of the functions shared by the management SNIPs.
+"""
+class ManagementSNIP:
+    def __init__(self, board, agent):
+        self.board = board
+        self.agent = agent
+        self.sim = board.simulator
+        self.n_actions = agent.n_actions
+        self.n_states = agent.n_states
+        self.voting_epoch = 128
+        self.counter_voltages = np.zeros(self.n_actions, dtype=int)
+        self.rng = None
+        self.debug = getattr(agent, 'debug', False)
+        #set when the setup record was rejected, after which the SNIP stays idle
+        self.setup_failed = False
+
+        #stub port of every spike source index above the compartments
+        self.stub_ports = {}
+        for stub in self.sim.graph.stubGroups:
+            for (port, index) in enumerate(self.sim.get_indices(stub)):
+                self.stub_ports[int(index)] = (stub, port)
+
+    def read(self, n):
+        return self.board.channels['setupChannel'].snip_read(n).astype(int)
+
+    def read_locations(self, n):
+        return list(self.read(4 * n).reshape(n, 4))
+
+    def write(self, channel, values):
+        values = np.atleast_1d(values)
+        self.board.channels[channel].snip_write(len(values), values)
+
+    def rand(self):
+        return int(self.rng.rand()[0])
+
+    def send_spike(self, location):
+        stub, port = self.stub_ports[int(location[3])]
+        self.sim.inject(stub, [port])
+
+    def compartment_indices(self, locations):
+        return np.array([loc[3] for loc in locations], dtype=int)
+
+    def check(self, time_step):
+        if time_step == 1:
+            self.setup(time_step)
+        if self.setup_failed:
+            return False
+        return time_step % self.voting_epoch == 0
+
+    #Number of timesteps from time_step to the next one at which the SNIP sets up or runs a cycle
+    def steps_to_check(self, time_step):
+        if time_step < 1:
+            return 1 - time_step
+        return self.voting_epoch - time_step % self.voting_epoch
+
+    def get_counter_voltages(self):
+        self.counter_voltages = self.sim.v[0, self.counter_indices].astype(int)
+
+    def reset_counter_voltages(self):
+        self.sim.v[:, self.counter_indices] = 0
+        self.sim.interrupt()
+
+    #Choose the action with the highest count, randomly breaking ties
+    def get_highest(self):
+        voltages = self.counter_voltages
+        highest = max(-1, int(voltages.max()))
+        ties = np.flatnonzero(voltages == highest)
+        if len(ties) > 1:
+            return int(ties[self.rand() % len(ties)])
+        #as in the SNIP, no action is chosen if every count is below -1
+        return int(np.argmax(voltages)) if voltages.max() > -1 else -1
+
+    #Number of task parameters in the setup record (the SNIP's N_ACTIONS etc. are taken from the agent)
+    def n_params(self):
+        return 0
+
+    #Read the header of the setup record and check it against the sizes the SNIP was built with. As in the SNIPs,
+    #writes the status to the data channel and returns the task parameters which follow, or None if it was rejected.
+    def setup_header(self):
+        header = dict(zip(CONFIG_FIELDS, self.read(len(CONFIG_FIELDS))))
+        expected = {'magic': CONFIG_MAGIC, 'version': CONFIG_VERSION, 'n_actions': self.n_actions,
+                    'n_states': self.n_states, 'n_memories': self.agent.n_memories, 'n_params': self.n_params()}
+        if any([header[field] != value for (field, value) in expected.items()]):
+            self.setup_failed = True
+            self.write('dataChannel', -1)
+            return None
+        self.write('dataChannel', 0)
+
+        self.voting_epoch = int(header['l_epoch'])
+        self.rng = environments.InstanceRNG([header['seed']])
+        self.epochs = int(header['n_epochs'])
+        self.n_memories = int(header['n_memories'])
+        return self.read(int(header['n_params']))
+
+    #Read the estimate locations and their starting voltages from the setup channel
+    def setup_estimates(self, n):
+        self.estimate_indices = self.compartment_indices(self.read_locations(n))
+        self.sim.v[:, self.estimate_indices] = self.read(n)
+        self.sim.interrupt()
+
+    def setup_stubs(self):
+        self.reward_location = self.read(4)
+        self.punish_location = self.read(4)
+        self.draw_location = self.read(4)
+        self.action_locations = self.read_locations(self.n_actions)
+        self.state_locations = self.read_locations(self.n_states)
+        self.counter_indices = self.compartment_indices(self.read_locations(self.n_actions))
+
+    def send_action(self, time_step, action):
+        self.write('dataChannel', action)
+        self.write('spikeChannel', self.counter_voltages)
+        self.send_spike(self.action_locations[action])
+
+    def send_reward(self, time_step, reward):
+        self.write('rewardChannel', reward)
+        if reward == 1:
+            self.send_spike(self.reward_location)
+        elif reward == -1:
+            self.send_spike(self.punish_location)
+        elif reward == 2:
+            self.send_spike(self.draw_location)
+
+    def send_state(self, time_step):
+        state = int(self.env.get_state()[0])
+        self.send_spike(self.state_locations[state])
+
+    def send_estimates(self):
+        self.write('estimateChannel', self.sim.v[0, self.estimate_indices].astype(int))
+
+    def run_cycle(self, time_step):
+        action = self.choose_action()
+        self.send_action(time_step, action)
+        reward = int(self.env.step([action])[0])
+        self.send_reward(time_step, reward)
+        self.send_state(time_step)
+
+"""
+bandit/management.c: epsilon-greedy choice between arms.
+"""
+class BanditSNIP(ManagementSNIP):
+    def n_params(self):
+        return self.n_actions
+
+    def setup(self, time_step):
+        probabilities = self.setup_header()
+        if probabilities is None:
+            return
+        self.setup_stubs()
+        self.setup_estimates(self.n_memories)
+
+        self.env = environments.BanditEnvironment(probabilities)
+        self.env.rng = self.rng
+        self.epsilon = self.agent.epsilon
+        self.send_state(time_step)
+
+    def choose_action(self):
+        self.get_counter_voltages()
+        self.reset_counter_voltages()
+        if self.rand() % 100 < self.epsilon:
+            return self.rand() % self.n_actions
+        return self.get_highest()
+
+"""
+Shared logic of the maze and blackjack SNIPs: random exploring starts, greedy choices and final estimates.
+"""
+class EpisodicSNIP(ManagementSNIP):
+    def choose_action(self):
+        if self.env.exploring[0]:
+            return self.rand() % self.n_actions
+        self.get_counter_voltages()
+        self.reset_counter_voltages()
+        return self.get_highest()
+
+    def send_state(self, time_step):
+        self.write('dataChannel', self.env.get_observation()[0])
+        super().send_state(time_step)
+
+    def run_cycle(self, time_step):
+        super().run_cycle(time_step)
+        if (time_step // self.voting_epoch) % self.epochs == self.epochs - 1:
+            self.send_estimates()
+
+"""
+maze/management.c: a grid world with the transitions and reward location sent at setup.
+"""
+class MazeSNIP(EpisodicSNIP):
+    def n_params(self):
+        return 2 + 2 * self.n_states
+
+    def setup(self, time_step):
+        params = self.setup_header()
+        if params is None:
+            return
+        reward_location = params[:2]
+        transitions = params[2:].reshape((2,) + tuple(self.agent.dims))
+        self.setup_stubs()
+        self.setup_estimates(self.n_memories)
+
+        self.env = environments.MazeEnvironment(transitions, reward_location, self.agent.lifespan)
+        self.env.rng = self.rng
+        self.env.random_start()
+        self.send_state(time_step)
+
+"""
+blackjack/management.c: blackjack against a dealer who sticks at 17.
+"""
+class BlackjackSNIP(EpisodicSNIP):
+    def setup(self, time_step):
+        if self.setup_header() is None:
+            return
+        self.setup_stubs()
+        self.setup_estimates(self.n_memories)
+
+        self.env = environments.BlackjackEnvironment()
+        self.env.rng = self.rng
+        self.env.random_start()
+        self.send_state(time_step)
+
+#SNIP emulated for each agent class, or for the task directory holding its management.c
+SNIPS = {'Bandit': BanditSNIP, 'bandit': BanditSNIP,
+        'GridAgent': MazeSNIP, 'maze': MazeSNIP,
+        'BlackjackAgent': BlackjackSNIP, 'blackjack': BlackjackSNIP}
+
+def get_snip_class(agent, cFilePath=None):
+    for cls in type(agent).__mro__:
+        if cls.__name__ in SNIPS:
+            return SNIPS[cls.__name__]
+    if cFilePath is not None:
+        task = os.path.basename(os.path.dirname(os.path.abspath(cFilePath)))
+        if task in SNIPS:
+            return SNIPS[task]
+    raise ValueError("No management SNIP emulation for agent " + type(agent).__name__)
+
+"""
+Compile an agent built as a graph IR onto an emulated board, in place of compiling it to Loihi. With macro_step=True
+the simulator macro steps through the steady states between management phases of noise-free networks; it is off by
+default, as the agents' networks are rarely steady for long (see simulator.py).
+"""
+def compile(agent, seed=None, macro_step=False):
+    assert isinstance(agent.network, graph.GraphNet), "Only agents built as a graph.GraphNet can be emulated."
+    start = time.perf_counter()
+    sim = simulator.Simulator(agent.network, seed=agent.seed if seed is None else seed, macro_step=macro_step)
+    attach(sim)
+
+    agent.graph = agent.network
+    agent.simulator = sim
+    agent.network = EmulatedNet(sim)
+    agent.board = SimBoard(agent, sim)
+    agent.board.compile_time = time.perf_counter() - start
+    return agent.board
@@ -1,10 +1,13 @@
 import os
 import prototypes
 from primitives import *
-import nxsdk.api.n2a as nx
 import numpy as np
 import re
-from nxsdk.graph.monitor.probes import *
+try:
+    from nxsdk.graph.monitor.probes import *
+except ImportError:
+    #probes are only available when building directly on nxsdk
+    pass
 
 
 """
@@ -0,0 +1,276 @@
+"""
+Batched NumPy implementations of the environments run by the bandit, maze and blackjack SNIPs (management.c).
+
+Each environment steps K independent instances at once and follows the C code exactly: the same state variables,
+transitions, episode restarts, state indices (map_state_to_index) and rewards (1 reward, -1 punishment, 2 draw, 0
+nothing). Random numbers are drawn like the C code's rand() % n, but each instance has its own reproducible stream
+(see InstanceRNG), so an instance behaves the same however many other instances it is batched with.
+
+The streams come from a splitmix64 hash, not from glibc's rand(), so only the rules are the same as the SNIPs': a
+trajectory of an environment does not match the trajectory of a SNIP seeded with the same seed (srand(seed)), and the
+two can only be compared in distribution. Given the same sequence of rand() values, they take the same steps.
+"""
+import numpy as np
+
+#largest value returned by rand(), as with glibc
+RAND_MAX = 2**31 - 1
+
+"""
+Independent, reproducible random streams for a batch of instances. Every instance draws from a counter-based
+generator keyed by its seed and the number of numbers it has drawn so far, so a draw is a pure function of
+(seed, counter) and a whole batch is drawn with a few vectorized integer operations. The values have the range of
+glibc's rand(), but not its sequence.
+"""
+class InstanceRNG:
+    def __init__(self, seeds):
+        self.seeds = np.asarray(seeds, dtype=np.uint64)
+        self.counters = np.zeros(len(self.seeds), dtype=np.uint64)
+
+    #splitmix64 finalizer, used to hash (seed, counter) into a random 64-bit value
+    @staticmethod
+    def mix(x):
+        with np.errstate(over='ignore'):
+            x = x + np.uint64(0x9E3779B97F4A7C15)
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return x ^ (x >> np.uint64(31))
+
+    """
+    Return a number in [0, RAND_MAX] for every instance, advancing the streams of the instances in mask (all by
+    default). The values for instances outside the mask are not meaningful.
+    """
+    def rand(self, mask=None):
+        with np.errstate(over='ignore'):
+            key = self.mix(self.seeds) + self.counters * np.uint64(0x9E3779B97F4A7C15)
+        values = (self.mix(key) >> np.uint64(33)).astype(np.int64)
+
+        if mask is None:
+            self.counters += np.uint64(1)
+        else:
+            self.counters[mask] += np.uint64(1)
+        return values
+
+    #Equivalent of rand() % n for every instance
+    def randint(self, n, mask=None):
+        return self.rand(mask) % n
+
+"""
+Return the seeds of a batch of K instances: consecutive seeds from a single seed, or the given per-instance seeds.
+"""
+def get_seeds(seed, batch_size):
+    seeds = np.atleast_1d(np.asarray(seed, dtype=np.int64))
+    if len(seeds) == 1:
+        seeds = seeds[0] + np.arange(batch_size)
+    assert len(seeds) == batch_size, "Must give a single seed or one seed per instance."
+    return seeds
+
+"""
+Base class for batched environments. step() takes one action per instance and returns the rewards;
+get_state() returns the index of each instance's state, as sent to the agent's state stubs.
+"""
+class Environment:
+    def __init__(self, batch_size, seed):
+        self.batch_size = batch_size
+        self.rng = InstanceRNG(get_seeds(seed, batch_size))
+
+    def get_state(self):
+        return np.zeros(self.batch_size, dtype=int)
+
+    #The values the SNIP writes to the data channel alongside the state
+    def get_observation(self):
+        return np.zeros((self.batch_size, 0), dtype=int)
+
+    #Whether each instance is at the first step of an episode (where the SNIPs choose a random exploring action)
+    @property
+    def exploring(self):
+        return np.zeros(self.batch_size, dtype=bool)
+
+"""
+Multi-arm bandit (bandit/management.c). The state never changes; each action is rewarded with its probability
+(given in percent, as sent to the SNIP) and punished otherwise.
+"""
+class BanditEnvironment(Environment):
+    def __init__(self, probabilities, batch_size=1, seed=12340):
+        super().__init__(batch_size, seed)
+        #per-action probabilities, shared by all instances or given per instance with shape (batch_size, n_actions)
+        self.probabilities = np.broadcast_to(np.asarray(probabilities, dtype=int), (batch_size, np.shape(probabilities)[-1]))
+        self.n_actions = self.probabilities.shape[1]
+
+    @classmethod
+    def from_agent(cls, agent, batch_size=1, seed=None):
+        return cls(agent.probabilities, batch_size, agent.seed if seed is None else seed)
+
+    def step(self, actions):
+        r = self.rng.randint(100)
+        rewarded = r < self.probabilities[np.arange(self.batch_size), actions]
+        return np.where(rewarded, 1, -1)
+
+"""
+Grid world on a torus with walls (maze/management.c). Actions follow the SNIP's enumeration (North, East, South,
+West); moving through a wall leaves the location unchanged. Reaching the reward location is rewarded and running
+out of steps (the lifespan) is punished, both restarting the episode at a random location.
+"""
+class MazeEnvironment(Environment):
+    NORTH, EAST, SOUTH, WEST = range(4)
+
+    def __init__(self, transitions, reward_location=(2, 2), lifespan=8, batch_size=1, seed=12340):
+        super().__init__(batch_size, seed)
+        #allowed poloidal (north/south) and toroidal (east/west) transitions, indexed [direction, x, y]
+        self.transitions = np.asarray(transitions, dtype=bool)
+        self.grid_x, self.grid_y = self.transitions.shape[1:]
+        self.reward_location = np.asarray(reward_location, dtype=int)
+        self.lifespan = lifespan
+        self.n_actions = 4
+
+        self.location = np.zeros((batch_size, 2), dtype=int)
+        self.steps = np.zeros(batch_size, dtype=int)
+        self.random_start()
+
+    @classmethod
+    def from_agent(cls, agent, batch_size=1, seed=None):
+        return cls(agent.transitions, agent.reward_location, agent.lifespan, batch_size, agent.seed if seed is None else seed)
+
+    #Restart the episodes of the instances in mask at a random location
+    def random_start(self, mask=None):
+        mask = np.ones(self.batch_size, dtype=bool) if mask is None else mask
+        x = self.rng.randint(self.grid_x, mask)
+        y = self.rng.randint(self.grid_y, mask)
+        self.location[mask, 0] = x[mask]
+        self.location[mask, 1] = y[mask]
+        self.steps[mask] = 0
+
+    def get_state(self):
+        return self.location[:, 0] + self.grid_x * self.location[:, 1]
+
+    def get_observation(self):
+        return self.location.copy()
+
+    @property
+    def exploring(self):
+        return self.steps == 0
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        x, y = self.location[:, 0], self.location[:, 1]
+
+        #the transition each action crosses: south and west use the transition out of the neighbouring location
+        direction = np.where((actions == self.NORTH) | (actions == self.SOUTH), 0, 1)
+        tx = np.where(actions == self.WEST, np.mod(x - 1, self.grid_x), x)
+        ty = np.where(actions == self.SOUTH, np.mod(y - 1, self.grid_y), y)
+        allowed = self.transitions[direction, tx, ty]
+
+        dx = np.select([actions == self.EAST, actions == self.WEST], [1, -1], 0)
+        dy = np.select([actions == self.NORTH, actions == self.SOUTH], [1, -1], 0)
+        self.location[:, 0] += np.where(allowed, dx, 0)
+        self.location[:, 1] += np.where(allowed, dy, 0)
+
+        rewards = np.zeros(self.batch_size, dtype=int)
+        found = np.all(self.location == self.reward_location, axis=1)
+        expired = ~found & (self.steps >= self.lifespan)
+        rewards[found] = 1
+        rewards[expired] = -1
+
+        self.steps[~(found | expired)] += 1
+        self.random_start(found | expired)
+        return rewards
+
+"""
+Blackjack against a dealer who sticks at 17 (blackjack/management.c). Actions are hit (0) and stick (1); a stick
+ends the episode with a win (1), loss (-1) or draw (2), a hit which goes bust with a loss. The state index combines
+the player's sum (12-21), the dealer's card (1-10) and whether the player holds a usable ace.
+"""
+class BlackjackEnvironment(Environment):
+    HIT, STICK = 0, 1
+    N_CARDS = 10
+
+    def __init__(self, batch_size=1, seed=12340):
+        super().__init__(batch_size, seed)
+        self.n_actions = 2
+
+        self.player_sum = np.zeros(batch_size, dtype=int)
+        self.dealer_card = np.zeros(batch_size, dtype=int)
+        self.usable_ace = np.zeros(batch_size, dtype=bool)
+        self.steps = np.zeros(batch_size, dtype=int)
+        self.random_start()
+
+    @classmethod
+    def from_agent(cls, agent, batch_size=1, seed=None):
+        return cls(batch_size, agent.seed if seed is None else seed)
+
+    #Draw a card (1-10, with face cards counting as 10) for the instances in mask
+    def draw_card(self, mask):
+        return np.minimum(self.rng.randint(13, mask) + 1, 10)
+
+    def random_start(self, mask=None):
+        mask = np.ones(self.batch_size, dtype=bool) if mask is None else mask
+        ace = self.rng.randint(2, mask)
+        player = self.rng.randint(self.N_CARDS, mask) + 12
+        dealer = self.rng.randint(self.N_CARDS, mask) + 1
+        self.usable_ace[mask] = ace[mask] == 1
+        self.player_sum[mask] = player[mask]
+        self.dealer_card[mask] = dealer[mask]
+        self.steps[mask] = 0
+
+    def get_state(self):
+        n = self.N_CARDS
+        return (self.player_sum - 12) + (self.dealer_card - 1) * n + self.usable_ace.astype(int) * n * n
+
+    def get_observation(self):
+        return np.stack([self.player_sum, self.dealer_card, self.usable_ace.astype(int)], axis=1)
+
+    @property
+    def exploring(self):
+        return self.steps == 0
+
+    def hit(self, mask):
+        rewards = np.zeros(self.batch_size, dtype=int)
+        card = self.draw_card(mask)
+        self.player_sum[mask] += card[mask]
+
+        over = mask & (self.player_sum > 21)
+        #a usable ace is counted as 1 instead of 11 rather than going bust
+        saved = over & self.usable_ace
+        self.player_sum[saved] -= 10
+        self.usable_ace[saved] = False
+
+        bust = over & ~saved
+        rewards[bust] = -1
+        self.random_start(bust)
+        return rewards
+
+    def stick(self, mask):
+        #the dealer's card becomes the dealer's sum, counting an ace as 11 while it does not go bust
+        dealer = self.dealer_card.copy()
+        dealer_ace = mask & (dealer == 1)
+        dealer[dealer_ace] += 10
+
+        drawing = mask & (dealer < 17)
+        while np.any(drawing):
+            card = self.draw_card(drawing)
+            dealer[drawing] += card[drawing]
+            soft = drawing & dealer_ace & (dealer > 21)
+            dealer[soft] -= 10
+            dealer_ace[soft] = False
+            drawing = mask & (dealer < 17)
+
+        gap = (21 - dealer) - (21 - self.player_sum)
+        rewards = np.select([dealer > 21, gap < 0, gap > 0], [1, -1, 1], 2)
+        rewards[~mask] = 0
+
+        self.dealer_card[mask] = dealer[mask]
+        self.random_start(mask)
+        return rewards
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.batch_size, dtype=int)
+
+        stick = actions == self.STICK
+        if np.any(stick):
+            rewards += self.stick(stick)
+        if np.any(~stick):
+            rewards += self.hit(~stick)
+
+        #as in the SNIP, the step counter also advances after an episode has been restarted
+        self.steps += 1
+        return rewards
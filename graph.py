@@ -0,0 +1,429 @@
+"""
+Backend-agnostic intermediate representation (IR) of a spiking network built from ProcessNodes.
+
+GraphNet mirrors the parts of the nxsdk NxNet interface which the nodes use (createCompartmentGroup, createNeuronGroup,
+createInputStubGroup and connect on the resulting groups), but only records the groups, prototypes, connection masks
+and stubs in plain Python/NumPy structures. A network built on a GraphNet needs no nxsdk or hardware, can be
+inspected and transformed (resource estimates, placement, simulation), and is replayed onto a backend NxNet in a single
+pass by materialize() when it is needed.
+
+The prototype classes below take their parameters under the nxsdk names, so nodes create them exactly as they would
+create nxsdk prototypes. Parameters which are not set take the defaults listed below when the graph is analysed or
+simulated; materialize() only passes on the explicitly set parameters so the backend applies its own defaults.
+"""
+from enum import Enum
+import numpy as np
+import masks
+
+class COMPARTMENT_JOIN_OPERATION(Enum):
+    SKIP = 0
+    ADD = 1
+    OR = 2
+    AND = 3
+    PASS = 4
+    BLOCK = 5
+
+#phases in which a SNIP can be executed
+class Phase(Enum):
+    EMBEDDED_INIT = 0
+    EMBEDDED_SPIKING = 1
+    EMBEDDED_PRELEARN_MGMT = 2
+    EMBEDDED_MGMT = 3
+    HOST_PRE_EXECUTION = 4
+    HOST_POST_EXECUTION = 5
+
+"""
+Base class for prototypes which store their parameters as attributes on top of a set of defaults.
+"""
+class Prototype:
+    defaults = {}
+
+    def __init__(self, **kwargs):
+        unknown = set(kwargs) - set(self.defaults)
+        assert len(unknown) == 0, "Unknown prototype parameters: " + str(sorted(unknown))
+
+        #keep the explicitly set parameters so backends apply their own defaults to the rest
+        self.kwargs = dict(kwargs)
+        self.params = dict(self.defaults)
+        self.params.update(kwargs)
+        self.__dict__.update(self.params)
+
+    def __repr__(self):
+        set_params = {k: v for (k, v) in self.params.items() if v != self.defaults[k]}
+        return "{}({})".format(type(self).__name__, set_params)
+
+"""
+Parameters of a single compartment. Dendritic compartments are attached with addDendrite, forming a tree which is
+rooted at the soma of a NeuronPrototype.
+"""
+class CompartmentPrototype(Prototype):
+    defaults = {'vThMant': 10,
+                'vMinExp': 23,
+                'vMaxExp': 23,
+                'biasMant': 0,
+                'biasExp': 0,
+                'compartmentVoltageDecay': 0,
+                'compartmentCurrentDecay': 4096,
+                'refractoryDelay': 1,
+                'thresholdBehavior': 0,
+                'functionalState': 0,
+                'logicalCoreId': -1,
+                'enableNoise': 0,
+                'randomizeVoltage': 0,
+                'randomizeCurrent': 0,
+                'noiseMantAtCompartment': 0,
+                'noiseExpAtCompartment': 0}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.dendrites = []
+
+    def addDendrite(self, compartments, joinOp):
+        assert len(compartments) == 1, "Only a single compartment can be joined per dendrite."
+        self.dendrites.append((compartments[0], joinOp))
+
+    #Return a copy of the prototype (and its dendritic tree) with some parameters changed
+    def copy(self, **kwargs):
+        params = dict(self.kwargs)
+        params.update(kwargs)
+        proto = CompartmentPrototype(**params)
+        for (dendrite, joinOp) in self.dendrites:
+            proto.addDendrite([dendrite.copy(**kwargs)], joinOp)
+        return proto
+
+class NeuronPrototype:
+    def __init__(self, soma):
+        self.soma = soma
+
+    def copy(self, **kwargs):
+        return NeuronPrototype(self.soma.copy(**kwargs))
+
+class ConnectionPrototype(Prototype):
+    defaults = {'weight': 0,
+                'weightExponent': 0,
+                'delay': 0,
+                'numWeightBits': 8,
+                'signMode': 1,
+                'enableLearning': 0}
+
+"""
+Base class for any group of nodes which can be the source of a connection.
+"""
+class SourceGroup:
+    #connectors pass mask descriptors through instead of converting them to matrices
+    acceptsMaskDescriptors = True
+
+    def connect(self, target, prototype, connectionMask=None):
+        if connectionMask is None:
+            connectionMask = masks.FullMask(target.numNodes, self.size)
+        elif not isinstance(connectionMask, masks.ConnectionMask):
+            connectionMask = masks.SparseMask.from_matrix(connectionMask)
+
+        assert connectionMask.shape == (target.numNodes, self.size), "Connection mask must have shape (target, source)."
+        return self.network._add_connection(ConnectionGroup(self.network, self, target, prototype, connectionMask))
+
+    #Items of a group are only available once it has been materialized onto a backend
+    def __getitem__(self, i):
+        assert self.backend is not None, "Graph must be materialized before accessing individual nodes."
+        return self.backend[i]
+
+"""
+A group of identical compartments. Compartments which belong to a multi-compartment neuron record their neuron group
+and the parent compartment group they join into.
+"""
+class CompartmentGroup(SourceGroup):
+    def __init__(self, network, size, prototype, neuron=None, parent=None, joinOp=None):
+        self.network = network
+        self.id = len(network.compartmentGroups)
+        self.size = int(size)
+        self.numNodes = self.size
+        self.prototype = prototype
+        self.neuron = neuron
+        self.parent = parent
+        self.joinOp = joinOp
+        self.dendrites = []
+        #logical core set by a placement pass (or an array with the core of each node); None keeps the prototype's
+        #logicalCoreId
+        self.logicalCore = None
+        self.backend = None
+
+class NeuronGroup:
+    def __init__(self, network, size, prototype):
+        self.network = network
+        self.id = len(network.neuronGroups)
+        self.size = int(size)
+        self.numNodes = self.size
+        self.prototype = prototype
+        self.compartmentGroups = []
+        self.backend = None
+
+        self.soma = self._add_compartments(prototype.soma)
+
+    @property
+    def dendrites(self):
+        return self.soma.dendrites
+
+    #Recursively create a compartment group for every compartment in the neuron's dendritic tree
+    def _add_compartments(self, prototype, parent=None, joinOp=None):
+        group = self.network._add_compartments(CompartmentGroup(self.network, self.size, prototype, self, parent, joinOp))
+        self.compartmentGroups.append(group)
+
+        for (dendrite, dendriteOp) in prototype.dendrites:
+            group.dendrites.append(self._add_compartments(dendrite, group, dendriteOp))
+
+        return group
+
+class InputStubGroup(SourceGroup):
+    def __init__(self, network, size):
+        self.network = network
+        self.id = len(network.stubGroups)
+        self.size = int(size)
+        self.numPorts = self.size
+        self.backend = None
+
+class ConnectionGroup:
+    def __init__(self, network, source, target, prototype, mask):
+        self.network = network
+        self.id = len(network.connectionGroups)
+        self.source = source
+        self.target = target
+        self.prototype = prototype
+        self.mask = mask
+        #the planned backend connect call which creates this connection's synapses
+        self.batch = None
+        self.backend = None
+        #position of each synapse among those of a merged backend connection (None when it is not merged)
+        self.synapses = None
+
+    @property
+    def numSynapses(self):
+        return self.mask.nnz
+
+    def __getitem__(self, i):
+        assert self.backend is not None, "Graph must be materialized before accessing individual synapses."
+        if self.synapses is not None:
+            return self.backend[int(self.synapses[i])]
+        return self.backend[i]
+
+"""
+A single backend connect call, planned for one or more IR connections which share their source, target and
+prototype. The mask of a batch is the union of its connections' masks.
+"""
+class ConnectionBatch:
+    def __init__(self, connection):
+        self.source = connection.source
+        self.target = connection.target
+        self.prototype = connection.prototype
+        self.connections = [connection]
+        self.mask = connection.mask
+
+    #Add a connection, if its synapses do not overlap with those already in the batch
+    def merge(self, connection):
+        union = self.mask.to_sparse()
+        new = connection.mask.to_sparse()
+        if union.multiply(new).count_nonzero() > 0:
+            return False
+
+        self.mask = masks.SparseMask.from_matrix(union + new)
+        self.connections.append(connection)
+        return True
+
+    """
+    Return the position of each synapse of a merged connection among the synapses of the batch's backend connection.
+    order holds the (target, source) indices of the backend's synapses in the order it created them (see
+    get_backend_order); without it, the backend is assumed to create them in the row-major order of the batch's mask.
+    """
+    def get_synapses(self, connection, order=None):
+        n_source = self.mask.shape[1]
+        if order is None:
+            order = self.mask.indices()
+        created = np.asarray(order[0]) * n_source + np.asarray(order[1])
+        rows, cols = connection.mask.indices()
+        wanted = np.sort(np.asarray(rows) * n_source + np.asarray(cols))
+
+        sorter = np.argsort(created, kind='stable')
+        found = np.minimum(np.searchsorted(created, wanted, sorter=sorter), len(created) - 1)
+        positions = sorter[found]
+        assert np.array_equal(created[positions], wanted), "Backend connection is missing synapses of a merged connection."
+        return positions
+
+    @property
+    def numSynapses(self):
+        return self.mask.nnz
+
+"""
+Return the (target, source) node indices of a backend connection's synapses, in the order the backend created them,
+or None if its synapses do not expose the compartments they connect (as src and dst). Compartments are matched to
+their nodes through the items of the batch's backend source and target groups.
+"""
+def get_backend_order(backend_connection, batch):
+    try:
+        synapses = [backend_connection[i] for i in range(batch.numSynapses)]
+        endpoints = [(s.dst, s.src) for s in synapses]
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+    sources = {id(batch.source.backend[i]): i for i in range(batch.source.size)}
+    targets = {id(batch.target.backend[i]): i for i in range(batch.target.size)}
+    rows = np.array([targets.get(id(dst), -1) for (dst, src) in endpoints], dtype=int)
+    cols = np.array([sources.get(id(src), -1) for (dst, src) in endpoints], dtype=int)
+    assert np.all(rows >= 0) and np.all(cols >= 0), "Backend synapses connect compartments outside of their groups."
+    return rows, cols
+
+"""
+Records a network as the backend-agnostic IR. Exposes the NxNet methods used by the ProcessNodes.
+"""
+class GraphNet:
+    def __init__(self):
+        self.compartmentGroups = []
+        self.neuronGroups = []
+        self.stubGroups = []
+        self.connectionGroups = []
+        self.connectionPlan = None
+        self.backend = None
+
+    def createCompartmentGroup(self, size, prototype):
+        return self._add_compartments(CompartmentGroup(self, size, prototype))
+
+    def createNeuronGroup(self, size, prototype):
+        group = NeuronGroup(self, size, prototype)
+        self.neuronGroups.append(group)
+        return group
+
+    def createInputStubGroup(self, size):
+        group = InputStubGroup(self, size)
+        self.stubGroups.append(group)
+        return group
+
+    def _add_compartments(self, group):
+        self.compartmentGroups.append(group)
+        return group
+
+    def _add_connection(self, connection):
+        self.connectionGroups.append(connection)
+        return connection
+
+    """
+    Plan the backend connect calls for the recorded connections. Connections from a compartment group which share
+    their source, target and prototype are merged into a single call when their masks are disjoint; overlapping
+    connections (e.g. repeated one-to-one connections whose weights add up) must stay separate to keep their synapses.
+    Connections from input stubs are never merged, as their synapses are looked up per connection to find the
+    stubs' input axons.
+    """
+    def plan_connections(self, merge=True):
+        batches = []
+        open_batches = {}
+
+        for connection in self.connectionGroups:
+            if merge and isinstance(connection.source, CompartmentGroup):
+                key = (connection.source.id, connection.target.id, id(connection.prototype))
+                candidates = open_batches.setdefault(key, [])
+                for batch in candidates:
+                    if batch.merge(connection):
+                        break
+                else:
+                    candidates.append(ConnectionBatch(connection))
+                    batches.append(candidates[-1])
+            else:
+                batches.append(ConnectionBatch(connection))
+
+        for batch in batches:
+            for connection in batch.connections:
+                connection.batch = batch
+
+        return batches
+
+    @property
+    def numCompartments(self):
+        return sum([g.size for g in self.compartmentGroups])
+
+    @property
+    def numSynapses(self):
+        return sum([c.numSynapses for c in self.connectionGroups])
+
+    """
+    Replay the recorded network onto a backend network (by default a new nxsdk NxNet) in one pass. Every IR record
+    keeps a reference to the backend object it was materialized as (.backend), so the groups and connections held by
+    the nodes can be used to look up the compiled network's resources. Connections are emitted as planned by
+    plan_connections (kept as .connectionPlan); merge=False issues one connect call per connection.
+    """
+    def materialize(self, net=None, backend=None, merge=True):
+        if backend is None:
+            import nxsdk.api.n2a as backend
+        if net is None:
+            net = backend.NxNet()
+
+        converted = {}
+
+        #create the backend prototypes once, sharing them between groups just as the nodes share the IR prototypes
+        def convert_compartment(proto, logicalCore):
+            key = (id(proto), logicalCore)
+            if key not in converted:
+                params = dict(proto.kwargs)
+                if logicalCore is not None:
+                    params['logicalCoreId'] = logicalCore
+                backend_proto = backend.CompartmentPrototype(**params)
+                for (dendrite, joinOp) in proto.dendrites:
+                    backend_op = getattr(backend.COMPARTMENT_JOIN_OPERATION, joinOp.name)
+                    backend_proto.addDendrite([convert_compartment(dendrite, logicalCore)], backend_op)
+                converted[key] = backend_proto
+            return converted[key]
+
+        def convert_connection(proto):
+            key = id(proto)
+            if key not in converted:
+                converted[key] = backend.ConnectionPrototype(**proto.kwargs)
+            return converted[key]
+
+        #a placement pass may split a group across cores (an array of cores per node), which is expressed as one
+        #prototype per core and a prototypeMap from each node to its prototype
+        def convert_prototypes(proto, logicalCore, wrap=lambda p: p):
+            if logicalCore is None or np.ndim(logicalCore) == 0:
+                return {'prototype': wrap(convert_compartment(proto, logicalCore))}
+            cores, prototypeMap = np.unique(logicalCore, return_inverse=True)
+            return {'prototype': [wrap(convert_compartment(proto, int(core))) for core in cores],
+                    'prototypeMap': prototypeMap.tolist()}
+
+        #neurons map their IR compartment tree onto the backend neuron group's soma/dendrites
+        def attach(group, backend_group):
+            group.backend = backend_group
+            for (dendrite, backend_dendrite) in zip(group.dendrites, backend_group.dendrites):
+                attach(dendrite, backend_dendrite)
+
+        for neuron in self.neuronGroups:
+            kwargs = convert_prototypes(neuron.prototype.soma, neuron.soma.logicalCore, backend.NeuronPrototype)
+            neuron.backend = net.createNeuronGroup(size=neuron.size, **kwargs)
+            attach(neuron.soma, neuron.backend.soma)
+
+        for group in self.compartmentGroups:
+            if group.neuron is None:
+                group.backend = net.createCompartmentGroup(size=group.size,
+                                                    **convert_prototypes(group.prototype, group.logicalCore))
+
+        for stub in self.stubGroups:
+            stub.backend = net.createInputStubGroup(size=stub.size)
+
+        #issue the planned connect calls in one pass, converting each distinct mask to a backend matrix only once
+        self.connectionPlan = self.plan_connections(merge)
+        backend_masks = {}
+        for batch in self.connectionPlan:
+            kwargs = {'prototype': convert_connection(batch.prototype)}
+            key = batch.mask.key()
+            if key not in backend_masks:
+                backend_masks[key] = batch.mask.to_backend()
+            if backend_masks[key] is not None:
+                kwargs['connectionMask'] = backend_masks[key]
+
+            backend_connection = batch.source.backend.connect(batch.target.backend, **kwargs)
+            #connections merged into a batch share its backend connection group, and index into its synapses in the
+            #order the backend reports creating them (if it does)
+            order = get_backend_order(backend_connection, batch) if len(batch.connections) > 1 else None
+            for connection in batch.connections:
+                connection.backend = backend_connection
+                connection.synapses = batch.get_synapses(connection, order) if len(batch.connections) > 1 else None
+
+        self.backend = net
+        return net
+
+#allows the graph to stand in for the nxsdk module when building networks without nxsdk installed
+NxNet = GraphNet
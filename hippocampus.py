@@ -1,10 +1,13 @@
 import os
 import prototypes
 from primitives import *
-import nxsdk.api.n2a as nx
 import numpy as np
 import re
-from nxsdk.graph.monitor.probes import *
+try:
+    from nxsdk.graph.monitor.probes import *
+except ImportError:
+    #probes are only available when building directly on nxsdk
+    pass
 
 """
 Tracks which states the agent has entered and delivers reward/punishment feedback for those
@@ -29,9 +32,9 @@ class Hippocampus(ProcessNode):
         or_w = self.blocks['reward_buffer'].get_synproto().weight
         and_w = self.blocks['reward_gate'].get_synproto().weight
 
-        self.s_prototypes['or_delayed'] = nx.ConnectionPrototype(weight = or_w, delay=3)
-        self.s_prototypes['or_delayed_long'] = nx.ConnectionPrototype(weight = or_w, delay=6)
-        self.s_prototypes['and_delayed'] = nx.ConnectionPrototype(weight = and_w, delay=5)
+        self.s_prototypes['or_delayed'] = self.nx.ConnectionPrototype(weight = or_w, delay=3)
+        self.s_prototypes['or_delayed_long'] = self.nx.ConnectionPrototype(weight = or_w, delay=6)
+        self.s_prototypes['and_delayed'] = self.nx.ConnectionPrototype(weight = and_w, delay=5)
 
     def _create_blocks(self):
         self.blocks['filter'] = AndNode(self.network, self.input_shape, self.logicalCore)
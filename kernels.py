@@ -0,0 +1,90 @@
+"""
+Compiled step kernel for the fixed-point CPU simulator (see simulator.py), used when numba is installed.
+
+The kernel fuses a whole timestep of the simulator for every copy of the network into one call: the decay and
+integration of the current, the voltage update of each level of the dendritic trees with saturation, thresholding and
+reset, the joins into the parents and the delivery of the spikes into the ring buffer of synaptic input. It follows
+the NumPy step operation by operation (including the truncating fixed-point decay), so both give identical results;
+the noise is still drawn by the simulator and passed in. Without numba the functions stay plain Python and the
+simulator uses its NumPy step.
+"""
+import numpy as np
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+DECAY_BITS = 12
+DECAY_MASK = 2**DECAY_BITS - 1
+
+"""
+Scale a value by keep / 2^12, truncating toward zero, as simulator.decay.
+"""
+def decay_value(x, keep):
+    product = np.int64(x) * keep
+    if product < 0:
+        product += DECAY_MASK
+    return product >> DECAY_BITS
+
+"""
+Advance every copy of the network by one timestep. The arrays are those of the simulator, with the dendrite joins and
+synapses flattened (see Simulator._load_kernel). Returns the number of spikes and of synaptic events.
+"""
+def step(u, v, spikes, ring, head, n_slots,
+            u_keep, v_keep, bias, vth, v_min, v_max, u_min, u_max, can_spike, resets,
+            u_noisy, u_noise, v_noise,
+            levels, add_ptr, add_children, add_parents, or_ptr, or_children, or_parents,
+            delays, syn_indptr, syn_indices, syn_data, joined):
+    n_batch, n = u.shape
+    n_spikes = 0
+    n_events = 0
+
+    for b in range(n_batch):
+        #integrate the synaptic input arriving at this step
+        for i in range(n):
+            u[b, i] = decay_value(u[b, i], u_keep[i]) + ring[head, b, i]
+            ring[head, b, i] = 0
+        for j in range(len(u_noisy)):
+            u[b, u_noisy[j]] += u_noise[b, j]
+        for i in range(n):
+            u[b, i] = min(max(u[b, i], u_min), u_max)
+
+        for i in range(n):
+            joined[i] = False
+
+        for l in range(len(levels) - 1):
+            for i in range(levels[l], levels[l + 1]):
+                x = decay_value(v[b, i], v_keep[i]) + u[b, i] + bias[i] + v_noise[b, i]
+                x = min(max(x, v_min[i]), v_max[i])
+                fired = can_spike[i] and x > vth[i]
+                if fired and resets[i]:
+                    x = 0
+                v[b, i] = x
+                spikes[b, i] = fired or joined[i]
+
+            #join this level's compartments into their parents, which are updated next
+            for k in range(add_ptr[l], add_ptr[l + 1]):
+                u[b, add_parents[k]] += v[b, add_children[k]]
+            for k in range(or_ptr[l], or_ptr[l + 1]):
+                if spikes[b, or_children[k]]:
+                    joined[or_parents[k]] = True
+
+        #send out this step's spikes, which arrive from the next step on
+        for i in range(n, spikes.shape[1]):
+            spikes[b, i] = False
+        for i in range(n):
+            if not spikes[b, i]:
+                continue
+            n_spikes += 1
+            for d in range(len(delays)):
+                slot = (head + 1 + delays[d]) % n_slots
+                for k in range(syn_indptr[d, i], syn_indptr[d, i + 1]):
+                    ring[slot, b, syn_indices[k]] += syn_data[k]
+                n_events += syn_indptr[d, i + 1] - syn_indptr[d, i]
+
+    return n_spikes, n_events
+
+if HAVE_NUMBA:
+    decay_value = njit(cache=True)(decay_value)
+    step = njit(cache=True)(step)
@@ -0,0 +1,275 @@
+"""
+Lightweight descriptors for the connectivity between two groups of compartments. A descriptor records the structure of
+a connection (identity, all-to-all, dense along a shared axis, broadcast along an axis, or an explicit sparse pattern)
+rather than an adjacency matrix, so connections can be created, compared and counted without ever allocating a
+(n_target x n_source) array. Descriptors are only turned into a matrix at the backend boundary (to_backend), and then
+into a dense array only if the backend requires it.
+
+All masks follow the nxsdk convention of a (n_target, n_source) shape.
+"""
+from abc import ABC, abstractmethod
+import hashlib
+import numpy as np
+from scipy import sparse
+
+"""
+Mark a mask's underlying arrays as read-only so a single copy can be safely shared between connections.
+"""
+def freeze_mask(mask):
+    if sparse.issparse(mask):
+        for array in (mask.data, mask.indices, mask.indptr):
+            array.flags.writeable = False
+    else:
+        mask.flags.writeable = False
+
+    return mask
+
+"""
+Build a sparse connection mask of shape (n_target, n_source) from the (target, source) index pairs which are connected.
+"""
+def sparse_mask(rows, cols, shape):
+    values = np.ones(len(rows), dtype=np.int8)
+    return sparse.coo_matrix((values, (rows, cols)), shape=shape).tocsr()
+
+"""
+Find the (target, source) index pairs which connect every element of a source slice to every element of the matching
+target slice along a single, matching axis. Only the connected pairs are enumerated, so the cost grows with the number
+of synapses and not with the product of the two tensors' sizes.
+"""
+def get_axis_pairs(source_shape, source_axis, target_shape, target_axis):
+    len_dim = source_shape[source_axis]
+
+    #flat indices of each tensor, grouped by their position along the connecting axis
+    source_idx = np.moveaxis(np.arange(np.prod(source_shape)).reshape(source_shape), source_axis, 0).reshape(len_dim, -1)
+    target_idx = np.moveaxis(np.arange(np.prod(target_shape)).reshape(target_shape), target_axis, 0).reshape(len_dim, -1)
+
+    #every source in a slice connects to every target in the same slice
+    pairs_shape = (len_dim, source_idx.shape[1], target_idx.shape[1])
+    rows = np.broadcast_to(target_idx[:, None, :], pairs_shape).ravel()
+    cols = np.broadcast_to(source_idx[:, :, None], pairs_shape).ravel()
+
+    return rows, cols
+
+"""
+Find the index in the projected tensor of every element of a tensor which is projected along an axis.
+"""
+def get_projection(shape, axis):
+    coords = list(np.unravel_index(np.arange(np.prod(shape)), shape))
+    del coords[axis]
+    new_shape = tuple(np.delete(np.array(shape), axis))
+
+    #a tensor projected down to a single element
+    if len(coords) == 0:
+        return np.zeros(np.prod(shape), dtype=int)
+
+    return np.ravel_multi_index(coords, new_shape)
+
+"""
+Convert a node shape (int, list or tuple) to a hashable tuple.
+"""
+def shape_key(shape):
+    return tuple(int(x) for x in np.atleast_1d(shape))
+
+"""
+Abstract descriptor of the connectivity from a source group to a target group.
+"""
+class ConnectionMask(ABC):
+    def __init__(self, n_target, n_source):
+        super().__init__()
+        self.shape = (int(n_target), int(n_source))
+        self._sparse = None
+
+    #Return the (target, source) index pairs of every synapse described by the mask
+    @abstractmethod
+    def indices(self):
+        pass
+
+    #Hashable description of the mask; two masks with equal keys describe the same connectivity
+    @abstractmethod
+    def key(self):
+        pass
+
+    #Return the number of synapses described by the mask
+    @property
+    def nnz(self):
+        return len(self.indices()[0])
+
+    #Number of synapses arriving at each target compartment
+    def fan_in(self):
+        return np.bincount(self.indices()[0], minlength=self.shape[0])
+
+    #Number of synapses leaving each source compartment
+    def fan_out(self):
+        return np.bincount(self.indices()[1], minlength=self.shape[1])
+
+    #Return the mask as a (shared, read-only) sparse matrix
+    def to_sparse(self):
+        if self._sparse is None:
+            rows, cols = self.indices()
+            self._sparse = freeze_mask(sparse_mask(rows, cols, self.shape))
+        return self._sparse
+
+    def to_dense(self):
+        return self.to_sparse().toarray()
+
+    #Return the mask in the form a backend's connect call expects
+    def to_backend(self, dense=False):
+        return self.to_dense() if dense else self.to_sparse()
+
+    def __eq__(self, other):
+        return isinstance(other, ConnectionMask) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "{}(shape={}, nnz={})".format(type(self).__name__, self.shape, self.nnz)
+
+"""
+Each neuron in the source connects to a single corresponding neuron in the target.
+(1 -> 1), (2 -> 2), ... , (n -> n)
+"""
+class IdentityMask(ConnectionMask):
+    def __init__(self, n):
+        super().__init__(n, n)
+
+    def indices(self):
+        idx = np.arange(self.shape[0])
+        return idx, idx
+
+    def key(self):
+        return ('identity', self.shape)
+
+    @property
+    def nnz(self):
+        return self.shape[0]
+
+    def fan_in(self):
+        return np.ones(self.shape[0], dtype=int)
+
+    def fan_out(self):
+        return np.ones(self.shape[1], dtype=int)
+
+"""
+All-to-all connections between the source and target.
+"""
+class FullMask(ConnectionMask):
+    def __init__(self, n_target, n_source):
+        super().__init__(n_target, n_source)
+
+    def indices(self):
+        rows = np.repeat(np.arange(self.shape[0]), self.shape[1])
+        cols = np.tile(np.arange(self.shape[1]), self.shape[0])
+        return rows, cols
+
+    def key(self):
+        return ('full', self.shape)
+
+    @property
+    def nnz(self):
+        return self.shape[0] * self.shape[1]
+
+    def fan_in(self):
+        return np.full(self.shape[0], self.shape[1], dtype=int)
+
+    def fan_out(self):
+        return np.full(self.shape[1], self.shape[0], dtype=int)
+
+    #all-to-all is the default connectivity for a connect call without a mask
+    def to_backend(self, dense=False):
+        return None
+
+"""
+Each slice of the source tensor along an axis connects densely to the matching slice of the target tensor
+(i.e. a block / Kronecker structure along the shared axis).
+"""
+class AxisMask(ConnectionMask):
+    def __init__(self, source_shape, source_axis, target_shape, target_axis):
+        self.source_shape = shape_key(source_shape)
+        self.target_shape = shape_key(target_shape)
+        self.source_axis = source_axis
+        self.target_axis = target_axis
+        super().__init__(np.prod(self.target_shape), np.prod(self.source_shape))
+
+    def indices(self):
+        return get_axis_pairs(self.source_shape, self.source_axis, self.target_shape, self.target_axis)
+
+    def key(self):
+        return ('axis', self.source_shape, self.source_axis, self.target_shape, self.target_axis)
+
+    @property
+    def nnz(self):
+        len_dim = self.source_shape[self.source_axis]
+        return self.shape[0] * self.shape[1] // len_dim
+
+    def fan_in(self):
+        return np.full(self.shape[0], self.shape[1] // self.source_shape[self.source_axis], dtype=int)
+
+    def fan_out(self):
+        return np.full(self.shape[1], self.shape[0] // self.target_shape[self.target_axis], dtype=int)
+
+"""
+Broadcast between a tensor and its projection along an axis. When expanding, each element of the projection drives
+every element along the axis of the full tensor; otherwise the full tensor is projected, with every element along the
+axis driving the single corresponding element of the projection.
+"""
+class BroadcastMask(ConnectionMask):
+    def __init__(self, shape, axis, expand=True):
+        self.full_shape = shape_key(shape)
+        self.axis = axis
+        self.expand = expand
+        n = np.prod(self.full_shape)
+        n_proj = n // self.full_shape[axis]
+
+        if expand:
+            super().__init__(n, n_proj)
+        else:
+            super().__init__(n_proj, n)
+
+    def indices(self):
+        full = np.arange(np.prod(self.full_shape))
+        projected = get_projection(self.full_shape, self.axis)
+
+        if self.expand:
+            return full, projected
+        else:
+            return projected, full
+
+    def key(self):
+        return ('broadcast', self.full_shape, self.axis, self.expand)
+
+    @property
+    def nnz(self):
+        return int(np.prod(self.full_shape))
+
+"""
+An explicit sparse connection pattern given by its (target, source) index pairs or by a matrix.
+"""
+class SparseMask(ConnectionMask):
+    def __init__(self, rows, cols, shape):
+        super().__init__(*shape)
+        self.rows = np.asarray(rows, dtype=int)
+        self.cols = np.asarray(cols, dtype=int)
+        self._key = None
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        matrix = sparse.coo_matrix(matrix)
+        return cls(matrix.row, matrix.col, matrix.shape)
+
+    def indices(self):
+        return self.rows, self.cols
+
+    def key(self):
+        if self._key is None:
+            digest = hashlib.sha1(self.rows.tobytes() + self.cols.tobytes()).hexdigest()
+            self._key = ('sparse', self.shape, digest)
+        return self._key
+
+"""
+Return the matrix (or None for all-to-all) to pass as a backend connect call's connection mask.
+"""
+def to_backend(mask, dense=False):
+    if isinstance(mask, ConnectionMask):
+        return mask.to_backend(dense)
+    return mask
@@ -18,7 +18,7 @@ class GridAgent(FullAgent):
         super().__init__(n_actions, n_states, **kwargs)
         #get starting values to form the initial greedy policy
         self.lifespan = kwargs.get("lifespan", 8)
-        self.start_values = kwargs.get("starting_values", np.zeros((self.dims[0], self.dims[1], self.n_replicates), dtype='int'))
+        self.start_values = kwargs.get("starting_values", np.zeros((n_actions, self.dims[0], self.dims[1], self.n_replicates), dtype='int'))
         self.walls = kwargs.get("walls", [])
         self.set_valid_transitions()
         self.reward_location = kwargs.get("reward_location", (2,2))
@@ -39,22 +39,22 @@ class GridAgent(FullAgent):
                 self.inChannels.append(channel)
                 channel.connect(self.snip, None)
 
-        #need to send: 
-        # keep the setupchannel for later use
-        n_outData = (10 + 9 * self.n_actions + 4 * self.n_states + 2 + 2 * self.n_states + 5 * self.n_memories)
+        #the setup channel holds the whole setup record, so it is sent in one write (see FullAgent.get_config)
+        n_outData = self.get_config_size()
         setupChannel = self.board.createChannel(b'setupChannel', "int", n_outData)
         connect(True, setupChannel)
 
         #create the data channels to return location & action at each epoch
-        dataChannel = self.board.createChannel(b'dataChannel', "int", self.data_points * self.n_epochs)
+        n_epochs = self.get_channel_epochs()
+        dataChannel = self.board.createChannel(b'dataChannel', "int", self.data_points * n_epochs)
         connect(False, dataChannel)
 
         #return reward at each step
-        rewardChannel = self.board.createChannel(b'rewardChannel', "int", self.n_epochs)
+        rewardChannel = self.board.createChannel(b'rewardChannel', "int", n_epochs)
         connect(False, rewardChannel)
 
         #return the action values at each location
-        spikeChannel = self.board.createChannel(b'spikeChannel', "int", self.n_epochs * self.n_actions)
+        spikeChannel = self.board.createChannel(b'spikeChannel', "int", n_epochs * self.n_actions)
         connect(False, spikeChannel)
 
         #return the estimates for each pair at the end
@@ -70,72 +70,27 @@ class GridAgent(FullAgent):
                                     funcName = "run_cycle",
                                     guardName = "check")
 
-    def get_data(self, n_epochs):
-        dataChannel = self.inChannels[0]
-        rewardChannel = self.inChannels[1]
-        spikeChannel = self.inChannels[2]
+    """
+    Each epoch the SNIP sends the state (its location) followed by the action it chose there.
+    """
+    def _record_fields(self):
+        return [('state', np.int16, (2,)), ('action', np.int8)]
+
+    def get_data(self, n_epochs, final=True, out=None):
         estimateChannel = self.inChannels[3]
 
-        #get the state/action data
-        self.data = np.array(dataChannel.read(n_epochs*self.data_points)).reshape(n_epochs, self.data_points)
-        #get the rewards data
-        self.rewards = np.array(rewardChannel.read(n_epochs))
-        singlewgt = self.action_buffer.prototypes['s_prototypes']['single'].weight
-        #get the action value data
-        self.values = np.array(spikeChannel.read(n_epochs*self.n_actions), dtype='int').reshape(n_epochs, self.n_actions)
-        #get the final estimate values
-        self.final_estimates = np.array(estimateChannel.read(self.n_memories), dtype='int').reshape(self.n_actions, self.n_states, self.n_replicates)
-
-    def _send_config(self):
-        #get the locations of axons where we need to send updates to/from the SNIP
-        stateLocations = self.get_state_locations()
-        actionLocations = self.get_action_locations()
-        valueLocations = self.get_value_locations()
-        RPLocations = self.get_RP_locations()
-
-        #get the setup channel
-        setupChannel = self.outChannels[0]
-        #send the epoch length
-        setupChannel.write(1, [self.l_epoch])
-
-        #send the random seed
-        setupChannel.write(1, [self.seed])
-
-        #send the number of epochs to run (tell program when to probe/send final values)
-        setupChannel.write(1, [self.n_epochs])
-
-        #send the reward location
-        setupChannel.write(2, [self.reward_location[0], self.reward_location[1]])
-
-        #send the allowed/disallowed transitions
-        setupChannel.write(self.n_states*2, self.transitions.ravel(order="c"))
-
-        #send the reward stub
-        setupChannel.write(4, RPLocations[0])
-        #send the punishment stub
-        setupChannel.write(4, RPLocations[1])
-        #send the draw stub
-        setupChannel.write(4, RPLocations[2])
-
-        #send the action stubs
-        for i in range(self.n_actions):
-            setupChannel.write(4, actionLocations[i][:4])
-
-        #send the state stubs
-        for i in range(self.n_states):
-            setupChannel.write(4, stateLocations[i][:4])
-
-        #send the value locations
-        for i in range(self.n_actions):
-            setupChannel.write(4, valueLocations[i][:4])
-
-        estimateLocations = self.get_estimate_locations()
-        #send the estimate locations
-        for i in range(self.n_memories):
-            setupChannel.write(4, estimateLocations[i][:4])
-        
-        #send the initial values that will be used to form the policy
-        setupChannel.write(self.n_memories, self.start_values.ravel(order='c'))
+        #get the state/action, reward and action value data of each epoch
+        self.records = self.read_records(n_epochs, out)
+        self.data, self.rewards, self.values = self.split_records(self.records)
+        #get the final estimate values, which are only sent at the end of the run
+        if final:
+            self.final_estimates = self.read_channel(estimateChannel, np.empty(self.n_memories, dtype=np.int32)).reshape(self.n_actions, self.n_states, self.n_replicates)
+
+    """
+    Send the reward location and the allowed poloidal/toroidal transitions of the maze.
+    """
+    def _config_params(self):
+        return np.concatenate((np.ravel(self.reward_location), self.transitions.ravel(order='c'))).astype(np.int32)
 
     def set_params_file(self):
         filename = os.getcwd()+'/parameters.h'
@@ -177,7 +132,7 @@ class GridAgent(FullAgent):
                 #the right (toroidal) wall
                 self.walls.append((self.dims[1]-1, i, "east"))
 
-        self.transitions = np.ones((2,self.dims[0], self.dims[1]), dtype=np.int)
+        self.transitions = np.ones((2,self.dims[0], self.dims[1]), dtype=int)
 
         for (x, y, action) in self.walls:
             assert y >= 0 and y < self.dims[0], "Specified wall y out of bounds"
@@ -33,6 +33,8 @@ int step;
 
 //run variables
 int voting_epoch = 128;
+//set when the setup record was rejected, after which the SNIP stays idle
+int setup_failed = 0;
 long epochs = 1;
 int cseed = 12340;
 
@@ -42,6 +44,10 @@ int check(runState *s) {
     setup(s);
   }
 
+  if (setup_failed) {
+    return 0;
+  }
+
   if (s->time_step % voting_epoch == 0) {
     return 1;
   } else {
@@ -154,11 +160,38 @@ void run_cycle(runState *s) {
   return;
 }
 
-void setup(runState *s) {
+//check the header of the setup record against the sizes this SNIP was compiled with
+int check_header(int *header, int n_params, int n_memories) {
+  return header[CFG_MAGIC] == CONFIG_MAGIC
+    && header[CFG_VERSION] == CONFIG_VERSION
+    && header[CFG_N_ACTIONS] == N_ACTIONS
+    && header[CFG_N_STATES] == N_STATES
+    && header[CFG_N_MEMORIES] == n_memories
+    && header[CFG_N_PARAMS] == n_params;
+}
+
+//read the starting voltages of the estimate compartments in chunks and store them
+void read_voltages(int compartments[][4], int n) {
   CoreId core;
-  int cxId = 0;
   NeuronCore *nc;
-  int voltage = 0;
+  int voltages[VALUE_CHUNK];
+  int m = 0;
+
+  for (int i = 0; i < n; i += VALUE_CHUNK) {
+    m = (n - i < VALUE_CHUNK) ? n - i : VALUE_CHUNK;
+    readChannel(readChannelID, voltages, m);
+
+    for (int j = 0; j < m; j++) {
+      //get the core the compartment is on and set its voltage
+      core = nx_nth_coreid(compartments[i + j][2]);
+      nc = NEURON_PTR(core);
+      nc->cx_state[compartments[i + j][3]].V = voltages[j];
+    }
+  }
+}
+
+void setup(runState *s) {
+  int header[CONFIG_HEADER];
 
   //check things are defined
   if (N_ACTIONS == 0 || N_STATES == 0) {
@@ -175,15 +208,25 @@ void setup(runState *s) {
   spikeChannelID = getChannelID("spikeChannel");
   estimateChannelID = getChannelID("estimateChannel");
 
-  //read out the length of the voting epoch
-  readChannel(readChannelID, &voting_epoch, 1);
+  //read the header of the setup record and check it was written for this build of the SNIP
+  readChannel(readChannelID, header, CONFIG_HEADER);
+  if (!check_header(header, (2 + 2 * N_STATES), N_MEMORIES)) {
+    int error = -1;
+    printf("Setup record does not match parameters.h\n");
+    writeChannel(writeChannelID, &error, 1);
+    setup_failed = 1;
+    return;
+  }
 
-  //read the random seed
-  readChannel(readChannelID, &cseed, 1);
-  srand(cseed);
+  //report the accepted record to the host ahead of any data (see FullAgent.read_setup_status)
+  int status = 0;
+  writeChannel(writeChannelID, &status, 1);
 
-  //read the number of epochs
-  readChannel(readChannelID, &epochs, 1);
+  //the length of the voting epoch, the random seed and the number of epochs
+  voting_epoch = header[CFG_L_EPOCH];
+  cseed = header[CFG_SEED];
+  srand(cseed);
+  epochs = header[CFG_N_EPOCHS];
 
   //read the variables for the maze (rwd location & allowed transitions)
   readChannel(readChannelID, &rewardLocation, 2);
@@ -196,45 +239,18 @@ void setup(runState *s) {
   readChannel(readChannelID, &punishCompartment[0], 4);
   readChannel(readChannelID, &drawCompartment[0], 4);
 
-  //read the location of the action stubs
-  for (int i = 0; i < N_ACTIONS; i++) {
-    readChannel(readChannelID, &actionCompartments[i][0], 4);
-  }
-
-  //read the location of the state stubs
-  for (int i = 0; i < N_STATES; i++) {
-    readChannel(readChannelID, &stateCompartments[i][0], 4);
-    //printf("DEBUG: %d %d %d %d\n", stateCompartments[i][0], stateCompartments[i][1], stateCompartments[i][2], stateCompartments[i][3]);
-    //printf("DEBUG Coreid: %d\n", nx_nth_coreid(stateCompartments[i][2]).id);
-  }
+  //read the locations of the action and state stubs, each table in one read
+  readChannel(readChannelID, &actionCompartments[0][0], 4 * N_ACTIONS);
+  readChannel(readChannelID, &stateCompartments[0][0], 4 * N_STATES);
   printf("Got R/P/State/Condition compartments\n");
-  
 
   //read the location of the encoder's counter neurons
-  for (int i = 0; i < N_ACTIONS; i++) {
-    readChannel(readChannelID, &counterCompartment[i][0], 4);
-  }
+  readChannel(readChannelID, &counterCompartment[0][0], 4 * N_ACTIONS);
   printf("Got Counter compartments\n");
 
-  //read the location of the estimate compartments
-  for (int i = 0; i < N_MEMORIES; i++) {
-    readChannel(readChannelID, &estimateCompartment[i][0], 4);
-  }
-
-  //then read the initial values into the voltage of those registers
-  for (int i = 0; i < N_MEMORIES; i++) {
-    //get the incoming policy value
-    readChannel(readChannelID, &voltage, 1);
-
-    //store it in the memory compartments for the estimates representing that SA pair
-    //get the core the counter is on
-    core = nx_nth_coreid(estimateCompartment[i][2]);
-    nc = NEURON_PTR(core);
-    //get the compartment the voltage is in
-    cxId = estimateCompartment[i][3];
-    //store the voltage
-    nc->cx_state[cxId].V = voltage;
-  }
+  //read the location of the estimate compartments, then the initial values into their voltages
+  readChannel(readChannelID, &estimateCompartment[0][0], 4 * N_MEMORIES);
+  read_voltages(estimateCompartment, N_MEMORIES);
 
   printf("Got estimate locs & values, done.\n");
     
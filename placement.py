@@ -0,0 +1,263 @@
+"""
+Logical-core placement planner for networks built from ProcessNodes as a graph IR.
+
+The planner works on placement units: a whole neuron group (all of whose compartments must share a core) or a single
+compartment group. Units are packed onto cores under the per-core limits from resources.CORE_LIMITS, growing each core
+from its most strongly connected unit and then adding the unplaced units it exchanges the most synapses with, so that
+connected groups end up sharing a core. Noise is configured per core, so units with different noise settings (e.g. the
+noisy TrackerNodes) are never placed together with noise-free logic. Units which already have a fixed logical core
+keep it.
+
+Units larger than a single core are split into slices of their nodes which each fit on a core, and the slices are
+placed as units of their own; the group then gets an array with the core of each node, which materialize() expresses
+as one prototype per core and a prototypeMap. Only units of which even a single node does not fit on a core are left
+for the compiler to place; they are listed as unplaced in the report, with a warning if they are noisy. The plan is
+applied to the IR with apply_placement, and takes effect when the graph is materialized.
+"""
+import warnings
+import numpy as np
+import graph
+import resources
+
+"""
+Return the noise configuration of a prototype's compartments, or None if no compartment is noisy.
+"""
+def get_noise_class(prototype):
+    noise = []
+    stack = [prototype]
+    while stack:
+        proto = stack.pop()
+        if proto.enableNoise:
+            noise.append((proto.randomizeVoltage, proto.randomizeCurrent, proto.noiseMantAtCompartment, proto.noiseExpAtCompartment))
+        stack.extend([dendrite for (dendrite, joinOp) in proto.dendrites])
+
+    return tuple(sorted(set(noise))) if noise else None
+
+"""
+Return the resources used by the nodes start to stop of a unit's groups (the groups of a neuron all have the same
+size), counted as in resources.get_group_usage. indices holds the (target, source) indices of every connection.
+"""
+def get_slice_usage(network, groups, start, stop, indices):
+    ids = set([g.id for g in groups])
+    usage = {'compartments': (stop - start) * len(groups), 'synapses': 0, 'input_axons': 0, 'output_axons': 0}
+
+    for connection in network.connectionGroups:
+        rows, cols = indices[connection.id]
+        if connection.target.id in ids:
+            inside = (rows >= start) & (rows < stop)
+            usage['synapses'] += int(np.count_nonzero(inside))
+            usage['input_axons'] += len(np.unique(cols[inside]))
+        if isinstance(connection.source, graph.CompartmentGroup) and connection.source.id in ids:
+            inside = (cols >= start) & (cols < stop)
+            usage['output_axons'] += len(np.unique(cols[inside]))
+
+    return usage
+
+"""
+Split a unit which does not fit on a core into slices of its nodes which each fit. Slices start at multiples of
+granularity nodes (halved until they fit), so slices of groups connected one to one line up and can share a core.
+Returns None if even a single node does not fit.
+"""
+def split_unit(network, unit, limits, indices, granularity):
+    size = unit['groups'][0].size
+
+    while granularity >= 1:
+        slices = []
+        for start in range(0, size, granularity):
+            stop = min(start + granularity, size)
+            usage = get_slice_usage(network, unit['groups'], start, stop, indices)
+            if not fits(new_core(-1, None), usage, limits):
+                break
+            slices.append(dict(unit, name=unit['name'] + '[' + str(start) + ':' + str(stop) + ']', start=start, stop=stop, **usage))
+        else:
+            return slices
+        granularity //= 2
+
+    return None
+
+"""
+Split a network into placement units. Each unit is a dictionary holding its compartment groups, the range of their
+nodes it covers, its resource usage, noise class and any logical core fixed by its prototype. A group (or neuron)
+larger than a core is split into slices of its nodes, each of which is a unit. Returns the units, those which could
+not be split to fit a core, and the unit of every node of each group (by group id).
+"""
+def get_units(network, names, limits, granularity):
+    usage = resources.get_group_usage(network)
+    indices = {c.id: tuple(np.asarray(x) for x in c.mask.indices()) for c in network.connectionGroups}
+    units = []
+    unplaced = []
+
+    for group in network.compartmentGroups:
+        if group.neuron is not None and group is not group.neuron.soma:
+            continue
+
+        groups = group.neuron.compartmentGroups if group.neuron is not None else [group]
+        prototype = group.prototype
+        unit = {'name': names.get(group.id, 'group_' + str(group.id)),
+                'groups': groups,
+                'start': 0,
+                'stop': group.size,
+                'noise': get_noise_class(prototype),
+                'fixed': prototype.logicalCoreId if prototype.logicalCoreId >= 0 else None}
+
+        for key in ['compartments', 'synapses', 'input_axons', 'output_axons']:
+            unit[key] = sum([usage[g.id][key] for g in groups])
+
+        if unit['fixed'] is None and not fits(new_core(-1, None), unit, limits):
+            slices = split_unit(network, unit, limits, indices, granularity)
+            if slices is None:
+                unplaced.append(dict(unit, id=-1))
+                continue
+        else:
+            slices = [unit]
+
+        for piece in slices:
+            piece['id'] = len(units)
+            units.append(piece)
+
+    node_unit = {g.id: np.full(g.size, -1, dtype=int) for g in network.compartmentGroups}
+    for unit in units:
+        for g in unit['groups']:
+            node_unit[g.id][unit['start']:unit['stop']] = unit['id']
+
+    return units, unplaced, node_unit, indices
+
+"""
+Return the number of synapses between each pair of units (keyed by (target unit, source unit), -1 for nodes left to
+the compiler), counted from the units of each synapse's target and source nodes.
+"""
+def get_unit_synapses(network, node_unit, indices):
+    counts = {}
+    for connection in network.connectionGroups:
+        if not isinstance(connection.source, graph.CompartmentGroup):
+            continue
+        rows, cols = indices[connection.id]
+        pairs = np.stack([node_unit[connection.target.id][rows], node_unit[connection.source.id][cols]], axis=1)
+        if len(pairs) == 0:
+            continue
+        (keys, n) = np.unique(pairs, axis=0, return_counts=True)
+        for ((i, j), count) in zip(keys.tolist(), n.tolist()):
+            counts[(i, j)] = counts.get((i, j), 0) + count
+
+    return counts
+
+"""
+Return the symmetric matrix of synapse counts exchanged between each pair of units.
+"""
+def get_unit_weights(units, counts):
+    weights = np.zeros((len(units), len(units)), dtype=np.int64)
+    for ((i, j), count) in counts.items():
+        if i != j and i >= 0 and j >= 0:
+            weights[i, j] += count
+            weights[j, i] += count
+
+    return weights
+
+def fits(core, unit, limits):
+    return all([core[key] + unit[key] <= limits[key] for key in ['compartments', 'synapses', 'input_axons', 'output_axons']])
+
+def new_core(core_id, noise):
+    return {'id': core_id, 'noise': noise, 'units': [], 'compartments': 0, 'synapses': 0, 'input_axons': 0, 'output_axons': 0}
+
+def add_unit(core, unit, assignment):
+    core['units'].append(unit['id'])
+    for key in ['compartments', 'synapses', 'input_axons', 'output_axons']:
+        core[key] += unit[key]
+    assignment[unit['id']] = core['id']
+
+"""
+Plan the logical cores of every group in a ProcessNode tree or agent built on a graph.GraphNet. Units larger than a
+core are split into slices starting at multiples of granularity nodes.
+Returns a report with the core of every unit ('assignment', by unit name), the core of each group or of each of its
+nodes ('group_cores', by group id), the occupancy of each core, the units left to the compiler, and the number of
+synapses which cross between cores ('cut_synapses').
+"""
+def plan_placement(root, limits=None, granularity=256):
+    limits = dict(resources.CORE_LIMITS, **(limits or {}))
+    network = root.network
+    assert isinstance(network, graph.GraphNet), "Placement can only be planned for networks built as a graph.GraphNet."
+
+    names = {}
+    for (path, node) in [('', root)] + resources.walk_blocks(root):
+        prefix = path + '/' if path else ''
+        for (key, neuron) in getattr(node, 'neurons', {}).items():
+            names[neuron.soma.id] = prefix + key
+        for (key, group) in getattr(node, 'compartments', {}).items():
+            names.setdefault(group.id, prefix + key)
+
+    units, unplaced_units, node_unit, indices = get_units(network, names, limits, granularity)
+    counts = get_unit_synapses(network, node_unit, indices)
+    weights = get_unit_weights(units, counts)
+
+    assignment = {}
+    cores = {}
+
+    #units with a fixed core keep it
+    for unit in units:
+        if unit['fixed'] is not None:
+            if unit['fixed'] not in cores:
+                cores[unit['fixed']] = new_core(unit['fixed'], unit['noise'])
+            add_unit(cores[unit['fixed']], unit, assignment)
+
+    free = [unit['id'] for unit in units if unit['fixed'] is None]
+
+    next_core = max(list(cores.keys()) + [-1]) + 1
+    remaining = set(free)
+
+    while remaining:
+        #seed a new core with the remaining unit which is most strongly connected to the other remaining units
+        candidates = sorted(remaining)
+        strength = weights[np.ix_(candidates, candidates)].sum(axis=1)
+        seed = units[candidates[int(np.argmax(strength))]]
+
+        core = new_core(next_core, seed['noise'])
+        cores[next_core] = core
+        next_core += 1
+        add_unit(core, seed, assignment)
+        remaining.discard(seed['id'])
+
+        #grow the core with the units it exchanges the most synapses with, then fill it with unconnected units
+        while True:
+            compatible = [i for i in remaining if units[i]['noise'] == core['noise'] and fits(core, units[i], limits)]
+            if not compatible:
+                break
+            affinity = weights[np.ix_(compatible, core['units'])].sum(axis=1)
+            best = compatible[int(np.argmax(affinity))]
+            add_unit(core, units[best], assignment)
+            remaining.discard(best)
+
+    #count the synapses which have to cross between cores (or to/from compartments left to the compiler)
+    cut = sum([count for ((i, j), count) in counts.items() if i < 0 or j < 0 or assignment[i] != assignment[j]])
+    total = sum(counts.values())
+
+    #the core of every node of each placed group, as a single core if they share one
+    group_cores = {}
+    for group in network.compartmentGroups:
+        nodes = node_unit[group.id]
+        if len(nodes) == 0 or np.any(nodes < 0):
+            continue
+        node_cores = np.array([assignment[i] for i in nodes], dtype=int)
+        group_cores[group.id] = int(node_cores[0]) if np.all(node_cores == node_cores[0]) else node_cores
+
+    unplaced = [unit['name'] for unit in unplaced_units]
+    noisy = [unit['name'] for unit in unplaced_units if unit['noise'] is not None]
+    if noisy:
+        warnings.warn("Noisy groups left to the compiler may share cores with noise-free logic: " + ", ".join(noisy))
+
+    report = {'assignment': {units[i]['name']: core for (i, core) in assignment.items()},
+                'group_cores': group_cores,
+                'cores': [dict(cores[c], units=[units[i]['name'] for i in cores[c]['units']]) for c in sorted(cores)],
+                'unplaced': unplaced,
+                'cut_synapses': cut,
+                'total_synapses': total}
+
+    return report
+
+"""
+Apply a placement plan to the graph IR. The planned logical core (or the core of each node of a split group)
+replaces the prototypes' logicalCoreId when the graph is materialized.
+"""
+def apply_placement(root, report):
+    groups = {g.id: g for g in root.network.compartmentGroups}
+    for (group_id, core) in report['group_cores'].items():
+        groups[group_id].logicalCore = core
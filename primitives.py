@@ -1,10 +1,25 @@
 from abc import ABC, abstractmethod
-import os
 import prototypes
-import nxsdk.api.n2a as nx
+import graph
+try:
+    import nxsdk.api.n2a as nx
+except ImportError:
+    #without nxsdk, networks can still be built as the backend-agnostic graph IR
+    import graph as nx
 import numpy as np
-import re
+from collections import OrderedDict
 from functools import reduce
+import masks
+from masks import IdentityMask, FullMask, AxisMask, BroadcastMask, SparseMask
+from masks import sparse_mask, get_projection, shape_key
+
+"""
+Return the module which provides the prototypes for a network: the graph IR for a GraphNet, otherwise nxsdk.
+"""
+def get_backend(network):
+    if isinstance(network, graph.GraphNet):
+        return graph
+    return nx
 
 """
 Abstract class which declares the functions and parameters which all nodes in the spiking computation graph
@@ -17,6 +32,8 @@ class ProcessNode(ABC):
         self.shape = shape
         self.numNodes = np.prod(shape)
         self.logicalCore = logicalCore
+        #module used to create prototypes compatible with the network
+        self.nx = get_backend(network)
 
         self.compartments = {}
         self.connections = {}
@@ -24,7 +41,7 @@ class ProcessNode(ABC):
         self.stubs = {}
 
     def _create_prototypes(self, **kwargs):
-        self.prototypes = prototypes.create_prototypes(logicalCoreId=self.logicalCore, **kwargs)
+        self.prototypes = prototypes.create_prototypes(logicalCoreId=self.logicalCore, backend=self.nx, **kwargs)
 
     #Returns the shape of the node
     def get_shape(self):
@@ -150,7 +167,7 @@ class TrackerNode(ProcessNode):
         self.dynrange = kwargs.get("dynrange", 1)
         
         self._create_prototypes()
-        self.tracker_prototypes = prototypes.create_prototypes(noisy=self.noisy, vth=self.vth*self.dynrange, synscale=self.dynrange)
+        self.tracker_prototypes = prototypes.create_prototypes(noisy=self.noisy, vth=self.vth*self.dynrange, synscale=self.dynrange, backend=self.nx)
         self._create_compartments()
         self._create_connections()
 
@@ -214,7 +231,7 @@ class AndNode(ProcessNode):
         self.numInputs = kwargs.get("numInputs", 2)
         self._create_prototypes()
         and_weight = int(self.prototypes['vth'] / self.numInputs) + 1
-        self.prototypes['s_prototypes']['andconn'] = nx.ConnectionPrototype(weight=and_weight)
+        self.prototypes['s_prototypes']['andconn'] = self.nx.ConnectionPrototype(weight=and_weight)
         self._create_compartments()
     
     def _create_compartments(self):
@@ -295,7 +312,7 @@ class RingOscNode(ProcessNode):
         startupCycles=2
         starterThMant = selfBiasMant*startupCycles-1
 
-        self.prototypes['c_prototypes']['starterProto'] = nx.CompartmentPrototype(vThMant=starterThMant,
+        self.prototypes['c_prototypes']['starterProto'] = self.nx.CompartmentPrototype(vThMant=starterThMant,
                                     biasMant=selfBiasMant,
                                     biasExp=6,
                                     functionalState=2,
@@ -305,7 +322,7 @@ class RingOscNode(ProcessNode):
                                     **prototypes.noise_kwargs)
             
 
-        self.prototypes['s_prototypes']['starterInhConn'] = nx.ConnectionPrototype(weight=-selfBiasMant)
+        self.prototypes['s_prototypes']['starterInhConn'] = self.nx.ConnectionPrototype(weight=-selfBiasMant)
     
     def _create_compartments(self):
         #create the starter compartment
@@ -321,19 +338,20 @@ class RingOscNode(ProcessNode):
 
     def _create_connections(self):
         #create the connection from the starter to the responder group's first element
-        startMask = np.zeros((self.numNodes,1))
-        startMask[0,0] = 1
+        startMask = SparseMask([0], [0], (self.numNodes, 1))
 
-        self.connections['start_to_resp'] = self.compartments['starter'].connect(self.compartments['responder'],
-                                    connectionMask=startMask,
-                                    prototype=self.prototypes['s_prototypes']['spkconn'])
+        self.connections['start_to_resp'] = connect_mask(self.compartments['starter'],
+                                    self.compartments['responder'],
+                                    self.prototypes['s_prototypes']['spkconn'],
+                                    startMask)
 
         #create the connection from one responder to the next, starting with the first to the second and looping the last to first
-        responderMask = np.diag(np.ones(self.numNodes-1),-1)
-        responderMask[0,-1] = 1
-        self.connections['responder_series'] = self.compartments['responder'].connect(self.compartments['responder'],
-                                    connectionMask=responderMask,
-                                    prototype=self.prototypes['s_prototypes']['spkconn'])
+        responders = np.arange(self.numNodes)
+        responderMask = SparseMask(np.roll(responders, -1), responders, (self.numNodes, self.numNodes))
+        self.connections['responder_series'] = connect_mask(self.compartments['responder'],
+                                    self.compartments['responder'],
+                                    self.prototypes['s_prototypes']['spkconn'],
+                                    responderMask)
 
 
         #wire starter & all responders to the summator
@@ -424,7 +442,7 @@ class FollowerNode(ProcessNode):
 
         self._create_prototypes()
         self._create_blocks()
-        self.prototypes['s_prototypes']['delay_conn'] = nx.ConnectionPrototype(weight=self.blocks['tracker'].get_synproto().weight, delay=1)
+        self.prototypes['s_prototypes']['delay_conn'] = self.nx.ConnectionPrototype(weight=self.blocks['tracker'].get_synproto().weight, delay=1)
         self._connect_blocks()
 
     def _create_blocks(self):
@@ -509,23 +527,92 @@ class AveragePoolNode(ProcessNode):
 
 # -- CONNECTIVITY -- #
 
+"""
+Least-recently-used cache of connection masks shared by all connectors. Masks are keyed by the connector which built
+them along with the shapes and axes of the connection, so agents with repeated shapes (or rebuilt in a sweep) reuse a
+single mask descriptor (and its single read-only materialized matrix) instead of recomputing it.
+"""
+class MaskCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    #Return the mask stored under key, building and storing it with build() if it is not present
+    def get(self, key, build):
+        if key in self.masks:
+            self.hits += 1
+            self.masks.move_to_end(key)
+            return self.masks[key]
+
+        self.misses += 1
+        mask = build()
+        if self.maxsize > 0:
+            self.masks[key] = mask
+            #evict the least recently used masks once over the size bound
+            while len(self.masks) > self.maxsize:
+                self.masks.popitem(last=False)
+
+        return mask
+
+    def clear(self):
+        self.masks.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.masks) > max(self.maxsize, 0):
+            self.masks.popitem(last=False)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.masks), 'maxsize': self.maxsize}
+
+mask_cache = MaskCache()
+
+def get_mask_cache_info():
+    return mask_cache.info()
+
+def clear_mask_cache():
+    mask_cache.clear()
+
+def set_mask_cache_size(maxsize):
+    mask_cache.resize(maxsize)
+
 def get_dim(object):
     if hasattr(object, "numNodes"):
         return object.numNodes
     elif hasattr(object, "numPorts"):
         return object.numPorts
 
+"""
+Connect a source to a target with the connectivity described by a mask descriptor. The descriptor is passed through
+to networks which understand descriptors, and otherwise only converted to a matrix here at the backend boundary
+(and to a dense array only if the source declares requiresDenseMasks).
+"""
+def connect_mask(source, target, prototype, mask):
+    if getattr(source, "acceptsMaskDescriptors", False):
+        return source.connect(target, prototype=prototype, connectionMask=mask)
+
+    backend_mask = masks.to_backend(mask, dense=getattr(source, "requiresDenseMasks", False))
+    if backend_mask is None:
+        return source.connect(target, prototype=prototype)
+
+    return source.connect(target,
+                        prototype=prototype,
+                        connectionMask=backend_mask)
+
 """
 Connect each neuron in the source to a single corresponding neuron in the destination.
 (1 -> 1), (2 -> 2), ... , (n -> n)
 """
 def connect_one_to_one(source, target, prototype):
     assert get_dim(source) == get_dim(target), "Must have equal number of nodes to connect one-to-one."
-    mask = np.identity(target.numNodes)
+    n = int(target.numNodes)
+    mask = mask_cache.get(('one_to_one', (n,), (n,), ()), lambda: IdentityMask(n))
 
-    return source.connect(target,
-                        prototype=prototype,
-                        connectionMask=mask)
+    return connect_mask(source, target, prototype, mask)
 
 """
 Connect two-dimensional nodes along a single axis. **DEPRECATED**
@@ -542,87 +629,49 @@ Usually done to map connections to an AND block with multiple inputs.
 def dense_along_axis(source, source_shape, source_axis, target, target_shape, target_axis, prototype):
     assert source_shape[source_axis] == target_shape[target_axis], "Shapes must match along axis to be expanded:" + str(source_shape) + str(target_shape)
 
-    len_dim = source_shape[source_axis]
-    source_dims = len(source_shape)
-    source_len = np.prod(source_shape)
-    target_dims = len(target_shape)
-    target_len = np.prod(target_shape)
-    
-    connections = []
-    
-    for i in range(len_dim):
-        source_tensor = np.zeros(source_shape)
-        target_tensor = np.zeros(target_shape)
-    
-        #select all the elements we want to connect (everything along the current slice)
-        source_fill = [slice(None, None, None) for j in range(source_dims)]
-        source_fill[source_axis] = i
-        source_tensor[tuple(source_fill)] = 1
-        
-        #do the same for the target
-        target_fill = [slice(None, None, None) for j in range(target_dims)]
-        target_fill[target_axis] = i
-        target_tensor[tuple(target_fill)] = 1
-        
-        #construct the tensor product of these connections and reshape to adj matrix
-        product = np.tensordot(source_tensor, target_tensor, axes=0)
-        product = product.reshape(source_len, target_len)
-        connections.append(product)
-        
-    mask = reduce(np.add, connections).transpose()
-    return source.connect(target,
-                        prototype=prototype,
-                        connectionMask=mask)
+    key = ('dense_along_axis', shape_key(source_shape), shape_key(target_shape), (source_axis, target_axis))
+    mask = mask_cache.get(key, lambda: AxisMask(source_shape, source_axis, target_shape, target_axis))
+
+    return connect_mask(source, target, prototype, mask)
         
 
 """
 Generate an adjacency matrix which generates the adjacencies required to connect all elements of tensor's projection
 to all of its higher-order elements along the projected axis.
-"""
-def get_adjacency(shape, axis):
-    dims = len(shape)
-    new_dims = dims - 1
-    new_shape = np.delete(np.array(shape), axis)
-    new_basis = np.flip(np.cumprod(np.flip(new_shape, axis=0)), axis=0)
-    new_basis = np.concatenate((new_basis[1:],[1]))
 
+The adjacency can be returned as a dense matrix, a sparse matrix, or the (row, col) index arrays of its non-zero elements.
+"""
+def get_adjacency(shape, axis, output="dense"):
     n = np.prod(shape)
-    n_proj = np.prod(new_shape)
-    projections = np.zeros(n, dtype=np.int)
-
-    #store how the projected axes map to old axes
-    proj_map = {}
-    for i in range(new_dims):
-        proj_map[i] = i + 1 if i >= axis else i
+    n_proj = np.prod(np.delete(np.array(shape), axis))
 
-    #for each element in the original tensor
-    coords = np.unravel_index(np.arange(0, n), shape)
-    #find its embedding in the projected tensor
-    for i in range(new_dims):
-        projections += (coords[proj_map[i]] * new_basis[i])
+    #each element of the original tensor is adjacent to its embedding in the projected tensor
+    rows = np.arange(n)
+    cols = get_projection(shape, axis)
 
-    #use the original index and projected index to set adjacency elements
-    adjacency = np.zeros((n, n_proj), dtype=np.int)
-    for i in range(n):
-        adjacency[i,projections[i]] = 1
-
-    return adjacency
+    if output == "indices":
+        return rows, cols
+    elif output == "sparse":
+        return sparse_mask(rows, cols, (n, n_proj))
+    else:
+        assert output == "dense", "Adjacency output must be one of dense, sparse or indices."
+        adjacency = np.zeros((n, n_proj), dtype=int)
+        adjacency[rows, cols] = 1
+        return adjacency
 
 """
 Project all source's compartments along an axis to a single compartment on the target.
 Used to reduce averages, etc. 
 """
 def project_along_axis(source, source_shape, source_axis, target, target_shape, prototype):
-    dims = len(source_shape)
-    new_dims = dims - 1
     new_shape = np.delete(np.array(source_shape), source_axis)
     
     assert target_shape == tuple(new_shape), "Target shape does not match shape of source projected along requested axis."
     
-    mask = get_adjacency(source_shape, source_axis).transpose()
-    return source.connect(target,
-                        prototype=prototype,
-                        connectionMask=mask)
+    #each projected element receives from all the elements along the axis
+    key = ('project_along_axis', shape_key(source_shape), shape_key(target_shape), (source_axis,))
+    mask = mask_cache.get(key, lambda: BroadcastMask(source_shape, source_axis, expand=False))
+    return connect_mask(source, target, prototype, mask)
         
 """
 Project a source's compartments to all elements along a target axis in the target.
@@ -633,10 +682,9 @@ def expand_along_axis(source, source_shape, target, target_shape, target_axis, p
     shape_check = tuple(np.delete(np.array(target_shape), target_axis))
     assert source_shape == shape_check, "Target shape must be the same as source shape except for the addition of a single axis the source is expanding over."
 
-    mask = get_adjacency(target_shape, target_axis)
-    return source.connect(target,
-                        prototype=prototype,
-                        connectionMask=mask)
+    key = ('expand_along_axis', shape_key(source_shape), shape_key(target_shape), (target_axis,))
+    mask = mask_cache.get(key, lambda: BroadcastMask(target_shape, target_axis, expand=True))
+    return connect_mask(source, target, prototype, mask)
 
 
 """
@@ -646,4 +694,5 @@ Create all-to-all connections between two nodes.
                 ... , (n->n)
 """
 def connect_full(source, target, prototype):
-    return source.connect(target, prototype=prototype)
+    mask = FullMask(get_dim(target), get_dim(source))
+    return connect_mask(source, target, prototype, mask)
@@ -3,15 +3,79 @@ File which stores the prototypes required for most of the more advanced construc
 and reduces the chance of conflicting parameters being set in different files (e.g. different levels of noise on a 
 single logical core). 
 
-
+Prototype sets are interned by their parameters, so every node built with the same settings shares the same prototype
+objects, within one network and across networks (e.g. agents rebuilt in a parameter sweep). The shared prototypes are
+read-only: setting a parameter or adding a dendrite raises an AssertionError. Nodes receive their own copy of the
+dictionaries holding the prototypes, which they are free to extend with new, node-specific prototypes (copy on
+extend), so a node never changes the prototypes of another. The interned sets are kept in a module-wide cache by
+default, which create_prototypes can be given in its place to scope the sharing (e.g. one cache per network).
 """
-import nxsdk.api.n2a as nx
+try:
+    import nxsdk.api.n2a as nx
+except ImportError:
+    #without nxsdk, networks can still be built as the backend-agnostic graph IR
+    import graph as nx
 
 noise_kwargs = {'randomizeVoltage' : 1,
                     'noiseMantAtCompartment': 0,
                     'noiseExpAtCompartment' : 10}
 
-def create_prototypes(vth=255, logicalCoreId=-1, noisy=0, synscale=1):
+#interned prototype sets, keyed by the parameters they were created with
+_prototype_cache = {}
+#read-only subclass of each prototype class, created when its first prototype is interned
+_frozen_classes = {}
+
+"""
+Return the prototype set for the given parameters, built once per cache (by default the module-wide one) and shared
+as read-only prototypes. The backend is the module providing the prototype classes (nxsdk, or graph for networks
+built as the IR).
+"""
+def create_prototypes(vth=255, logicalCoreId=-1, noisy=0, synscale=1, backend=nx, cache=None):
+    cache = _prototype_cache if cache is None else cache
+    key = (vth, logicalCoreId, int(noisy), synscale, backend.__name__)
+    if key not in cache:
+        cache[key] = _build_prototypes(vth, logicalCoreId, noisy, synscale, backend)
+        for group in ['c_prototypes', 'n_prototypes', 's_prototypes']:
+            for proto in cache[key][group].values():
+                freeze_prototype(proto)
+
+    #copy the dictionaries so nodes can add their own prototypes without altering the shared set
+    interned = cache[key]
+    prototypes = {'vth': interned['vth']}
+    for group in ['c_prototypes', 'n_prototypes', 's_prototypes']:
+        prototypes[group] = dict(interned[group])
+
+    return prototypes
+
+"""
+Make a prototype read-only in place, by switching it to a subclass of its class which refuses to set parameters or
+add dendrites. Being a subclass, it is still accepted wherever its backend expects the original class; attributes
+starting with an underscore stay writable for the backend's own bookkeeping.
+"""
+def freeze_prototype(proto):
+    cls = type(proto)
+    if cls in _frozen_classes.values():
+        return proto
+
+    if cls not in _frozen_classes:
+        def __setattr__(self, name, value):
+            assert name.startswith('_'), "Interned prototypes are shared and read-only; create a new prototype to change " + name + "."
+            cls.__setattr__(self, name, value)
+
+        def addDendrite(self, *args, **kwargs):
+            assert False, "Interned prototypes are shared and read-only; create a new prototype to add a dendrite."
+
+        _frozen_classes[cls] = type('Frozen' + cls.__name__, (cls,), {'__setattr__': __setattr__, 'addDendrite': addDendrite})
+
+    proto.__class__ = _frozen_classes[cls]
+    return proto
+
+#Discard all interned prototype sets, so the nodes built next get new prototype objects (e.g. before building a
+#network with changed prototype definitions)
+def clear_prototype_cache():
+    _prototype_cache.clear()
+
+def _build_prototypes(vth, logicalCoreId, noisy, synscale, nx):
     prototypes = {}
     prototypes['vth'] = vth
     
@@ -0,0 +1,277 @@
+"""
+Static resource estimates for networks built from ProcessNodes, computed from the graph IR before anything is compiled.
+
+The estimator walks a ProcessNode tree (or an agent's blocks) built on a graph.GraphNet and counts the compartments of
+every block, the synapses, fan-in and fan-out of every connection, and the input/output axons these imply. It then
+packs the compartments onto cores in creation order, much like the compiler does for groups without a fixed logical
+core, to estimate how many cores a configuration needs and how full each one is. Everything is derived from the mask
+descriptors, so even large agents are estimated in milliseconds and oversize configurations can be rejected before any
+board time is spent.
+
+The per-core limits are approximate: synapse memory in particular depends on how the compiler encodes the weights.
+"""
+import numpy as np
+import graph
+from agent import FullAgent
+from primitives import ProcessNode
+
+#approximate capacity of a single Loihi neuro-core
+CORE_LIMITS = {'compartments': 1024,
+                'synapses': 65536,
+                'input_axons': 4096,
+                'output_axons': 4096}
+
+#number of neuro-cores on a single chip
+CHIP_CORES = 128
+
+"""
+Return the ProcessNodes directly below a node (its blocks) or, for an agent, the ProcessNodes it holds.
+"""
+def get_children(node):
+    if hasattr(node, 'blocks'):
+        return dict(node.blocks)
+    elif not isinstance(node, ProcessNode):
+        return {k: v for (k, v) in vars(node).items() if isinstance(v, ProcessNode)}
+    return {}
+
+"""
+Walk a ProcessNode tree and return (block name, node) pairs for every node in it, parents before children.
+"""
+def walk_blocks(root, prefix=''):
+    blocks = []
+    for (name, child) in get_children(root).items():
+        path = prefix + name
+        blocks.append((path, child))
+        blocks.extend(walk_blocks(child, path + '/'))
+    return blocks
+
+"""
+Return every IR compartment group created directly by a node (including all compartments of its neurons).
+"""
+def get_groups(node):
+    groups = []
+    for neuron in node.neurons.values():
+        groups.extend(neuron.compartmentGroups)
+    for group in node.compartments.values():
+        if group.neuron is None:
+            groups.append(group)
+    return groups
+
+"""
+Return (name, IR connection) pairs for every named connection of a node or agent.
+"""
+def get_connections(node, prefix=''):
+    named = []
+    for (name, connection) in getattr(node, 'connections', {}).items():
+        if isinstance(connection, list):
+            named.extend([(prefix + name + '[' + str(i) + ']', c) for (i, c) in enumerate(connection)])
+        else:
+            named.append((prefix + name, connection))
+    return named
+
+"""
+Return the block path which created each IR compartment group (keyed by group id) and the name of each IR connection
+(keyed by connection id) for a ProcessNode tree or agent. Groups are attributed to the deepest block which created them.
+"""
+def get_owners(root):
+    owner = {}
+    connection_names = {}
+    for (path, node) in [('', root)] + walk_blocks(root):
+        if isinstance(node, ProcessNode):
+            for group in get_groups(node):
+                owner[group.id] = path
+        prefix = path + '/' if path else ''
+        for (name, connection) in get_connections(node, prefix):
+            connection_names[connection.id] = name
+
+    return owner, connection_names
+
+"""
+Return the number of input axons a connection needs: one for every source node with at least one synapse.
+"""
+def get_axons(connection):
+    return int(np.count_nonzero(connection.mask.fan_out()))
+
+"""
+Return the resources used by each IR compartment group (keyed by group id). Synapses and input axons are held by the
+core of a connection's target, output axons by the core of its source.
+"""
+def get_group_usage(network):
+    usage = {g.id: {'compartments': g.size, 'synapses': 0, 'input_axons': 0, 'output_axons': 0}
+                for g in network.compartmentGroups}
+
+    for connection in network.connectionGroups:
+        axons = get_axons(connection)
+        usage[connection.target.id]['synapses'] += connection.mask.nnz
+        usage[connection.target.id]['input_axons'] += axons
+        if isinstance(connection.source, graph.CompartmentGroup):
+            usage[connection.source.id]['output_axons'] += axons
+
+    return usage
+
+"""
+Pack compartment groups onto cores in order, splitting groups which do not fit in the remaining space of a core.
+Returns the per-core occupancy (compartments, synapses, input and output axons).
+"""
+def pack_cores(groups, limits):
+    cores = []
+    core = None
+
+    for group in groups:
+        remaining = group['compartments']
+        if remaining == 0:
+            continue
+
+        #spread the group's synapses and axons over the cores in proportion to its compartments
+        per_cx = {key: group[key] / group['compartments'] for key in ['synapses', 'input_axons', 'output_axons']}
+
+        while remaining > 0:
+            if core is None or core['compartments'] >= limits['compartments']:
+                core = {'compartments': 0, 'synapses': 0, 'input_axons': 0, 'output_axons': 0}
+                cores.append(core)
+
+            #fill the core up to whichever of its limits is reached first
+            space = limits['compartments'] - core['compartments']
+            for key in per_cx:
+                if per_cx[key] > 0:
+                    space = min(space, int((limits[key] - core[key]) / per_cx[key]))
+
+            if space <= 0:
+                #a compartment which alone exceeds a core's limits still gets a (overfull) core of its own
+                if core['compartments'] == 0:
+                    space = 1
+                else:
+                    core = None
+                    continue
+
+            n = min(space, remaining)
+            core['compartments'] += n
+            for key in per_cx:
+                core[key] += per_cx[key] * n
+            remaining -= n
+
+    for core in cores:
+        for key in ['synapses', 'input_axons', 'output_axons']:
+            core[key] = int(np.ceil(core[key]))
+
+    return cores
+
+"""
+Estimate the resources used by a ProcessNode tree or agent built on a graph.GraphNet. Returns a dictionary report
+with per-block and per-connection counts, totals, the estimated per-core occupancy, and whether the network fits in
+the given number of chips.
+"""
+def estimate_resources(root, limits=None, n_chips=1):
+    limits = dict(CORE_LIMITS, **(limits or {}))
+    network = root.network
+    assert isinstance(network, graph.GraphNet), "Resources can only be estimated for networks built as a graph.GraphNet."
+
+    owner, connection_names = get_owners(root)
+
+    block_report = {}
+    def block_entry(path):
+        if path not in block_report:
+            block_report[path] = {'compartments': 0, 'groups': 0, 'synapses': 0, 'input_axons': 0, 'output_axons': 0}
+        return block_report[path]
+
+    for group in network.compartmentGroups:
+        entry = block_entry(owner.get(group.id, ''))
+        entry['compartments'] += group.size
+        entry['groups'] += 1
+
+    connection_report = {}
+    for connection in network.connectionGroups:
+        mask = connection.mask
+        fan_in = mask.fan_in()
+        fan_out = mask.fan_out()
+        #each source compartment with synapses needs an input axon on the target's core and an output axon to reach it
+        axons = get_axons(connection)
+        name = connection_names.get(connection.id, 'connection_' + str(connection.id))
+
+        connection_report[name] = {'synapses': mask.nnz,
+                                    'max_fan_in': int(fan_in.max()) if len(fan_in) else 0,
+                                    'mean_fan_in': float(fan_in.mean()) if len(fan_in) else 0.0,
+                                    'max_fan_out': int(fan_out.max()) if len(fan_out) else 0,
+                                    'mean_fan_out': float(fan_out.mean()) if len(fan_out) else 0.0,
+                                    'axons': axons,
+                                    'delay': int(connection.prototype.delay)}
+
+        #synapses and input axons are held by the core of the target, output axons by the core of the source
+        target_entry = block_entry(owner.get(connection.target.id, ''))
+        target_entry['synapses'] += mask.nnz
+        target_entry['input_axons'] += axons
+
+        if isinstance(connection.source, graph.CompartmentGroup):
+            block_entry(owner.get(connection.source.id, ''))['output_axons'] += axons
+
+    group_usage = get_group_usage(network)
+    cores = pack_cores([group_usage[g.id] for g in network.compartmentGroups], limits)
+
+    totals = {'compartments': network.numCompartments,
+                'synapses': network.numSynapses,
+                'input_axons': sum([c['axons'] for c in connection_report.values()]),
+                'stub_ports': sum([s.size for s in network.stubGroups]),
+                'groups': len(network.compartmentGroups),
+                'connections': len(network.connectionGroups),
+                'cores': len(cores)}
+
+    report = {'blocks': block_report,
+                'connections': connection_report,
+                'cores': cores,
+                'totals': totals,
+                'limits': limits,
+                'fits': len(cores) <= n_chips * CHIP_CORES}
+
+    return report
+
+"""
+Estimate the resources of a FullAgent configuration without hardware by building its blocks as a graph IR.
+kwargs are passed on to the agent (e.g. n_replicates, dynrange, noisy). To estimate a specific agent (e.g. a
+BlackjackAgent), build it with network=graph.GraphNet() and pass it to estimate_resources.
+"""
+def estimate_agent(n_actions, n_states, limits=None, n_chips=1, **kwargs):
+    kwargs['network'] = graph.GraphNet()
+    agent = EstimateAgent(n_actions, n_states, **kwargs)
+
+    return estimate_resources(agent, limits, n_chips)
+
+"""
+Format a resource report as a human-readable table.
+"""
+def format_report(report):
+    lines = []
+    totals = report['totals']
+    lines.append("Compartments: {compartments}  Synapses: {synapses}  Input axons: {input_axons}  Cores: {cores}".format(**totals))
+    lines.append("{:<40}{:>14}{:>12}{:>12}".format("Block", "Compartments", "Synapses", "Axons in"))
+    for (name, block) in sorted(report['blocks'].items()):
+        lines.append("{:<40}{:>14}{:>12}{:>12}".format(name or '(root)', block['compartments'], block['synapses'], block['input_axons']))
+
+    lines.append("{:<40}{:>14}{:>12}{:>12}".format("Connection", "Synapses", "Max fan-in", "Max fan-out"))
+    for (name, connection) in report['connections'].items():
+        lines.append("{:<40}{:>14}{:>12}{:>12}".format(name, connection['synapses'], connection['max_fan_in'], connection['max_fan_out']))
+
+    fullest = max([c['compartments'] for c in report['cores']] + [0])
+    lines.append("Fullest core: {} / {} compartments. Fits: {}".format(fullest, report['limits']['compartments'], report['fits']))
+    return "\n".join(lines)
+
+"""
+Minimal FullAgent with only the common blocks, used to estimate the resources of a configuration.
+"""
+class EstimateAgent(FullAgent):
+    def _create_channels(self):
+        pass
+
+    def _create_SNIPs(self):
+        pass
+
+    def _send_config(self):
+        pass
+
+    def _record_fields(self):
+        return []
+
+    def get_data(self, n_epochs, final=True, out=None):
+        pass
+
+    def set_params_file(self):
+        pass
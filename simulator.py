@@ -0,0 +1,711 @@
+"""
+Vectorized CPU simulation of networks built from ProcessNodes as a graph IR (see graph.py).
+
+All compartments of the network are flattened into arrays of state (current u, voltage v) and parameters taken from
+their prototypes, ordered by their depth in their neuron's dendritic tree so that each depth is a contiguous slice.
+A timestep then updates every compartment with a handful of array operations, deepest compartments first, so the
+outputs of dendrites are joined into their parents in the same step as on Loihi:
+
+    u = u * (4096 - compartmentCurrentDecay) / 2^12 + synaptic input + (ADD joins: voltage of the child compartments)
+    v = v * (4096 - compartmentVoltageDecay) / 2^12 + u + biasMant * 2^biasExp
+    spike when v > vThMant * 2^6
+
+By default the compartment arithmetic is fixed point: state, parameters and synaptic input are int32, decays truncate
+toward zero as on the chip, currents saturate at 24 bits and noise is scaled with shifts, with no float arithmetic in
+a step. fixed_point=False simulates the same model in float64, which drifts from the board where decays round.
+Synaptic weight precision is not modeled: weights are used as given (scaled and truncated to integers), whereas the
+chip keeps only numWeightBits bits of each weight, one of them the sign in the mixed signMode. Networks whose weights
+need more precision than that (e.g. odd weights, or learned and rescaled weights) are therefore not reproduced bit
+for bit; weights which fit are.
+
+The threshold behaviours used by the prototypes are 0 (spike and reset v to 0), 2 (spike without resetting, the
+reset being done through a synapse) and 3 (never spike, only pass v on to the parent). OR joins make a parent spike
+when any of its OR-joined children spiked. Voltages saturate at 2^vMaxExp / -2^vMinExp. Compartments are updated
+every timestep, so the idle functional state (functionalState=2, which keeps a compartment driven only by its bias
+updating on Loihi) behaves as the default state.
+
+Noise is drawn from a counter-based generator (NoiseGenerator): each value is a hash of the seed, timestep,
+batch element and compartment, so runs are reproducible and a batch can be split across simulators (batch_offset)
+without changing any copy's noise.
+
+Synaptic weights are scaled by 2^(6 + weightExponent), and a spike emitted at timestep t arrives at the target at
+timestep t + 1 + delay. Spikes sent to input stubs with inject() arrive in the following step (plus the delay).
+Spikes are propagated by gathering the synapses of the sources which spiked from per-delay CSR matrices into a ring
+buffer holding the input of each coming timestep, so a step costs O(spikes x fan-out) rather than a matrix-vector
+product over the whole network. get_throughput() reports the synaptic events processed per second. When numba is
+installed, fixed-point simulations run each step as a single compiled kernel (kernels.py) with the same results;
+jit=False forces the NumPy step.
+
+With macro_step=True, run() skips through steady states in closed form. This is a narrow optimization, off by default
+(here and in emulation.compile), for noise-free networks which sit idle for long stretches between inputs. Between
+inputs such a network can settle into a cycle of some period P in which the spikes, currents and synaptic input repeat exactly and voltages change by
+a constant amount d each period (the counters integrating, trackers drifting). Once the recorded steps show such a
+cycle, the simulator advances k periods at once (v += k * d) for the largest k in which no drifting voltage crosses its
+threshold or saturates, so every step skipped would have spiked exactly as the last period did, then resumes
+stepping. Inputs and voltages written from outside (inject, set_voltage, interrupt) restart the search, so feedback
+events are always simulated step by step. Macro steps are exact and only used for noiseless fixed-point simulations
+without probes. Noise cannot be skipped over, so networks with any noisy compartments (the trackers of a MultiCortex,
+used by agents with n_replicates > 1, or of agents built with noisy=True) are always stepped one timestep at a time.
+Even without noise the gain on the emulated tasks is small: the trackers keep firing out of phase with each other
+between inputs, so only about 1k-1.5k of the 25k-50k steps of a bandit or blackjack run are skipped (1-7% faster),
+which barely pays for recording and hashing the state after every step. Isolated epochs of an untrained network skip
+most of their steps.
+"""
+import time
+from collections import deque
+import numpy as np
+from scipy import sparse
+import graph
+import kernels
+from environments import InstanceRNG
+
+#saturation of the current
+U_MAX = 2**23
+#decays are fractions of 2^12
+DECAY_BITS = 12
+DECAY_MASK = 2**DECAY_BITS - 1
+
+"""
+Scale int32 values by keep / 2^12 in place, truncating toward zero as Loihi does: negative values are biased before
+the shift so it truncates rather than floors. The full decays used by the prototypes (keep 0 and 1) stay in int32;
+other multipliers form the product in int64 (a 24-bit value times a 13-bit multiplier).
+"""
+def decay(x, keep):
+    if keep == 0:
+        x[...] = 0
+        return
+    if keep == 1:
+        x += (x >> 31) & DECAY_MASK
+        x >>= DECAY_BITS
+        return
+
+    product = x.astype(np.int64)
+    product *= keep
+    product += (product >> 63) & DECAY_MASK
+    product >>= DECAY_BITS
+    x[...] = product
+
+#Scale float values by their fraction to keep (for fixed_point=False)
+def scale(x, keep):
+    x *= keep
+
+"""
+Split per-compartment decay multipliers into runs of equal value, as (slice, keep) pairs offset by start, leaving out
+the compartments which do not decay (keep equal to full). The compartments of a group share their prototype, so a
+network has few runs and a step decays each with a scalar.
+"""
+def get_decay_runs(keep, full, start=0):
+    bounds = np.flatnonzero(np.diff(keep)) + 1
+    starts = np.concatenate(([0], bounds)).astype(int)
+    stops = np.concatenate((bounds, [len(keep)])).astype(int)
+    return [(slice(start + a, start + b), keep[a]) for (a, b) in zip(starts, stops) if keep[a] != full]
+
+"""
+Counter-based generator of the compartments' noise. Every value is a hash (splitmix64, as environments.InstanceRNG) of
+the seed, the timestep, the stream (current or voltage noise), the batch element and the compartment, so a step's noise
+is a single vectorized draw and is the same however the batch or the steps are split across simulators, threads or
+processes.
+"""
+class NoiseGenerator:
+    GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+    CURRENT, VOLTAGE = 0, 1
+
+    def __init__(self, seed):
+        self.key = InstanceRNG.mix(np.uint64(seed & (2**64 - 1)))
+
+    #Return the counters of the given batch elements and compartments, which can be reused at every step
+    def get_counters(self, batch, indices):
+        batch = np.asarray(batch, dtype=np.uint64)[:, None] << np.uint64(32)
+        with np.errstate(over='ignore'):
+            return (batch | np.asarray(indices, dtype=np.uint64)[None, :]) * self.GOLDEN
+
+    #Return signed 8-bit random numbers in [-128, 128) for the given counters at timestep t
+    def draw(self, t, stream, counters):
+        with np.errstate(over='ignore'):
+            key = InstanceRNG.mix(self.key + np.uint64(2 * t + stream) * self.GOLDEN)
+            values = InstanceRNG.mix(counters + key)
+        return (values >> np.uint64(56)).astype(np.int32) - 128
+
+"""
+Return the graph IR network of a network, agent or ProcessNode.
+"""
+def get_graph(obj):
+    if isinstance(obj, graph.GraphNet):
+        return obj
+    #agents which have been compiled keep their IR as .graph
+    if isinstance(getattr(obj, 'graph', None), graph.GraphNet):
+        return obj.graph
+    network = getattr(obj, 'network', None)
+    assert isinstance(network, graph.GraphNet), "Only networks built as a graph.GraphNet can be simulated."
+    return network
+
+"""
+Return the depth of a compartment group in its neuron's dendritic tree (0 for the soma or a single compartment).
+"""
+def get_depth(group):
+    depth = 0
+    while group.parent is not None:
+        group = group.parent
+        depth += 1
+    return depth
+
+"""
+Return the positions in a CSR matrix's data of all entries in the given rows, and the number of entries in each row.
+"""
+def gather_rows(indptr, rows):
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=int), lengths
+
+    #offset of each entry from the start of its row
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, lengths
+
+"""
+Records a variable ('spikes', 'voltage' or 'current') of a compartment group at every simulated timestep.
+"""
+class Probe:
+    def __init__(self, variable, indices, batch_size=None):
+        assert variable in ['spikes', 'voltage', 'current'], "Probes can record spikes, voltage or current."
+        self.variable = variable
+        self.indices = indices
+        self.batch_size = batch_size
+        self._data = []
+
+    def record(self, sim):
+        if self.variable == 'spikes':
+            self._data.append(sim.spikes[:, self.indices].copy())
+        elif self.variable == 'voltage':
+            self._data.append(sim.v[:, self.indices].copy())
+        else:
+            self._data.append(sim.u[:, self.indices].copy())
+
+    #The recorded values with shape (compartments, timesteps), or (batch, compartments, timesteps) for batched runs
+    @property
+    def data(self):
+        if len(self._data) == 0:
+            data = np.zeros((self.batch_size or 1, len(self.indices), 0))
+        else:
+            data = np.stack(self._data, axis=-1)
+        return data if self.batch_size is not None else data[0]
+
+    def clear(self):
+        self._data = []
+
+"""
+Simulates a network, or with a batch_size a batch of independent copies of the network which share their
+connectivity and parameters but have their own state and noise. Every state array has a leading batch axis; the
+accessors and probes drop it again when no batch size was given. The state is int32 fixed point (see above) unless
+fixed_point=False, which simulates in float64. A batch split across several simulators gives each the index of its
+first copy as batch_offset, so every copy draws the same noise as in a single simulator.
+"""
+class Simulator:
+    def __init__(self, network, seed=0, batch_size=None, fixed_point=True, batch_offset=0, jit=True,
+                    macro_step=False, max_period=16):
+        self.graph = get_graph(network)
+        self.seed = seed
+        self.batch_size = batch_size
+        self.n_batch = batch_size if batch_size is not None else 1
+        self.batch_offset = batch_offset
+        self.fixed_point = fixed_point
+        self.dtype = np.int32 if fixed_point else np.float64
+        self._decay = decay if fixed_point else scale
+
+        self._layout()
+        self._load_parameters()
+        self._load_dendrites()
+        self._load_synapses()
+        #the compiled kernel implements the fixed-point model only
+        self.jit = jit and fixed_point and kernels.HAVE_NUMBA
+        if self.jit:
+            self._load_kernel()
+        #steady states are only exact without noise, in integer arithmetic
+        noisy = len(self.u_noisy) > 0 or len(self.v_noisy) > 0
+        self.macro_step = macro_step and fixed_point and not noisy
+        self.max_period = max_period
+        self.probes = []
+        self.reset()
+
+    """
+    Order the compartment groups by decreasing depth and assign each a contiguous range of compartments. Stub ports
+    are numbered after the compartments in the space of spike sources.
+    """
+    def _layout(self):
+        groups = self.graph.compartmentGroups
+        depths = [get_depth(g) for g in groups]
+        self.order = sorted(range(len(groups)), key=lambda i: -depths[i])
+
+        self.offsets = {}
+        offset = 0
+        self.levels = []
+        for i in self.order:
+            group = groups[i]
+            if len(self.levels) == 0 or self.levels[-1][0] != depths[i]:
+                self.levels.append([depths[i], offset, offset])
+            self.offsets[group.id] = offset
+            offset += group.size
+            self.levels[-1][2] = offset
+
+        self.n_compartments = offset
+        self.levels = [slice(start, stop) for (depth, start, stop) in self.levels]
+
+        self.stub_offsets = {}
+        for stub in self.graph.stubGroups:
+            self.stub_offsets[stub.id] = offset
+            offset += stub.size
+        self.n_sources = offset
+
+    #Return the compartment (or for stubs, spike source) indices of a group
+    def get_indices(self, group):
+        if isinstance(group, graph.NeuronGroup):
+            group = group.soma
+        if isinstance(group, graph.InputStubGroup):
+            start = self.stub_offsets[group.id]
+        else:
+            start = self.offsets[group.id]
+        return np.arange(start, start + group.size)
+
+    """
+    Expand the parameters of every group's prototype into per-compartment arrays.
+    """
+    def _load_parameters(self):
+        n = self.n_compartments
+        params = {key: np.zeros(n) for key in graph.CompartmentPrototype.defaults}
+
+        for group in self.graph.compartmentGroups:
+            start = self.offsets[group.id]
+            for (key, value) in group.prototype.params.items():
+                params[key][start:start + group.size] = value
+
+        behaviors = set(params['thresholdBehavior'].astype(int))
+        assert behaviors <= {0, 2, 3}, "Unsupported threshold behavior(s): " + str(sorted(behaviors - {0, 2, 3}))
+        states = set(params['functionalState'].astype(int))
+        assert states <= {0, 2}, "Unsupported functional state(s): " + str(sorted(states - {0, 2}))
+
+        #decays are kept as the integer multiplier of 2^-12 in fixed point, or as the fraction itself
+        self.u_keep = 2**DECAY_BITS - params['compartmentCurrentDecay']
+        self.v_keep = 2**DECAY_BITS - params['compartmentVoltageDecay']
+        if not self.fixed_point:
+            self.u_keep, self.v_keep = self.u_keep / 2**DECAY_BITS, self.v_keep / 2**DECAY_BITS
+        self.u_keep = self.u_keep.astype(self.dtype)
+        self.v_keep = self.v_keep.astype(self.dtype)
+        full = 2**DECAY_BITS if self.fixed_point else 1.0
+        self.u_runs = get_decay_runs(self.u_keep, full)
+        self.v_runs = [get_decay_runs(self.v_keep[level], full, level.start) for level in self.levels]
+        self.bias = (params['biasMant'] * 2.0**params['biasExp']).astype(self.dtype)
+        self.vth = (params['vThMant'] * 2.0**6).astype(self.dtype)
+        self.v_min = (-2.0**params['vMinExp']).astype(self.dtype)
+        self.v_max = (2.0**params['vMaxExp'] - 1).astype(self.dtype)
+        self.u_min, self.u_max = self.dtype(-U_MAX), self.dtype(U_MAX - 1)
+
+        behavior = params['thresholdBehavior'].astype(int)
+        self.can_spike = behavior != 3
+        self.resets = behavior == 0
+
+        #noise is drawn as a signed 8-bit random number, offset by the mantissa and scaled by the exponent
+        noisy = params['enableNoise'] > 0
+        self.v_noisy = np.flatnonzero(noisy & (params['randomizeVoltage'] > 0))
+        self.u_noisy = np.flatnonzero(noisy & (params['randomizeCurrent'] > 0))
+        self.noise_offset = (params['noiseMantAtCompartment'] * 2**6).astype(self.dtype)
+        self.noise_shift = (params['noiseExpAtCompartment'] - 7).astype(int)
+        self.noise_scale = 2.0**self.noise_shift
+
+    """
+    Collect the joins between each dendrite and its parent, per level of the dendritic trees.
+    """
+    def _load_dendrites(self):
+        add = {}
+        join_or = {}
+        for group in self.graph.compartmentGroups:
+            if group.parent is None:
+                continue
+            assert group.joinOp.name in ['ADD', 'OR'], "Unsupported dendrite join operation: " + group.joinOp.name
+            joins = add if group.joinOp.name == 'ADD' else join_or
+            depth = get_depth(group)
+            children, parents = joins.setdefault(depth, ([], []))
+            children.append(self.get_indices(group))
+            parents.append(self.get_indices(group.parent))
+
+        def concatenate(joins, depth):
+            if depth not in joins:
+                return None
+            children, parents = joins[depth]
+            children, parents = np.concatenate(children), np.concatenate(parents)
+            #parents with several children of the same kind need an unbuffered accumulation
+            unique = len(np.unique(parents)) == len(parents)
+            return (children, parents, unique)
+
+        #joins from the compartments of each level (deepest first) into their parents
+        depths = sorted(set(get_depth(g) for g in self.graph.compartmentGroups), reverse=True)
+        self.joins = [(concatenate(add, depth), concatenate(join_or, depth)) for depth in depths]
+
+    """
+    Build the synapses of every axonal delay as a CSR matrix indexed by the spike source, so the synapses of the
+    sources which spiked can be gathered directly. Repeated synapses between the same pair of compartments add up.
+    """
+    def _load_synapses(self):
+        entries = {}
+        for connection in self.graph.connectionGroups:
+            proto = connection.prototype
+            rows, cols = connection.mask.indices()
+            rows = self.get_indices(connection.target)[rows]
+            cols = self.get_indices(connection.source)[cols]
+            #weights are truncated to integers in fixed point (their precision, numWeightBits, is not modeled)
+            weight = proto.weight * 2.0**(6 + proto.weightExponent)
+            weight = np.trunc(weight) if self.fixed_point else weight
+
+            rows_list, cols_list, weights = entries.setdefault(int(proto.delay), ([], [], []))
+            rows_list.append(rows)
+            cols_list.append(cols)
+            weights.append(np.full(len(rows), weight))
+
+        self.delays = sorted(entries)
+        self.synapses = {}
+        for (delay, (rows, cols, weights)) in entries.items():
+            matrix = sparse.coo_matrix((np.concatenate(weights), (np.concatenate(cols), np.concatenate(rows))),
+                                        shape=(self.n_sources, self.n_compartments)).tocsr()
+            matrix.sum_duplicates()
+            self.synapses[delay] = (matrix.indptr, matrix.indices, matrix.data.astype(self.dtype))
+
+        self.max_delay = max(self.delays + [0])
+        #input can be scheduled up to 1 + max_delay steps ahead of the step being integrated
+        self.n_slots = self.max_delay + 2
+        self.n_synapses = sum([len(indices) for (indptr, indices, data) in self.synapses.values()])
+
+    """
+    Flatten the levels, dendrite joins and synapses into the arrays taken by the compiled step kernel.
+    """
+    def _load_kernel(self):
+        def flatten(kind):
+            ptr, children, parents = [0], [], []
+            for joins in self.joins:
+                join = joins[kind]
+                if join is not None:
+                    children.append(join[0])
+                    parents.append(join[1])
+                ptr.append(ptr[-1] + (len(join[0]) if join is not None else 0))
+            concatenate = lambda x: np.concatenate(x).astype(np.int64) if x else np.zeros(0, dtype=np.int64)
+            return np.array(ptr, dtype=np.int64), concatenate(children), concatenate(parents)
+
+        levels = np.array([level.start for level in self.levels] + [self.n_compartments], dtype=np.int64)
+        add_ptr, add_children, add_parents = flatten(0)
+        or_ptr, or_children, or_parents = flatten(1)
+
+        #the synapses of all delays share one array of targets and weights, with an index pointer per delay
+        indptr, indices, data = [], [], []
+        offset = 0
+        for delay in self.delays:
+            delay_indptr, delay_indices, delay_data = self.synapses[delay]
+            indptr.append(delay_indptr + offset)
+            indices.append(delay_indices)
+            data.append(delay_data)
+            offset += len(delay_indices)
+        syn_indptr = np.array(indptr, dtype=np.int64).reshape(len(self.delays), self.n_sources + 1)
+        syn_indices = np.concatenate(indices).astype(np.int64) if indices else np.zeros(0, dtype=np.int64)
+        syn_data = np.concatenate(data) if data else np.zeros(0, dtype=self.dtype)
+
+        self.kernel_args = (self.u_keep, self.v_keep, self.bias, self.vth, self.v_min, self.v_max, self.u_min,
+                            self.u_max, self.can_spike, self.resets)
+        self.kernel_joins = (levels, add_ptr, add_children, add_parents, or_ptr, or_children, or_parents)
+        self.kernel_synapses = (np.array(self.delays, dtype=np.int64), syn_indptr, syn_indices, syn_data)
+        self.kernel_joined = np.zeros(self.n_compartments, dtype=bool)
+
+    """
+    Return all compartments to rest, restart the noise generator and clear the throughput counters.
+    """
+    def reset(self):
+        shape = (self.n_batch, self.n_compartments)
+        self.t = 0
+        self.u = np.zeros(shape, dtype=self.dtype)
+        self.v = np.zeros(shape, dtype=self.dtype)
+        self.spikes = np.zeros((self.n_batch, self.n_sources), dtype=bool)
+        self.v_noise = np.zeros(shape, dtype=self.dtype)
+        #ring buffer of the synaptic input arriving in each of the coming timesteps; head holds the next step's input
+        self.ring = np.zeros((self.n_slots,) + shape, dtype=self.dtype)
+        self.head = 0
+        self.noise = NoiseGenerator(self.seed)
+        batch = self.batch_offset + np.arange(self.n_batch)
+        self.u_counters = self.noise.get_counters(batch, self.u_noisy)
+        self.v_counters = self.noise.get_counters(batch, self.v_noisy)
+        self.counters = {'steps': 0, 'spikes': 0, 'synaptic_events': 0, 'macro_steps': 0, 'time': 0.0}
+        #the recent steps searched for a steady state by macro steps
+        self.history = deque(maxlen=2 * self.max_period + self.max_delay + 2)
+        #searches back off while the network is not in a steady state
+        self.macro_backoff = 0
+        self.macro_next = 0
+        for probe in self.probes:
+            probe.clear()
+
+    """
+    Record a variable of a compartment group ('spikes', 'voltage' or 'current') at every timestep.
+    """
+    def probe(self, group, variable='spikes'):
+        probe = Probe(variable, self.get_indices(group), self.batch_size)
+        self.probes.append(probe)
+        return probe
+
+    """
+    Schedule the input from the synapses of the given (batch element, source) pairs, lag steps after the step held
+    at the head of the buffer.
+    """
+    def _propagate(self, batch, sources, lag):
+        events = 0
+        for delay in self.delays:
+            indptr, targets, weights = self.synapses[delay]
+            synapses, lengths = gather_rows(indptr, sources)
+            if len(synapses):
+                slot = (self.head + lag + delay) % self.n_slots
+                flat_targets = np.repeat(batch, lengths) * self.n_compartments + targets[synapses]
+                np.add.at(self.ring[slot].reshape(-1), flat_targets, weights[synapses])
+                events += len(synapses)
+
+        self.counters['synaptic_events'] += events
+
+    """
+    Send spikes to the given ports of an input stub group. They arrive at the targets in the next timestep.
+    In a batched simulation the spikes go to every copy of the network, or with batch to the listed copies
+    (batch and ports are paired element-wise, so each copy can receive a different port).
+    """
+    def inject(self, stub, ports, batch=None):
+        ports = np.atleast_1d(ports)
+        if batch is None:
+            batch = np.repeat(np.arange(self.n_batch), len(ports))
+            ports = np.tile(ports, self.n_batch)
+        else:
+            batch, ports = np.broadcast_arrays(np.atleast_1d(batch), ports)
+
+        self._propagate(batch, self.get_indices(stub)[ports], 0)
+        self.interrupt()
+
+    #Mark the state as changed from outside the network (e.g. voltages written by a SNIP), ending any steady state
+    def interrupt(self):
+        self.history.clear()
+        #the shortest steady state can be found after its first two periods and the input in flight
+        self.macro_backoff = 0
+        self.macro_next = self.t + self.max_delay + 4
+
+    def _noise(self, stream, indices, counters):
+        noise = self.noise.draw(self.t, stream, counters) + self.noise_offset[indices]
+        if not self.fixed_point:
+            return noise * self.noise_scale[indices]
+        shift = self.noise_shift[indices]
+        return (noise << np.maximum(shift, 0)) >> np.maximum(-shift, 0)
+
+    """
+    Advance the network by a single timestep.
+    """
+    def step(self):
+        start = time.perf_counter()
+        events = self.counters['synaptic_events']
+        if self.jit:
+            n_spikes = self._step_kernel()
+        else:
+            n_spikes = self._step_numpy()
+        self.head = (self.head + 1) % self.n_slots
+
+        self.t += 1
+        self.counters['steps'] += 1
+        self.counters['spikes'] += n_spikes
+        if self.macro_step:
+            spikes = self.spikes[:, :self.n_compartments].copy()
+            self.history.append((hash(spikes.tobytes()), spikes, self.u.copy(), self.v.copy(), n_spikes,
+                                    self.counters['synaptic_events'] - events))
+        self.counters['time'] += time.perf_counter() - start
+        for probe in self.probes:
+            probe.record(self)
+
+    #Run a step with the compiled kernel, drawing its noise first. Returns the number of spikes
+    def _step_kernel(self):
+        if len(self.u_noisy):
+            u_noise = self._noise(NoiseGenerator.CURRENT, self.u_noisy, self.u_counters)
+        else:
+            u_noise = np.zeros((self.n_batch, 0), dtype=self.dtype)
+        if len(self.v_noisy):
+            self.v_noise[:, self.v_noisy] = self._noise(NoiseGenerator.VOLTAGE, self.v_noisy, self.v_counters)
+
+        n_spikes, n_events = kernels.step(self.u, self.v, self.spikes, self.ring, self.head, self.n_slots,
+                                            *self.kernel_args, self.u_noisy, u_noise, self.v_noise,
+                                            *self.kernel_joins, *self.kernel_synapses, self.kernel_joined)
+        self.counters['synaptic_events'] += int(n_events)
+        return int(n_spikes)
+
+    #Run a step with NumPy operations over each level. Returns the number of spikes
+    def _step_numpy(self):
+        u, v = self.u, self.v
+
+        #integrate the synaptic input arriving at this step
+        for (run, keep) in self.u_runs:
+            self._decay(u[:, run], keep)
+        u += self.ring[self.head]
+        self.ring[self.head] = 0
+        if len(self.u_noisy):
+            u[:, self.u_noisy] += self._noise(NoiseGenerator.CURRENT, self.u_noisy, self.u_counters)
+        #saturate (np.minimum/np.maximum have less overhead than np.clip on small arrays)
+        np.minimum(u, self.u_max, out=u)
+        np.maximum(u, self.u_min, out=u)
+
+        if len(self.v_noisy):
+            self.v_noise[:, self.v_noisy] = self._noise(NoiseGenerator.VOLTAGE, self.v_noisy, self.v_counters)
+
+        spikes = np.zeros(u.shape, dtype=bool)
+        joined = np.zeros(u.shape, dtype=bool)
+
+        for (i, (level, (add, join_or))) in enumerate(zip(self.levels, self.joins)):
+            v_level = v[:, level]
+            for (run, keep) in self.v_runs[i]:
+                self._decay(v[:, run], keep)
+            v_level += u[:, level] + self.bias[level] + self.v_noise[:, level]
+            np.minimum(v_level, self.v_max[level], out=v_level)
+            np.maximum(v_level, self.v_min[level], out=v_level)
+
+            fired = self.can_spike[level] & (v_level > self.vth[level])
+            v_level[fired & self.resets[level]] = 0
+            spikes[:, level] = fired | joined[:, level]
+
+            #join this level's compartments into their parents, which are updated next
+            if add is not None:
+                children, parents, unique = add
+                if unique:
+                    u[:, parents] += v[:, children]
+                else:
+                    np.add.at(u, (slice(None), parents), v[:, children])
+            if join_or is not None:
+                children, parents, unique = join_or
+                if unique:
+                    joined[:, parents] |= spikes[:, children]
+                else:
+                    np.logical_or.at(joined, (slice(None), parents), spikes[:, children])
+
+        #send out this step's spikes, which arrive from the next step on
+        self.spikes[:] = False
+        self.spikes[:, :self.n_compartments] = spikes
+        batch, sources = np.nonzero(spikes)
+        self._propagate(batch, sources, 1)
+        return len(sources)
+
+    """
+    Look for a steady state at the end of the recorded steps: the shortest period P over which the spikes, and with
+    them the synaptic input still in flight, and the currents repeat exactly while the voltages change by the same d
+    in the last two periods. Returns (P, d), or None.
+    """
+    def _find_period(self):
+        history = self.history
+        for P in range(1, self.max_period + 1):
+            #the steps since the last input must cover two periods and the input it left in the ring buffer
+            if len(history) < 2 * P + self.max_delay + 2:
+                break
+            window = range(max(P, self.max_delay + 1))
+            if any(history[-1 - j][0] != history[-1 - j - P][0] for j in window):
+                continue
+            if not all(np.array_equal(history[-1 - j][1], history[-1 - j - P][1]) for j in window):
+                continue
+            if not np.array_equal(history[-1][2], history[-1 - P][2]):
+                continue
+            d = history[-1][3] - history[-1 - P][3]
+            if np.array_equal(d, history[-1 - P][3] - history[-1 - 2 * P][3]):
+                return P, d
+        return None
+
+    """
+    Advance through a steady state by as many whole periods as the voltages allow, up to max_steps. Returns the
+    number of steps skipped (0 if the network is not in a steady state).
+    """
+    def _macro_step(self, max_steps):
+        found = self._find_period()
+        if found is None:
+            return 0
+        P, d = found
+        k = max_steps // P
+        period = [self.history[-1 - j] for j in range(P)]
+
+        batch, drifting = np.nonzero(d)
+        if len(drifting):
+            #drifting voltages must integrate linearly: no decay and no reset within the period
+            if np.any(self.v_keep[drifting] != 2**DECAY_BITS):
+                return 0
+            fired = np.stack([h[1][batch, drifting] for h in period])
+            if np.any(fired & self.resets[drifting]):
+                return 0
+
+            #each step's voltage must stay on the same side of the threshold and inside the saturation bounds
+            v = np.stack([h[3][batch, drifting] for h in period]).astype(np.int64)
+            lo = np.broadcast_to(self.v_min[drifting].astype(np.int64) + 1, v.shape)
+            hi = np.broadcast_to(self.v_max[drifting].astype(np.int64) - 1, v.shape)
+            can_spike = self.can_spike[drifting]
+            vth = self.vth[drifting].astype(np.int64)
+            lo = np.where(can_spike & (v > vth), np.maximum(lo, vth + 1), lo)
+            hi = np.where(can_spike & (v <= vth), np.minimum(hi, vth), hi)
+            if np.any(v < lo) or np.any(v > hi):
+                return 0
+            step = np.broadcast_to(d[batch, drifting].astype(np.int64), v.shape)
+            room = np.where(step > 0, (hi - v) // np.abs(step), (v - lo) // np.abs(step))
+            k = min(k, int(room.min()))
+        if k < 1:
+            return 0
+
+        n_steps = k * P
+        self.v += (k * d).astype(self.dtype)
+        #keep the synaptic input in flight at the same offsets from the head of the buffer
+        self.ring = np.roll(self.ring, n_steps % self.n_slots, axis=0)
+        self.head = (self.head + n_steps) % self.n_slots
+        self.t += n_steps
+        self.counters['steps'] += n_steps
+        self.counters['macro_steps'] += n_steps
+        self.counters['spikes'] += k * sum([h[4] for h in period])
+        self.counters['synaptic_events'] += k * sum([h[5] for h in period])
+        self.history.clear()
+        return n_steps
+
+    """
+    Advance the network by a number of timesteps, skipping through steady states with macro_step.
+    """
+    def run(self, n_steps):
+        end = self.t + n_steps
+        while self.t < end:
+            if self.macro_step and not self.probes and self.t >= self.macro_next:
+                start = time.perf_counter()
+                skipped = self._macro_step(end - self.t)
+                self.counters['time'] += time.perf_counter() - start
+                if skipped:
+                    self.macro_backoff = 0
+                    continue
+                self.macro_backoff = min(2 * self.macro_backoff + 1, self.max_period)
+                self.macro_next = self.t + self.macro_backoff
+            self.step()
+
+    #Drop the batch axis of a state array for simulations without a batch size
+    def _unbatch(self, values):
+        return values if self.batch_size is not None else values[0]
+
+    """
+    Return the current voltage, current or last spikes of a compartment group, with shape (batch, compartments) for
+    batched simulations.
+    """
+    def get_voltage(self, group):
+        return self._unbatch(self.v[:, self.get_indices(group)])
+
+    def get_current(self, group):
+        return self._unbatch(self.u[:, self.get_indices(group)])
+
+    def get_spikes(self, group):
+        return self._unbatch(self.spikes[:, self.get_indices(group)])
+
+    #Set the voltage of a compartment group (e.g. to reset counters as a SNIP would), in all or the listed copies
+    def set_voltage(self, group, value, batch=None):
+        batch = slice(None) if batch is None else batch
+        self.v[batch, self.get_indices(group)] = value
+        self.interrupt()
+
+    """
+    Return the throughput of the simulation since the last reset: timesteps, spikes and synaptic events (spikes
+    delivered through a synapse) per second of time spent stepping.
+    """
+    def get_throughput(self):
+        counters = dict(self.counters)
+        elapsed = counters['time']
+        counters['steps_per_second'] = counters['steps'] / elapsed if elapsed > 0 else 0.0
+        counters['spikes_per_second'] = counters['spikes'] / elapsed if elapsed > 0 else 0.0
+        counters['synaptic_events_per_second'] = counters['synaptic_events'] / elapsed if elapsed > 0 else 0.0
+        return counters
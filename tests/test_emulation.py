@@ -0,0 +1,135 @@
+"""
+Tests of the emulated board (emulation.py): short runs of the example agents on the CPU simulator.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, "bandit"), os.path.join(ROOT, "maze"), os.path.join(ROOT, "blackjack")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import time
+import numpy as np
+import pytest
+import graph
+from banditAgent import Bandit
+from gridAgent import GridAgent
+from blackjackAgent import BlackjackAgent
+
+AGENTS = {'bandit': lambda **kwargs: Bandit([0.2, 0.5, 0.8], **kwargs),
+            'maze': lambda **kwargs: GridAgent(**kwargs),
+            'blackjack': lambda **kwargs: BlackjackAgent(2, 200, **kwargs)}
+
+def make_agent(name, **kwargs):
+    return AGENTS[name](network=graph.GraphNet(), emulate=True, n_epochs=20, seed=11, **kwargs)
+
+@pytest.mark.parametrize('name', sorted(AGENTS))
+def test_readback_modes_match(name):
+    unchunked = make_agent(name)
+    expected = unchunked.run()
+    assert len(expected[0]) == 20
+
+    sync = make_agent(name, chunk_epochs=6)
+    records = np.concatenate([chunk.copy() for chunk in sync.run_stream()])
+    assert np.array_equal(records, unchunked.records)
+
+    asynchronous = make_agent(name, chunk_epochs=6, async_readback=True)
+    records = np.concatenate([chunk.copy() for chunk in asynchronous.run_stream()])
+    assert np.array_equal(records, unchunked.records)
+
+    for (a, b) in zip(asynchronous.split_records(records), expected):
+        assert np.array_equal(a, b)
+
+"""
+Channels sized for fewer epochs than a run holds make the SNIP stall until the host reads. Reading while the board runs
+asynchronously, the host drains them as the SNIP writes, and the run resumes after every stall.
+"""
+@pytest.mark.parametrize('name', ['bandit', 'blackjack'])
+def test_small_channels_stall_and_resume(name):
+    expected = make_agent(name)
+    expected.run()
+
+    agent = make_agent(name, chunk_epochs=3)
+    agent.init()
+    agent.started = True
+    agent.board.run(agent.l_epoch * agent.n_epochs, aSync=True)
+    #let the board fill the channels before reading each epoch's record as the SNIP sends it, as the channels cannot
+    #hold a whole run
+    time.sleep(0.5)
+    records = np.concatenate([agent.read_records(1) for i in range(agent.n_epochs)])
+    agent.board.finishRun()
+
+    assert np.array_equal(records, expected.records)
+    channels = agent.board.get_stats()['channels']
+    assert channels['dataChannel']['numElements'] < agent.n_epochs * agent.data_points
+    assert sum([c['stalls'] for c in channels.values()]) > 0
+    assert agent.board.time_step == agent.l_epoch * agent.n_epochs
+
+def test_full_channel_fails_without_a_reader():
+    #without an asynchronous run the host only reads after the run, so a SNIP writing to a full channel would block
+    #the board forever
+    agent = make_agent('bandit', chunk_epochs=3)
+    agent.init()
+    with pytest.raises(AssertionError, match="would block forever"):
+        agent.board.run(agent.l_epoch * agent.n_epochs)
+
+    #as does waiting for an asynchronous run to finish without reading
+    agent = make_agent('bandit', chunk_epochs=3)
+    agent.init()
+    agent.board.run(agent.l_epoch * agent.n_epochs, aSync=True)
+    with pytest.raises(AssertionError, match="would block forever"):
+        agent.board.finishRun()
+
+    #or reading a whole run from one channel while the SNIP waits to write to another
+    agent = make_agent('bandit', chunk_epochs=3)
+    agent.init()
+    agent.board.run(agent.l_epoch * agent.n_epochs, aSync=True)
+    with pytest.raises(AssertionError, match="would block forever"):
+        agent.read_records(agent.n_epochs)
+    with pytest.raises(AssertionError, match="would block forever"):
+        agent.board.finishRun()
+
+"""
+With async_readback, the host reads each chunk while the board runs the next one. Board time is stood in for by
+slowing every run (and every read) down, and each read of a chunk but the last has to overlap the next chunk's run.
+"""
+def test_async_reads_overlap_the_next_chunk():
+    agent = make_agent('bandit', chunk_epochs=4, async_readback=True)
+    agent.init()
+    agent.started = True
+    board = agent.board
+    runs = []
+    reads = []
+
+    run = board._run
+    def slow_run(numSteps):
+        start = time.perf_counter()
+        time.sleep(0.2)
+        run(numSteps)
+        runs.append((start, time.perf_counter()))
+    board._run = slow_run
+
+    get_data = agent.get_data
+    def slow_get_data(n_epochs, final=True, out=None):
+        start = time.perf_counter()
+        alive = board.thread is not None and board.thread.is_alive()
+        time.sleep(0.1)
+        get_data(n_epochs, final=final, out=out)
+        reads.append((start, time.perf_counter(), alive))
+    agent.get_data = slow_get_data
+
+    records = np.concatenate([chunk.copy() for chunk in agent.run_stream()])
+    expected = make_agent('bandit')
+    expected.run()
+    assert np.array_equal(records, expected.records)
+
+    assert len(runs) == len(reads) == 5
+    for (i, (start, end, alive)) in enumerate(reads[:-1]):
+        (run_start, run_end) = runs[i + 1]
+        assert alive and run_start < start and end < run_end
+    #the last chunk is read once the board has finished
+    assert not reads[-1][2] and reads[-1][0] > runs[-1][1]
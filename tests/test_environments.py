@@ -0,0 +1,169 @@
+"""
+Tests of the batched environments (environments.py) against the bandit, maze and blackjack SNIPs (management.c).
+The expected results of each case are worked out by hand from the C code, feeding the environments a scripted
+sequence of rand() values in place of their random streams.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+import numpy as np
+import pytest
+import environments
+from environments import BanditEnvironment, MazeEnvironment, BlackjackEnvironment, InstanceRNG
+
+#Stand-in for InstanceRNG which returns the given rand() values of a single instance in order. Draws masked out for
+#the instance do not advance its stream, and their values are not used
+class ScriptedRNG:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def rand(self, mask=None):
+        if mask is not None and not mask[0]:
+            return np.array([-1])
+        return np.array([self.values.pop(0)])
+
+    def randint(self, n, mask=None):
+        return self.rand(mask) % n
+
+#Set a single blackjack instance's state, drawing the given rand() values from then on
+def blackjack(player_sum, dealer_card, usable_ace, values, steps=1):
+    env = BlackjackEnvironment()
+    env.player_sum[:] = player_sum
+    env.dealer_card[:] = dealer_card
+    env.usable_ace[:] = usable_ace
+    env.steps[:] = steps
+    env.rng = ScriptedRNG(values)
+    return env
+
+#random_start draws the ace, player sum and dealer card in this order (usable_ace = 1, player_sum = 15, dealer_card = 7)
+RESTART = [1, 3, 6]
+
+BLACKJACK_CASES = [
+    #(player_sum, dealer_card, usable_ace, action, rand() values, reward, state after the step)
+    #hit: 13 + a 5 (rand() % 13 + 1 = 5), no restart
+    (13, 4, False, 0, [4], 0, (18, 4, False)),
+    #hit: a king counts as 10 (rand() % 13 + 1 = 13), a usable ace saves 20 + 10 by counting as 1
+    (20, 4, True, 0, [12], 0, (20, 4, False)),
+    #hit: 20 + 10 without a usable ace is bust and restarts
+    (20, 4, False, 0, [12] + RESTART, -1, (15, 7, True)),
+    #stick on 19: the dealer draws 10 + 8 = 18 and loses
+    (19, 10, False, 1, [7] + RESTART, 1, (15, 7, True)),
+    #stick on 18: the dealer draws 10 + 8 = 18, a draw
+    (18, 10, False, 1, [7] + RESTART, 2, (15, 7, True)),
+    #stick on 17: the dealer draws 10 + 8 = 18 and wins
+    (17, 10, False, 1, [7] + RESTART, -1, (15, 7, True)),
+    #stick: the dealer's ace counts as 11 (11 + 6 = 17, no more cards) and beats 16
+    (16, 1, False, 1, [5] + RESTART, -1, (15, 7, True)),
+    #stick: the dealer's ace saves 11 + 5 + 10 = 26 as 16, then 16 + 10 = 26 goes bust
+    (12, 1, False, 1, [4, 9, 12] + RESTART, 1, (15, 7, True)),
+]
+
+@pytest.mark.parametrize('case', BLACKJACK_CASES)
+def test_blackjack_step(case):
+    (player_sum, dealer_card, usable_ace, action, values, reward, state) = case
+    env = blackjack(player_sum, dealer_card, usable_ace, values)
+    assert env.step([action])[0] == reward
+    assert (env.player_sum[0], env.dealer_card[0], env.usable_ace[0]) == state
+    assert env.rng.values == []
+
+def test_blackjack_random_start():
+    env = blackjack(12, 1, False, [7, 17, 9])
+    env.random_start()
+    #usable_ace = 7 % 2, player_sum = 17 % 10 + 12, dealer_card = 9 % 10 + 1
+    assert (env.player_sum[0], env.dealer_card[0], env.usable_ace[0], env.steps[0]) == (19, 10, True, 0)
+
+@pytest.mark.parametrize('case', [((12, 1, False), 0), ((21, 1, False), 9), ((12, 10, False), 90),
+                                    ((15, 7, True), 3 + 60 + 100), ((21, 10, True), 199)])
+def test_blackjack_state_index(case):
+    (state, index) = case
+    env = blackjack(*state, [])
+    assert env.get_state()[0] == index
+
+def test_blackjack_step_counts_after_restart():
+    #as advance_state increments step after stick() or hit() have restarted the episode, the new episode starts at 1
+    env = blackjack(20, 4, False, [12] + RESTART, steps=3)
+    env.step([0])
+    assert env.steps[0] == 1 and not env.exploring[0]
+
+    env = blackjack(13, 4, False, [0], steps=3)
+    env.step([0])
+    assert env.steps[0] == 4
+
+"""
+A 3x3 maze with rectangular bounds (as GridAgent.set_valid_transitions) and a wall between (1, 0) and (1, 1).
+transitions[0, x, y] allows moving north from (x, y), transitions[1, x, y] moving east.
+"""
+def maze(location, values=(), steps=0, lifespan=8):
+    transitions = np.ones((2, 3, 3), dtype=int)
+    transitions[0, :, 2] = 0
+    transitions[1, 2, :] = 0
+    transitions[0, 1, 0] = 0
+    env = MazeEnvironment(transitions, reward_location=(2, 2), lifespan=lifespan)
+    env.location[:] = location
+    env.steps[:] = steps
+    env.rng = ScriptedRNG(values)
+    return env
+
+N, E, S, W = range(4)
+MAZE_CASES = [
+    #(location, action, rand() values, reward, location after the step, steps after the step)
+    ((1, 1), N, [], 0, (1, 2), 3),
+    ((1, 1), E, [], 0, (2, 1), 3),
+    ((1, 1), W, [], 0, (0, 1), 3),
+    #the wall north of (1, 0) blocks moving north from it and south into it
+    ((1, 0), N, [], 0, (1, 0), 3),
+    ((1, 1), S, [], 0, (1, 1), 3),
+    ((0, 1), S, [], 0, (0, 0), 3),
+    #the bounds block moving off every edge of the grid
+    ((0, 2), N, [], 0, (0, 2), 3),
+    ((2, 0), E, [], 0, (2, 0), 3),
+    ((0, 1), W, [], 0, (0, 1), 3),
+    ((1, 0), S, [], 0, (1, 0), 3),
+    #reaching the reward restarts at (rand() % 3, rand() % 3) with step 0
+    ((1, 2), E, [4, 5], 1, (1, 2), 0),
+]
+
+@pytest.mark.parametrize('case', MAZE_CASES)
+def test_maze_step(case):
+    (location, action, values, reward, after, steps) = case
+    env = maze(location, values, steps=2)
+    assert env.step([action])[0] == reward
+    assert tuple(env.location[0]) == after
+    assert env.steps[0] == steps
+    assert env.get_state()[0] == after[0] + 3 * after[1]
+
+def test_maze_lifespan():
+    #a move at step == LIFESPAN is punished and restarts, the step before it is not
+    env = maze((0, 0), [1, 1], steps=7, lifespan=8)
+    assert env.step([E])[0] == 0 and env.steps[0] == 8
+    assert env.step([N])[0] == -1
+    assert tuple(env.location[0]) == (1, 1) and env.steps[0] == 0 and env.exploring[0]
+
+@pytest.mark.parametrize('case', [(0, 1), (29, 1), (30, -1), (99, -1), (129, 1), (130, -1)])
+def test_bandit_reward(case):
+    #the arm pays out when rand() % 100 < its probability (30%)
+    (value, reward) = case
+    env = BanditEnvironment([10, 30, 90])
+    env.rng = ScriptedRNG([value])
+    assert env.step([1])[0] == reward
+
+def test_instance_streams_do_not_depend_on_batch():
+    single = InstanceRNG([7])
+    batch = InstanceRNG([5, 6, 7])
+    for i in range(5):
+        assert single.rand()[0] == batch.rand()[2]
+    values = InstanceRNG(np.arange(100)).rand()
+    assert np.all(values >= 0) and np.all(values <= environments.RAND_MAX)
+
+def test_masked_draws_only_advance_their_instances():
+    rng = InstanceRNG([1, 2])
+    first = rng.rand(np.array([True, False]))
+    second = rng.rand()
+    assert first[1] == second[1] and first[0] != second[0]
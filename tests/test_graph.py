@@ -0,0 +1,142 @@
+"""
+Tests of the graph IR (graph.py), materialized onto a minimal in-process backend.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, "bandit")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import types
+import numpy as np
+from scipy import sparse
+import pytest
+import graph
+import masks
+import prototypes
+from banditAgent import Bandit
+
+#Backend compartment (or input port) at index i of its group
+class Node:
+    def __init__(self, group, i):
+        self.group = group
+        self.index = i
+
+#Backend synapse connecting two compartments
+class Synapse:
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+
+#Backend connection group which creates a synapse for each non-zero of the connection mask, in row-major order as
+#nxsdk does (or column-major, to check that merged connections index synapses in whatever order they are created)
+class Connection:
+    def __init__(self, source, target, mask, column_major=False):
+        rows, cols = np.nonzero(sparse.coo_matrix(mask).toarray())
+        if column_major:
+            order = np.lexsort((rows, cols))
+            rows, cols = rows[order], cols[order]
+        self.synapses = [Synapse(source[c], target[r]) for (r, c) in zip(rows, cols)]
+
+    def __getitem__(self, i):
+        return self.synapses[i]
+
+class Group:
+    def __init__(self, size, column_major=False):
+        self.size = size
+        self.column_major = column_major
+        self.nodes = [Node(self, i) for i in range(size)]
+
+    def __getitem__(self, i):
+        return self.nodes[i]
+
+    def connect(self, target, prototype, connectionMask=None):
+        return Connection(self, target, connectionMask, self.column_major)
+
+class Net:
+    def __init__(self, column_major=False):
+        self.column_major = column_major
+
+    def createCompartmentGroup(self, size, prototype, prototypeMap=None):
+        return Group(size, self.column_major)
+
+backend = types.SimpleNamespace(NxNet=Net, CompartmentPrototype=lambda **kwargs: kwargs,
+                                ConnectionPrototype=lambda **kwargs: kwargs)
+
+#Build two connections with disjoint, interleaved masks which are merged into a single backend connection
+def make_merged(net):
+    proto = graph.CompartmentPrototype()
+    source = net.createCompartmentGroup(4, proto)
+    target = net.createCompartmentGroup(4, proto)
+    synproto = graph.ConnectionPrototype(weight=2)
+    first = source.connect(target, synproto, masks.IdentityMask(4))
+    second = source.connect(target, synproto, np.roll(np.eye(4), 1, axis=1))
+    third = source.connect(target, synproto, sparse.coo_matrix(([1, 1], ([0, 3], [2, 1])), shape=(4, 4)))
+    return [first, second, third]
+
+@pytest.mark.parametrize('column_major', [False, True])
+def test_merged_connections_index_their_own_synapses(column_major):
+    net = graph.GraphNet()
+    connections = make_merged(net)
+    net.materialize(Net(column_major), backend=backend)
+    assert len(net.connectionPlan) == 1 and all([c.backend is connections[0].backend for c in connections])
+
+    #every synapse a connection indexes joins the source and target nodes of one of its mask's entries
+    for connection in connections:
+        rows, cols = connection.mask.indices()
+        expected = set(zip(rows.tolist(), cols.tolist()))
+        found = set([(connection[i].dst.index, connection[i].src.index) for i in range(connection.numSynapses)])
+        assert found == expected
+
+def test_backend_creates_synapses_in_mask_order():
+    #the order the backend reports is the row-major order get_synapses falls back to
+    net = graph.GraphNet()
+    connections = make_merged(net)
+    net.materialize(Net(), backend=backend)
+    batch = net.connectionPlan[0]
+    rows, cols = graph.get_backend_order(connections[0].backend, batch)
+    expected = batch.mask.indices()
+    assert np.array_equal(rows, expected[0]) and np.array_equal(cols, expected[1])
+    for connection in connections:
+        assert np.array_equal(batch.get_synapses(connection), batch.get_synapses(connection, (rows, cols)))
+
+def test_backend_order_is_optional():
+    #synapses which do not expose their compartments leave get_synapses to assume the row-major order
+    batch = types.SimpleNamespace(numSynapses=2)
+    assert graph.get_backend_order([(0, 0), (1, 1)], batch) is None
+
+def test_agents_share_read_only_prototypes():
+    first = Bandit([0.2, 0.8], network=graph.GraphNet())
+    second = Bandit([0.2, 0.8], network=graph.GraphNet())
+    soma = first.decoder.prototypes['c_prototypes']['somaProto']
+    #nodes of one agent and of identical agents share the interned prototypes
+    assert soma is first.action_buffer.prototypes['c_prototypes']['somaProto']
+    assert soma is second.decoder.prototypes['c_prototypes']['somaProto']
+    assert isinstance(soma, graph.CompartmentPrototype)
+
+    #which cannot be changed, so neither agent can alter the other's network
+    with pytest.raises(AssertionError):
+        soma.vThMant = 1
+    with pytest.raises(AssertionError):
+        soma.addDendrite([graph.CompartmentPrototype()], graph.COMPARTMENT_JOIN_OPERATION.OR)
+    assert soma.vThMant == 255
+
+    #prototypes added by a node go to its own copy of the set, and copies of shared prototypes are writable
+    assert 'activation_conn' in first.decoder.prototypes['s_prototypes']
+    assert 'activation_conn' not in second.action_buffer.prototypes['s_prototypes']
+    changed = soma.copy(vThMant=1)
+    changed.biasMant = 2
+    assert (changed.vThMant, changed.biasMant, soma.biasMant) == (1, 2, 0)
+
+def test_prototype_cache_can_be_scoped():
+    cache = {}
+    scoped = prototypes.create_prototypes(backend=graph, cache=cache)
+    shared = prototypes.create_prototypes(backend=graph)
+    assert len(cache) == 1
+    assert scoped['c_prototypes']['somaProto'] is not shared['c_prototypes']['somaProto']
+    assert scoped['c_prototypes']['somaProto'] is prototypes.create_prototypes(backend=graph, cache=cache)['c_prototypes']['somaProto']
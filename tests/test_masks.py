@@ -0,0 +1,210 @@
+"""
+Tests of the connection mask descriptors (masks.py) and the mask construction and caching in primitives.py against
+the dense masks the connectors originally built.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+import numpy as np
+from scipy import sparse
+import pytest
+import masks
+import primitives
+from masks import IdentityMask, FullMask, AxisMask, BroadcastMask, SparseMask
+from primitives import MaskCache
+
+#Dense (n_target, n_source) mask connecting the matching slices of two tensors, as built by dense_along_axis originally
+def baseline_axis_mask(source_shape, source_axis, target_shape, target_axis):
+    mask = np.zeros((np.prod(source_shape), np.prod(target_shape)), dtype=int)
+
+    for i in range(source_shape[source_axis]):
+        source_tensor = np.zeros(source_shape)
+        target_tensor = np.zeros(target_shape)
+
+        source_fill = [slice(None)] * len(source_shape)
+        source_fill[source_axis] = i
+        source_tensor[tuple(source_fill)] = 1
+
+        target_fill = [slice(None)] * len(target_shape)
+        target_fill[target_axis] = i
+        target_tensor[tuple(target_fill)] = 1
+
+        mask += np.tensordot(source_tensor, target_tensor, axes=0).reshape(mask.shape).astype(int)
+
+    return mask.transpose()
+
+#Dense (n, n_proj) adjacency of each tensor element to its projection along an axis, as built by get_adjacency originally
+def baseline_adjacency(shape, axis):
+    n = np.prod(shape)
+    new_shape = np.delete(np.array(shape), axis)
+    adjacency = np.zeros((n, np.prod(new_shape)), dtype=int)
+
+    for i, coords in enumerate(zip(*np.unravel_index(np.arange(n), shape))):
+        projected = tuple(c for (j, c) in enumerate(coords) if j != axis)
+        adjacency[i, np.ravel_multi_index(projected, new_shape) if len(projected) > 0 else 0] = 1
+
+    return adjacency
+
+AXIS_CASES = [
+    #(source_shape, source_axis, target_shape, target_axis)
+    ((3,), 0, (3,), 0),
+    ((2, 3), 0, (2, 4), 0),
+    ((2, 3), 1, (3, 4), 0),
+    ((4, 2, 3), 1, (2, 5), 0),
+    ((2, 3, 4), 2, (3, 4, 2), 1),
+]
+
+@pytest.mark.parametrize('case', AXIS_CASES)
+def test_axis_pairs_match_baseline(case):
+    expected = baseline_axis_mask(*case)
+    n_target, n_source = expected.shape
+
+    rows, cols = masks.get_axis_pairs(*case)
+    assert len(rows) == expected.sum()
+    assert np.array_equal(masks.sparse_mask(rows, cols, (n_target, n_source)).toarray(), expected)
+
+    mask = AxisMask(case[0], case[1], case[2], case[3])
+    assert np.array_equal(mask.to_dense(), expected)
+    assert mask.nnz == expected.sum()
+    assert np.array_equal(mask.fan_in(), expected.sum(axis=1))
+    assert np.array_equal(mask.fan_out(), expected.sum(axis=0))
+
+ADJACENCY_CASES = [((4,), 0), ((2, 3), 0), ((2, 3), 1), ((2, 3, 4), 0), ((2, 3, 4), 1), ((2, 3, 4), 2)]
+
+@pytest.mark.parametrize('case', ADJACENCY_CASES)
+def test_adjacency_outputs_match_baseline(case):
+    (shape, axis) = case
+    expected = baseline_adjacency(shape, axis)
+
+    dense = primitives.get_adjacency(shape, axis)
+    assert isinstance(dense, np.ndarray) and np.array_equal(dense, expected)
+
+    matrix = primitives.get_adjacency(shape, axis, output="sparse")
+    assert sparse.issparse(matrix) and np.array_equal(matrix.toarray(), expected)
+
+    rows, cols = primitives.get_adjacency(shape, axis, output="indices")
+    from_indices = np.zeros_like(expected)
+    from_indices[rows, cols] = 1
+    assert len(rows) == expected.sum() and np.array_equal(from_indices, expected)
+
+    with pytest.raises(AssertionError):
+        primitives.get_adjacency(shape, axis, output="list")
+
+@pytest.mark.parametrize('case', ADJACENCY_CASES)
+def test_broadcast_masks_match_baseline(case):
+    (shape, axis) = case
+    expected = baseline_adjacency(shape, axis)
+
+    #expand_along_axis used the adjacency, project_along_axis its transpose
+    assert np.array_equal(BroadcastMask(shape, axis, expand=True).to_dense(), expected)
+    assert np.array_equal(BroadcastMask(shape, axis, expand=False).to_dense(), expected.transpose())
+
+def test_mask_cache_evicts_least_recently_used():
+    cache = MaskCache(maxsize=2)
+    built = []
+    def build(key):
+        return lambda: built.append(key) or key
+
+    cache.get('a', build('a'))
+    cache.get('b', build('b'))
+    #using 'a' makes 'b' the least recently used, which 'c' then evicts
+    assert cache.get('a', build('a')) == 'a'
+    cache.get('c', build('c'))
+    assert list(cache.masks) == ['a', 'c']
+    assert built == ['a', 'b', 'c']
+    assert cache.info() == {'hits': 1, 'misses': 3, 'size': 2, 'maxsize': 2}
+
+    #'b' is rebuilt, evicting 'a'
+    cache.get('b', build('b'))
+    assert built == ['a', 'b', 'c', 'b'] and list(cache.masks) == ['c', 'b']
+
+    cache.resize(1)
+    assert list(cache.masks) == ['b']
+    cache.clear()
+    assert cache.info() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 1}
+
+def test_mask_cache_can_be_disabled():
+    cache = MaskCache(maxsize=0)
+    assert cache.get('a', lambda: 1) == 1 and cache.get('a', lambda: 2) == 2
+    assert cache.info() == {'hits': 0, 'misses': 2, 'size': 0, 'maxsize': 0}
+
+MASKS = [
+    IdentityMask(5),
+    FullMask(3, 4),
+    AxisMask((2, 3), 1, (3, 4), 0),
+    BroadcastMask((2, 3, 4), 1, expand=True),
+    BroadcastMask((2, 3, 4), 1, expand=False),
+    SparseMask([0, 2, 2, 3], [1, 0, 3, 1], (4, 5)),
+]
+
+@pytest.mark.parametrize('mask', MASKS, ids=lambda mask: repr(mask))
+def test_to_backend_round_trips(mask):
+    expected = np.zeros(mask.shape, dtype=int)
+    rows, cols = mask.indices()
+    expected[rows, cols] = 1
+
+    if isinstance(mask, FullMask):
+        #all-to-all connects without a mask
+        assert masks.to_backend(mask) is None and masks.to_backend(mask, dense=True) is None
+        assert np.array_equal(mask.to_dense(), np.ones(mask.shape))
+    else:
+        matrix = masks.to_backend(mask)
+        dense = masks.to_backend(mask, dense=True)
+        assert sparse.issparse(matrix) and isinstance(dense, np.ndarray)
+        assert np.array_equal(matrix.toarray(), expected) and np.array_equal(dense, expected)
+
+        #either matrix rebuilds the same connectivity as an explicit descriptor
+        assert SparseMask.from_matrix(matrix) == SparseMask.from_matrix(dense)
+        assert np.array_equal(SparseMask.from_matrix(matrix).to_dense(), expected)
+
+    assert mask.nnz == expected.sum()
+    assert np.array_equal(mask.fan_in(), expected.sum(axis=1))
+    assert np.array_equal(mask.fan_out(), expected.sum(axis=0))
+
+def test_shared_matrices_are_read_only():
+    matrix = AxisMask((2, 3), 1, (3, 4), 0).to_sparse()
+    with pytest.raises(ValueError):
+        matrix.data[0] = 0
+
+def test_equal_descriptors_compare_equal():
+    assert IdentityMask(4) == IdentityMask(4) and IdentityMask(4) != IdentityMask(5)
+    assert SparseMask.from_matrix(np.eye(3)) == SparseMask([0, 1, 2], [0, 1, 2], (3, 3))
+    assert len({BroadcastMask((2, 3), 0), BroadcastMask((2, 3), 0), BroadcastMask((2, 3), 0, expand=False)}) == 2
+
+#Backend group recording the connection mask it is connected with
+class Source:
+    def __init__(self, numNodes, **capabilities):
+        self.numNodes = numNodes
+        self.__dict__.update(capabilities)
+
+    def connect(self, target, prototype, connectionMask=None):
+        return connectionMask
+
+@pytest.mark.parametrize('capabilities, kind', [({}, sparse.spmatrix), ({'requiresDenseMasks': True}, np.ndarray),
+                                                ({'acceptsMaskDescriptors': True}, masks.ConnectionMask)])
+def test_connect_mask_converts_for_the_backend(capabilities, kind):
+    primitives.clear_mask_cache()
+    source = Source(4, **capabilities)
+    connected = primitives.connect_one_to_one(source, Source(4), None)
+    assert isinstance(connected, kind)
+    assert np.array_equal(masks.to_backend(connected, dense=True) if kind is masks.ConnectionMask
+                            else sparse.coo_matrix(connected).toarray(), np.eye(4))
+
+    #all-to-all connections are made without a mask unless the backend takes descriptors
+    full = primitives.connect_full(source, Source(3), None)
+    assert isinstance(full, FullMask) if kind is masks.ConnectionMask else full is None
+
+def test_connectors_share_cached_masks():
+    primitives.clear_mask_cache()
+    source = Source(6, acceptsMaskDescriptors=True)
+    first = primitives.project_along_axis(source, (2, 3), 1, Source(2), (2,), None)
+    second = primitives.project_along_axis(source, (2, 3), 1, Source(2), (2,), None)
+    assert first is second
+    assert primitives.get_mask_cache_info()['hits'] == 1
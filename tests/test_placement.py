@@ -0,0 +1,126 @@
+"""
+Tests of the logical-core placement planner (placement.py): the planned cores keep noise classes apart and stay
+within the core limits once oversize groups are split, and the planned cut is no worse than packing in creation order.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, "blackjack")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import numpy as np
+import pytest
+import graph
+import placement
+import resources
+from blackjackAgent import BlackjackAgent
+
+#the trackers of agents with several replicates are noisy
+def make_agent():
+    return BlackjackAgent(3, 4, n_replicates=2, network=graph.GraphNet())
+
+LIMITS = [None, {'compartments': 64}, {'compartments': 128, 'synapses': 2000}]
+
+#Return the core of every node of each group (by group id) in a placement report
+def get_node_cores(network, report):
+    return {g.id: np.broadcast_to(report['group_cores'][g.id], g.size) for g in network.compartmentGroups}
+
+#Return the noise class of every group, as the planner sees it through the prototype of its neuron's soma
+def get_noise_classes(network):
+    noise = {}
+    for group in network.compartmentGroups:
+        soma = group.neuron.soma if group.neuron is not None else group
+        noise[group.id] = placement.get_noise_class(soma.prototype)
+    return noise
+
+@pytest.mark.parametrize('limits', LIMITS)
+def test_cores_do_not_mix_noise_classes(limits):
+    agent = make_agent()
+    report = placement.plan_placement(agent, limits=limits, granularity=16)
+    network = agent.network
+    noise = get_noise_classes(network)
+    assert None in noise.values() and len(set(noise.values())) > 1
+
+    assert report['unplaced'] == []
+    core_noise = {}
+    for (group_id, cores) in get_node_cores(network, report).items():
+        for core in np.unique(cores):
+            core_noise.setdefault(int(core), set()).add(noise[group_id])
+    assert all([len(classes) == 1 for classes in core_noise.values()])
+    assert all([core_noise[c['id']] == set([c['noise']]) for c in report['cores']])
+
+@pytest.mark.parametrize('limits', LIMITS)
+def test_cores_hold_within_limits(limits):
+    agent = make_agent()
+    report = placement.plan_placement(agent, limits=limits, granularity=16)
+    network = agent.network
+    limits = dict(resources.CORE_LIMITS, **(limits or {}))
+    node_cores = get_node_cores(network, report)
+
+    #count each core's usage from the planned core of every node, as resources.get_group_usage counts a group's
+    usage = {c['id']: {'compartments': 0, 'synapses': 0, 'input_axons': 0, 'output_axons': 0} for c in report['cores']}
+    for group in network.compartmentGroups:
+        for (core, n) in zip(*np.unique(node_cores[group.id], return_counts=True)):
+            usage[int(core)]['compartments'] += int(n)
+
+    for connection in network.connectionGroups:
+        rows, cols = connection.mask.indices()
+        target_cores = node_cores[connection.target.id][rows]
+        for core in np.unique(target_cores):
+            usage[int(core)]['synapses'] += int(np.count_nonzero(target_cores == core))
+            usage[int(core)]['input_axons'] += len(np.unique(cols[target_cores == core]))
+        if isinstance(connection.source, graph.CompartmentGroup):
+            source_cores = node_cores[connection.source.id][cols]
+            for core in np.unique(source_cores):
+                usage[int(core)]['output_axons'] += len(np.unique(cols[source_cores == core]))
+
+    for core in report['cores']:
+        counted = usage[core['id']]
+        assert counted == {key: core[key] for key in counted}
+        assert all([counted[key] <= limits[key] for key in counted])
+
+    assert sum([u['compartments'] for u in usage.values()]) == network.numCompartments
+
+def test_oversize_groups_are_split():
+    agent = make_agent()
+    report = placement.plan_placement(agent, limits={'compartments': 64}, granularity=16)
+    split = [g for g in agent.network.compartmentGroups if np.ndim(report['group_cores'][g.id]) > 0]
+    #only groups (or neurons, whose compartments are placed together) larger than a core are split
+    def unit_size(g):
+        return g.size * (len(g.neuron.compartmentGroups) if g.neuron is not None else 1)
+    assert len(split) > 0 and all([unit_size(g) > 64 for g in split])
+
+    #the split groups are materialized with one prototype per core
+    placement.apply_placement(agent, report)
+    assert all([np.array_equal(g.logicalCore, report['group_cores'][g.id]) for g in split])
+
+"""
+Pack the planner's units onto cores in creation order, starting a new core whenever a unit does not fit or has
+another noise class. Returns the number of synapses which cross between cores.
+"""
+def get_naive_cut(network, limits, granularity):
+    units, unplaced, node_unit, indices = placement.get_units(network, {}, limits, granularity)
+    assert unplaced == []
+
+    assignment = {}
+    core = None
+    for unit in units:
+        if core is None or core['noise'] != unit['noise'] or not placement.fits(core, unit, limits):
+            core = placement.new_core(0 if core is None else core['id'] + 1, unit['noise'])
+        placement.add_unit(core, unit, assignment)
+
+    counts = placement.get_unit_synapses(network, node_unit, indices)
+    return sum([count for ((i, j), count) in counts.items() if assignment[i] != assignment[j]])
+
+@pytest.mark.parametrize('limits', LIMITS)
+def test_cut_no_worse_than_naive_packing(limits):
+    agent = make_agent()
+    report = placement.plan_placement(agent, limits=limits, granularity=16)
+    naive = get_naive_cut(agent.network, dict(resources.CORE_LIMITS, **(limits or {})), 16)
+    assert report['cut_synapses'] <= naive
+    assert report['total_synapses'] > report['cut_synapses']
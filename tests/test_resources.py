@@ -0,0 +1,98 @@
+"""
+Tests of the static resource estimates (resources.py) on a small network counted by hand, and on a shipped agent
+checked against the counts of the network it is materialized as.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, "bandit"), os.path.join(ROOT, "benchmarks")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import numpy as np
+import pytest
+import graph
+import nxstub
+import resources
+from primitives import OrNode, InvNode, connect_full, connect_one_to_one, dense_along_axis
+from banditAgent import Bandit
+
+"""
+Two blocks, a (a 2x3 OrNode) and b (a 3 element InvNode), and an input stub of 6 ports:
+    stub -> a  one-to-one:            6 synapses, 6 axons
+    a -> b     dense along a's axis 1: each of b's 3 compartments receives from a column of 2, 6 synapses, 6 axons
+    b -> a     all-to-all:            18 synapses, 3 axons
+"""
+class Circuit:
+    def __init__(self):
+        self.network = graph.GraphNet()
+        self.a = OrNode(self.network, (2, 3))
+        self.b = InvNode(self.network, (3,))
+        self.stub = self.network.createInputStubGroup(size=6)
+
+        synproto = self.a.get_synproto()
+        self.connections = {'stub_a': connect_one_to_one(self.stub, self.a.get_inputs(), synproto),
+                            'a_b': dense_along_axis(self.a.get_outputs(), (2, 3), 1, self.b.get_inputs(), (3,), 0, synproto),
+                            'b_a': connect_full(self.b.get_outputs(), self.a.get_inputs(), synproto)}
+
+def test_circuit_counts():
+    report = resources.estimate_resources(Circuit())
+
+    assert report['totals'] == {'compartments': 9, 'synapses': 30, 'input_axons': 15, 'stub_ports': 6,
+                                'groups': 2, 'connections': 3, 'cores': 1}
+    assert report['blocks'] == {'a': {'compartments': 6, 'groups': 1, 'synapses': 24, 'input_axons': 9, 'output_axons': 6},
+                                'b': {'compartments': 3, 'groups': 1, 'synapses': 6, 'input_axons': 6, 'output_axons': 3}}
+    assert report['cores'] == [{'compartments': 9, 'synapses': 30, 'input_axons': 15, 'output_axons': 9}]
+    assert report['fits']
+
+    a_b = report['connections']['a_b']
+    assert (a_b['synapses'], a_b['max_fan_in'], a_b['max_fan_out'], a_b['axons']) == (6, 2, 1, 6)
+    b_a = report['connections']['b_a']
+    assert (b_a['synapses'], b_a['max_fan_in'], b_a['max_fan_out'], b_a['axons']) == (18, 3, 6, 3)
+
+def test_circuit_packing():
+    #a (4 synapses per compartment) is split 4 + 2, and b (2 per compartment) fills the second core then starts a third
+    report = resources.estimate_resources(Circuit(), limits={'compartments': 4})
+    assert [(c['compartments'], c['synapses']) for c in report['cores']] == [(4, 16), (4, 12), (1, 2)]
+
+    #with 8 synapses per core, each core holds 2 of a's compartments or 4 of b's
+    report = resources.estimate_resources(Circuit(), limits={'synapses': 8})
+    assert [(c['compartments'], c['synapses']) for c in report['cores']] == [(2, 8), (2, 8), (2, 8), (3, 6)]
+
+    report = resources.estimate_resources(Circuit(), limits={'compartments': 1}, n_chips=0)
+    assert report['totals']['cores'] == 9 and not report['fits']
+
+def test_oversize_compartments_get_their_own_core():
+    #each compartment needs 4 synapses, more than a core holds
+    cores = resources.pack_cores([{'compartments': 2, 'synapses': 8, 'input_axons': 0, 'output_axons': 0}],
+                                    dict(resources.CORE_LIMITS, synapses=3))
+    assert [c['compartments'] for c in cores] == [1, 1]
+
+def test_bandit_counts_match_backend():
+    agent = Bandit([0.2, 0.8], network=graph.GraphNet())
+    report = resources.estimate_resources(agent)
+    net = agent.network.materialize(backend=nxstub)
+
+    totals = report['totals']
+    assert net.numCompartments > 0 and net.numSynapses > 0
+    assert totals['compartments'] == net.numCompartments
+    assert totals['synapses'] == net.numSynapses
+    assert totals['stub_ports'] == sum([s.size for s in agent.network.stubGroups])
+    #the blocks and the cores each account for every compartment and synapse
+    assert sum([b['compartments'] for b in report['blocks'].values()]) == net.numCompartments
+    assert sum([b['synapses'] for b in report['blocks'].values()]) == net.numSynapses
+    assert sum([c['compartments'] for c in report['cores']]) == net.numCompartments
+
+    #the agent fits in a single core, and is split evenly when only 16 compartments fit in each
+    assert totals['cores'] == 1
+    assert resources.estimate_resources(agent, limits={'compartments': 16})['totals']['cores'] == int(np.ceil(net.numCompartments / 16))
+
+def test_estimate_agent_matches_built_agent():
+    report = resources.estimate_agent(2, 3, n_replicates=2)
+    agent = resources.EstimateAgent(2, 3, n_replicates=2, network=graph.GraphNet())
+    net = agent.network.materialize(backend=nxstub)
+    assert (report['totals']['compartments'], report['totals']['synapses']) == (net.numCompartments, net.numSynapses)
@@ -0,0 +1,182 @@
+"""
+Tests of the CPU simulator (simulator.py), run on the networks of the example agents built as a graph IR.
+
+Usage (from the repository root):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [ROOT, os.path.join(ROOT, "bandit"), os.path.join(ROOT, "blackjack")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import functools
+import numpy as np
+import pytest
+import graph
+import emulation
+import kernels
+import simulator
+from banditAgent import Bandit
+from blackjackAgent import BlackjackAgent
+
+"""
+Drive a simulator whose copies are the given copies of a batch through a few epochs of input, each copy seeing its
+own state, action and feedback. Returns the voltages and currents (with their batch axis) after every epoch.
+"""
+def drive_copies(sim, agent, copies, n_epochs=4, epoch=48):
+    copies = np.asarray(copies)
+    batch = np.arange(len(copies))
+    states = []
+    for i in range(n_epochs):
+        sim.inject(agent.stubs['state'], (i + copies) % agent.n_states, batch=batch)
+        sim.inject(agent.stubs['action'], (i + copies) % agent.n_actions, batch=batch)
+        sim.run(epoch // 2)
+        rewarded = (i + copies) % 2 == 0
+        sim.inject(agent.stubs['reward'], np.zeros(np.sum(rewarded), dtype=int), batch=batch[rewarded])
+        sim.inject(agent.stubs['punishment'], np.zeros(np.sum(~rewarded), dtype=int), batch=batch[~rewarded])
+        sim.run(epoch // 2)
+        states.append((sim.v.copy(), sim.u.copy()))
+    return states
+
+#A small noisy network (the replicated trackers of a MultiCortex), so the tests also cover the noise of each copy
+def make_agent():
+    return BlackjackAgent(3, 4, network=graph.GraphNet(), n_replicates=2)
+
+#jit=True runs the compiled kernel, which falls back to the NumPy step when numba is not installed
+JIT = [False, pytest.param(True, marks=pytest.mark.skipif(not kernels.HAVE_NUMBA, reason="numba is not installed"))]
+
+@pytest.mark.parametrize('jit', JIT)
+def test_unbatched_matches_first_copy(jit):
+    agent = make_agent()
+    single = simulator.Simulator(agent.network, seed=3, jit=jit)
+    batched = simulator.Simulator(agent.network, seed=3, batch_size=3, jit=jit)
+
+    for (a, b) in zip(drive_copies(single, agent, [0]), drive_copies(batched, agent, [0, 1, 2])):
+        assert np.array_equal(a[0][0], b[0][0]) and np.array_equal(a[1][0], b[1][0])
+    #the copies see different inputs and noise
+    assert not np.array_equal(batched.v[0], batched.v[1])
+
+@pytest.mark.parametrize('jit', JIT)
+def test_batch_split_matches_full_batch(jit):
+    agent = make_agent()
+    full = simulator.Simulator(agent.network, seed=5, batch_size=4, jit=jit)
+    low = simulator.Simulator(agent.network, seed=5, batch_size=1, jit=jit)
+    high = simulator.Simulator(agent.network, seed=5, batch_size=3, batch_offset=1, jit=jit)
+
+    split = zip(drive_copies(low, agent, [0]), drive_copies(high, agent, [1, 2, 3]))
+    for (a, (b, c)) in zip(drive_copies(full, agent, [0, 1, 2, 3]), split):
+        assert np.array_equal(a[0], np.concatenate([b[0], c[0]]))
+        assert np.array_equal(a[1], np.concatenate([b[1], c[1]]))
+
+"""
+The kernel's results must equal the NumPy step's. Without numba the kernel is run as plain Python, which is slow but
+follows the same code.
+"""
+def test_kernel_matches_numpy_step(monkeypatch):
+    agent = make_agent()
+    stepped = simulator.Simulator(agent.network, seed=7, batch_size=2, jit=False)
+    monkeypatch.setattr(kernels, 'HAVE_NUMBA', True)
+    kernel = simulator.Simulator(agent.network, seed=7, batch_size=2, jit=True)
+    assert kernel.jit and not stepped.jit
+
+    for (a, b) in zip(drive_copies(stepped, agent, [0, 1], n_epochs=2), drive_copies(kernel, agent, [0, 1], n_epochs=2)):
+        assert np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+    assert kernel.counters['spikes'] == stepped.counters['spikes'] > 0
+    assert kernel.counters['synaptic_events'] == stepped.counters['synaptic_events']
+
+"""
+Drive a simulator through a few epochs of input: every epoch presents a state and an action and ends with a reward or
+a punishment, then lets the network settle. Returns the voltages and currents at the end of every epoch.
+"""
+def drive(sim, agent, n_epochs=6, epoch=64):
+    states = []
+    for i in range(n_epochs):
+        sim.inject(agent.stubs['state'], i % agent.n_states)
+        sim.inject(agent.stubs['action'], i % agent.n_actions)
+        sim.run(epoch // 2)
+        sim.inject(agent.stubs['reward' if i % 3 else 'punishment'], 0)
+        sim.run(epoch // 2)
+        states.append((sim.v.copy(), sim.u.copy()))
+    return states
+
+def test_macro_step_matches_stepping():
+    agent = Bandit([0.2, 0.5, 0.8], network=graph.GraphNet())
+    stepped = simulator.Simulator(agent.network, macro_step=False)
+    macro = simulator.Simulator(agent.network, macro_step=True)
+    assert macro.macro_step
+
+    for (a, b) in zip(drive(stepped, agent), drive(macro, agent)):
+        assert np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+    assert macro.counters['macro_steps'] > 0
+    assert macro.counters['steps'] == stepped.counters['steps']
+    assert macro.counters['spikes'] == stepped.counters['spikes']
+    assert macro.counters['synaptic_events'] == stepped.counters['synaptic_events']
+
+def test_macro_step_disabled_with_noise():
+    agent = Bandit([0.2, 0.5, 0.8], network=graph.GraphNet(), n_replicates=2)
+    assert not simulator.Simulator(agent.network, macro_step=True).macro_step
+
+def test_emulated_runs_match_with_and_without_macro_step(monkeypatch):
+    compile = emulation.compile
+    results = []
+    for macro_step in [True, False]:
+        monkeypatch.setattr(emulation, 'compile', functools.partial(compile, macro_step=macro_step))
+        agent = BlackjackAgent(2, 200, network=graph.GraphNet(), emulate=True, n_epochs=30, seed=1)
+        results.append([np.asarray(x) for x in agent.run()])
+        assert agent.simulator.macro_step == macro_step
+
+    for (a, b) in zip(*results):
+        assert np.array_equal(a, b)
+
+"""
+Build a single compartment driven by an input stub through one synapse, and a simulator for it.
+"""
+def single_compartment(weight, weightExponent=0, **kwargs):
+    net = graph.GraphNet()
+    stub = net.createInputStubGroup(1)
+    group = net.createCompartmentGroup(1, graph.CompartmentPrototype(**kwargs))
+    stub.connect(group, graph.ConnectionPrototype(weight=weight, weightExponent=weightExponent))
+    return simulator.Simulator(net, jit=False), stub, group
+
+#Run single steps, returning (u, v, spiked) after each
+def trace(sim, group, n_steps):
+    states = []
+    for i in range(n_steps):
+        sim.run(1)
+        states.append((int(sim.get_current(group)[0]), int(sim.get_voltage(group)[0]), bool(sim.get_spikes(group)[0])))
+    return states
+
+@pytest.mark.parametrize('case', [(5, [320, 319, 318, 317]), (-5, [-320, -319, -318, -317])])
+def test_fixed_point_current_decay_truncates_toward_zero(case):
+    #u keeps 4095/4096 of itself each step: 320 * 4095 / 4096 = 319.92 -> 319, 319 * 4095 / 4096 = 318.92 -> 318, ...
+    #negative currents truncate toward zero too (-319, not the floor -320). v keeps nothing, so it equals u
+    (weight, currents) = case
+    sim, stub, group = single_compartment(weight, compartmentCurrentDecay=1, compartmentVoltageDecay=4096,
+                                            thresholdBehavior=3)
+    sim.inject(stub, 0)
+    assert trace(sim, group, 4) == [(u, u, False) for u in currents]
+
+def test_fixed_point_voltage_decay_and_threshold():
+    #u = 100 * 2^6 = 6400 for one step (current decay 4096 keeps nothing). v keeps 2048/4096 per step and spikes
+    #when it exceeds vThMant * 2^6 = 6400, which it only does with a second input: 3200 + 6400 = 9600
+    sim, stub, group = single_compartment(100, compartmentCurrentDecay=4096, compartmentVoltageDecay=2048, vThMant=100)
+    sim.inject(stub, 0)
+    states = trace(sim, group, 2)
+    sim.inject(stub, 0)
+    states += trace(sim, group, 2)
+    #v equal to the threshold does not spike; a spike resets v to 0 (thresholdBehavior 0)
+    assert states == [(6400, 6400, False), (0, 3200, False), (6400, 0, True), (0, 0, False)]
+
+def test_fixed_point_saturation():
+    #five spikes of 255 * 2^(6 + 7) = 2088960 add up to 10444800, which saturates the current at 2^23 - 1; the
+    #voltage saturates at 2^vMaxExp - 1 = 2^20 - 1, and at -2^vMinExp = -2^20 when the input is negative
+    sim, stub, group = single_compartment(255, 7, compartmentCurrentDecay=0, vMaxExp=20, vMinExp=20, thresholdBehavior=3)
+    sim.inject(stub, [0] * 5)
+    assert trace(sim, group, 2) == [(2**23 - 1, 2**20 - 1, False)] * 2
+
+    sim, stub, group = single_compartment(-255, 7, compartmentCurrentDecay=0, vMaxExp=20, vMinExp=20, thresholdBehavior=3)
+    sim.inject(stub, [0] * 5)
+    assert trace(sim, group, 2) == [(-2**23, -2**20, False)] * 2